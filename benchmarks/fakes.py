@@ -0,0 +1,81 @@
+import itertools
+import time
+
+user_ids = itertools.count(1000)
+
+
+class FakeUser:
+    def __init__(self):
+        self.id = next(user_ids)
+        self.name = f"bench-{self.id}"
+
+
+class FakeMessage:
+    def __init__(self, content=None, embed=None, file=None):
+        self.content = content
+        self.embed = embed
+        self.file = file
+        self.edits = 0
+
+    async def edit(self, content=None, embed=None, attachments=None, **kwargs):
+        self.edits += 1
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embed = embed
+        if attachments:
+            self.file = attachments[0]
+        return self
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+        self.interaction.deferred_at = time.perf_counter()
+
+    async def send_message(self, content=None, embed=None, **kwargs):
+        self.done = True
+        self.interaction.messages.append(FakeMessage(content, embed))
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, embed=None, file=None, wait=False, **kwargs):
+        message = FakeMessage(content, embed, file)
+        self.interaction.messages.append(message)
+        return message
+
+
+class FakeInteraction:
+    def __init__(self):
+        self.user = FakeUser()
+        self.created_at = time.perf_counter()
+        self.deferred_at = None
+        self.messages = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+
+class FakeChoice:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class FakeAttachment:
+    def __init__(self, lines, filename="targets.txt"):
+        self.data = "\n".join(lines).encode("utf-8")
+        self.filename = filename
+        self.size = len(self.data)
+
+    async def read(self):
+        return self.data
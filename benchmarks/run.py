@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeAttachment, FakeChoice, FakeInteraction
+from benchmarks.upstreams import DnsStandIn, PortStandIn, RespStandIn, UpstreamStandIns, write_fake_nmap
+
+# Filled in with the stand-in's listening ports plus a block of closed ones once it is started
+PORT_RANGE = "1-1000"
+
+SCENARIOS = {
+    "checkip": ("NetworkScan", "check_ip_command", lambda i: {"ip": f"93.184.{i // 256 % 256}.{i % 256}"}),
+    "dns": ("NetworkScan", "dns_lookup", lambda i: {"domain": f"site{i}.example"}),
+    "nmap": ("NetworkScan", "nmap_scan", lambda i: {"target": "93.184.216.34", "scan_type": FakeChoice("Quick Scan (Fast)", "Quick Scan")}),
+    "nmapservice": ("NetworkScan", "nmap_scan", lambda i: {"target": "93.184.216.34", "scan_type": FakeChoice("Service Detection (Find Running Services)", "Service Detection")}),
+    "portscan": ("NetworkScan", "nmap_scan", lambda i: {"target": "93.184.216.34", "scan_type": FakeChoice("Quick Scan (Fast)", "Quick Scan"), "ports": PORT_RANGE}),
+    "websitescan": ("WebsiteScan", "website_scan", lambda i: {"domain": f"site{i}.example"}),
+    "seocheck": ("SEOCheck", "seo_check", lambda i: {"domain": f"site{i}.example"}),
+    "webarchitecture": ("WebArchitecture", "web_architecture", lambda i: {"domain": f"site{i}.example"}),
+    "webarchive": ("WebsiteArchiveLookup", "archive_lookup", lambda i: {"domain": f"site{i}.example"}),
+    "archivetimeline": ("WebsiteArchiveLookup", "archive_timeline", lambda i: {"domain": f"site{i}.example", "granularity": FakeChoice("Daily", "day")}),
+    "breachscan": ("BreachScan", "breach_scan", lambda i: {"email": f"user{i}@example.com"}),
+    "domainscan": ("BreachScan", "domain_scan", lambda i: {"domain": f"site{i}.example"}),
+    "bulkdns": ("BulkScan", "bulk_dns", lambda i: {"targets": FakeAttachment([f"bulk{i}-{n}.example" for n in range(50)]), "output": None}),
+    "bulkwebsitescan": ("BulkScan", "bulk_website_scan", lambda i: {"targets": FakeAttachment([f"bulk{i}-{n}.example" for n in range(50)]), "output": None}),
+}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def run_level(bot, standins, dns, scenario, concurrency, total, targets, offset):
+    cog_name, attribute, arguments = SCENARIOS[scenario]
+    cog = bot.get_cog(cog_name)
+    command = getattr(cog, attribute)
+
+    latencies = []
+    errors = 0
+    indexes = iter(range(total))
+    requests_before = sum(standins.requests.values())
+    dns_before = dns.queries
+
+    async def worker():
+        nonlocal errors
+        for index in indexes:
+            interaction = FakeInteraction()
+            started_at = time.perf_counter()
+            try:
+                await command.callback(cog, interaction, **arguments((offset + index) % targets))
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "command": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "outbound_http_per_command": (sum(standins.requests.values()) - requests_before) / total,
+        "outbound_dns_per_command": (dns.queries - dns_before) / total,
+    }
+
+
+async def main(args):
+    standins = UpstreamStandIns(args.latency, args.jitter, args.error_rate, args.page_kb)
+    dns = DnsStandIn(args.dns_latency)
+    base_url = await standins.start()
+    dns_server = await dns.start()
+    ports = PortStandIn()
+    global PORT_RANGE
+    PORT_RANGE = ",".join(str(port) for port in await ports.start()) + ",1-1000"
+    data_dir = tempfile.mkdtemp(prefix="muffin-bench-")
+
+    os.environ.update({
+        "DNS_SERVERS": dns_server,
+        "NMAP_PATH": write_fake_nmap(data_dir, args.nmap_latency),
+        "DATA_DIR": data_dir,
+        "METRICS_PORT": "0",
+        "SCAN_MAX_JOBS": "100000",
+        "BULK_EDIT_INTERVAL": "0.5",
+    })
+    resp = None
+    if args.shared_state:
+        # Run as one of two shard processes so every cache miss and scan submit goes through the stand-in
+        resp = RespStandIn()
+        os.environ.update({"SHARED_STATE_URL": await resp.start(), "SHARD_PROCESS_COUNT": "2"})
+    import main as bot_main
+
+    results = []
+    try:
+        # Entering the bot sets up the shard event queue that close() relies on
+        async with bot_main.MuffinBot() as bot:
+            for file in sorted(os.listdir("modules")):
+                if file.endswith(".py"):
+                    await bot.load_extension(f"modules.{file[:-3]}")
+            await bot.setup_hook()
+            bot.http_client.upstream_overrides = {"*": base_url}
+            # Native port scans land on localhost, where only the stand-in's ports are open
+            bot.scan_queue.scanner.address_overrides = {"*": "127.0.0.1"}
+
+            for scenario in args.commands:
+                for concurrency in args.concurrency:
+                    # Every level starts on fresh targets so caches only help within a level
+                    offset = len(results) * args.requests
+                    result = await run_level(bot, standins, dns, scenario, concurrency, args.requests, args.targets, offset)
+                    results.append(result)
+                    if not args.json:
+                        print(
+                            f"{scenario:<16} c={concurrency:<4} {result['throughput']:8.1f} req/s  "
+                            f"p50 {result['p50'] * 1000:7.1f}ms  p95 {result['p95'] * 1000:7.1f}ms  p99 {result['p99'] * 1000:7.1f}ms  "
+                            f"http/cmd {result['outbound_http_per_command']:.2f}  dns/cmd {result['outbound_dns_per_command']:.2f}  "
+                            f"errors {result['errors']}"
+                        )
+    finally:
+        await standins.close()
+        dns.close()
+        await ports.close()
+        if resp:
+            await resp.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the Muffin cogs against local stand-in upstreams")
+    parser.add_argument("--commands", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="Invocations per command and concurrency level")
+    parser.add_argument("--targets", type=int, default=1000000, help="Distinct targets to cycle through, lower it to exercise caches")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of upstream requests answered with 503")
+    parser.add_argument("--dns-latency", type=float, default=0.005)
+    parser.add_argument("--nmap-latency", type=float, default=0.5)
+    parser.add_argument("--page-kb", type=int, default=64, help="Size of the stand-in landing page")
+    parser.add_argument("--shared-state", action="store_true", help="Share cache and scan state through a local Redis stand-in")
+    parser.add_argument("--json", action="store_true")
+    asyncio.run(main(parser.parse_args()))
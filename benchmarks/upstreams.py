@@ -0,0 +1,325 @@
+import asyncio
+import gzip
+import json
+import os
+import random
+import stat
+import struct
+import sys
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from core.dns_resolver import RECORD_TYPES, encode_name
+
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+LANDING_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Stand-in Landing Page</title>
+<meta name="description" content="A local stand-in page used by the Muffin benchmarks">
+<meta name="keywords" content="benchmark, muffin">
+<meta name="generator" content="WordPress 6.4.2">
+<meta property="og:title" content="Stand-in Landing Page">
+<link rel="canonical" href="https://example.com/">
+<link rel="stylesheet" href="/wp-content/themes/site/bootstrap.min.css">
+<script src="/wp-includes/js/jquery/jquery-3.7.1.min.js"></script>
+</head>
+<body>
+<h1>Stand-in</h1>
+{filler}
+</body>
+</html>
+"""
+
+
+class UpstreamStandIns:
+    def __init__(self, latency=0.02, jitter=0.01, error_rate=0.0, page_kb=64):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.page = LANDING_PAGE.replace("{filler}", "<p>" + "lorem ipsum " * (page_kb * 85) + "</p>")
+        self.requests = Counter()
+        self.runner = None
+        self.port = None
+
+    def delay(self):
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0)
+
+    @web.middleware
+    async def inject(self, request, handler):
+        self.requests[request.host.split(":")[0]] += 1
+        await asyncio.sleep(self.delay())
+        if random.random() < self.error_rate:
+            return web.Response(status=503, text="injected failure")
+        return await handler(request)
+
+    async def start(self, host="127.0.0.1"):
+        app = web.Application(middlewares=[self.inject])
+        app.router.add_get("/{path:.*}", self.dispatch)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, 0).start()
+        self.port = self.runner.addresses[0][1]
+        return f"http://{host}:{self.port}"
+
+    async def close(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def dispatch(self, request):
+        host = request.host.split(":")[0]
+        path = request.path
+
+        if host == "ipinfo.io":
+            ip = path.strip("/").split("/")[0]
+            return web.json_response({"ip": ip, "city": "Frankfurt", "country": "DE", "org": "AS64500 Stand-in Networks", "hostname": f"host-{ip}.example"})
+
+        if host == "dns.google":
+            answer = [{"name": request.query.get("name", "") + ".", "type": 1, "TTL": 300, "data": "127.0.0.1"}]
+            return web.json_response({"Status": 0, "Answer": answer})
+
+        if host == "api.xposedornot.com":
+            if path.startswith("/v1/check-email/"):
+                return web.json_response({"breaches": [["Adobe", "LinkedIn"]]})
+            if path.startswith("/v1/breach-analytics"):
+                return web.json_response({"DataClasses": ["Email addresses", "Passwords", "Usernames"]})
+            if path.startswith("/v1/breaches"):
+                return web.json_response({"Breaches": ["Adobe", "LinkedIn", "Dropbox"]})
+            return web.json_response({"Error": "Not found"}, status=404)
+
+        if host == "web.archive.org":
+            if request.query.get("output") == "json":
+                rows = [["timestamp", "original"]] + [[f"20{year:02d}0101000000", f"http://{request.query.get('url')}/"] for year in range(10, 15)]
+                return web.Response(text=json.dumps(rows), content_type="application/json")
+            return self.cdx_page(request.query)
+
+        # Every other host is treated as a target website
+        if path == "/robots.txt":
+            return web.Response(text="User-agent: *\nDisallow: /admin\nSitemap: /sitemap_index.xml\n")
+        if path == "/sitemap_index.xml":
+            sitemaps = "".join(f"<sitemap><loc>https://{host}/sitemap-{name}</loc></sitemap>" for name in ("pages.xml.gz", "admin.xml"))
+            return web.Response(text=f'<?xml version="1.0"?><sitemapindex xmlns="{SITEMAP_NS}">{sitemaps}</sitemapindex>', content_type="application/xml")
+        if path.startswith("/sitemap-"):
+            section = path[len("/sitemap-"):].split(".")[0]
+            urls = "".join(f"<url><loc>https://{host}/{section}/{index}</loc></url>" for index in range(500))
+            body = f'<?xml version="1.0"?><urlset xmlns="{SITEMAP_NS}">{urls}</urlset>'.encode()
+            # Large sites ship gzipped sitemap files, served as plain bytes like most web servers do
+            if path.endswith(".gz"):
+                return web.Response(body=gzip.compress(body), content_type="application/gzip")
+            return web.Response(body=body, content_type="application/xml")
+        response = web.Response(text=self.page, content_type="text/html", headers={
+            "Server": "nginx",
+            "Strict-Transport-Security": "max-age=31536000",
+            "X-Frame-Options": "DENY",
+        })
+        # Real sites compress their pages, the timing probe reports the ratio
+        response.enable_compression()
+        return response
+
+
+    def captures(self, url):
+        # A stable history per URL, a capture every one to forty hours since 2010 with occasional content changes
+        rng = random.Random(url)
+        moment = time.mktime((2010, 1, 1, 0, 0, 0, 0, 0, -1))
+        digest = 0
+        for _ in range(4000):
+            moment += rng.randint(3600, 40 * 3600)
+            if rng.random() < 0.15:
+                digest += 1
+            yield time.strftime("%Y%m%d%H%M%S", time.gmtime(moment)), f"DIGEST{digest:06d}", f"http://{url}/"
+
+    def cdx_page(self, query):
+        # CDX text output: from, collapse and limit applied server side, the resume key is a plain offset here
+        url = query.get("url", "")
+        since = query.get("from", "").ljust(14, "0")
+        collapse = query.get("collapse", "")
+        fields = query.get("fl", "timestamp,original").split(",")
+        offset = int(query.get("resumeKey", 0))
+        limit = int(query.get("limit", 10000))
+
+        rows = []
+        previous = None
+        for timestamp, digest, original in self.captures(url):
+            if timestamp < since:
+                continue
+            key = digest if collapse == "digest" else timestamp[:int(collapse.split(":")[1])] if collapse.startswith("timestamp:") else None
+            if key is not None and key == previous:
+                continue
+            previous = key
+            values = {"timestamp": timestamp, "digest": digest, "original": original, "statuscode": "200"}
+            rows.append(" ".join(values.get(field, "-") for field in fields))
+
+        page = rows[offset:offset + limit]
+        text = "".join(f"{row}\n" for row in page)
+        if query.get("showResumeKey") == "true" and offset + limit < len(rows):
+            text += f"\n{offset + limit}\n"
+        return web.Response(text=text, content_type="text/plain")
+
+
+class DnsStandIn(asyncio.DatagramProtocol):
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.transport = None
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        asyncio.get_running_loop().call_later(self.latency, self.answer, data, addr)
+
+    def answer(self, data, addr):
+        query_id = struct.unpack("!H", data[:2])[0]
+        offset = 12
+        while data[offset]:
+            offset += data[offset] + 1
+        record_type = struct.unpack("!H", data[offset + 1:offset + 3])[0]
+        question = data[12:offset + 5]
+
+        if record_type == RECORD_TYPES["A"]:
+            # A public address, the bot refuses to crawl or scan private ones. Traffic still goes to the
+            # stand-ins through the upstream and address overrides
+            rdata = bytes([93, 184, 216, 34])
+        elif record_type == RECORD_TYPES["MX"]:
+            rdata = struct.pack("!H", 10) + encode_name("mail.example.com")
+        elif record_type == RECORD_TYPES["NS"]:
+            rdata = encode_name("ns1.example.com")
+        elif record_type == RECORD_TYPES["TXT"]:
+            rdata = bytes([11]) + b"v=spf1 -all"
+        else:
+            rdata = None
+
+        answers = b""
+        if rdata is not None:
+            answers = b"\xc0\x0c" + struct.pack("!HHIH", record_type, 1, 300, len(rdata)) + rdata
+        header = struct.pack("!HHHHHH", query_id, 0x8180, 1, 1 if answers else 0, 0, 0)
+        self.transport.sendto(header + question + answers, addr)
+
+    async def start(self, host="127.0.0.1"):
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=(host, 0))
+        return f"{host}:{self.transport.get_extra_info('sockname')[1]}"
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+
+class PortStandIn:
+    # A few listening ports for the built-in port scanner, one greets like an SSH server and one like a web server
+    def __init__(self):
+        self.servers = []
+        self.ports = []
+
+    async def greet(self, reader, writer):
+        writer.write(b"SSH-2.0-OpenSSH_9.6 stand-in\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def answer_http(self, reader, writer):
+        await reader.read(512)
+        writer.write(b"HTTP/1.0 200 OK\r\nServer: nginx\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def start(self, host="127.0.0.1"):
+        for handler in (self.greet, self.answer_http, self.greet):
+            server = await asyncio.start_server(handler, host, 0)
+            self.servers.append(server)
+            self.ports.append(server.sockets[0].getsockname()[1])
+        return self.ports
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+
+class RespStandIn:
+    # Just enough of the Redis protocol for the shared state backend
+    def __init__(self):
+        self.values = {}
+        self.commands = Counter()
+        self.server = None
+
+    def lookup(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.values[key]
+            return None
+        return value
+
+    def bulk(self, value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def execute(self, args):
+        command = args[0].upper().decode()
+        self.commands[command] += 1
+        if command in ("PING", "AUTH", "SELECT"):
+            return b"+OK\r\n" if command != "PING" else b"+PONG\r\n"
+        if command == "GET":
+            return self.bulk(self.lookup(args[1]))
+        if command == "MGET":
+            return b"*%d\r\n" % (len(args) - 1) + b"".join(self.bulk(self.lookup(key)) for key in args[1:])
+        if command == "SET":
+            expires_at = None
+            if len(args) == 5:
+                unit = 1000 if args[3].upper() == b"PX" else 1
+                expires_at = time.monotonic() + int(args[4]) / unit
+            self.values[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if command == "DEL":
+            return b":%d\r\n" % sum(self.values.pop(key, None) is not None for key in args[1:])
+        return b"-ERR unknown command\r\n"
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self.execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1"):
+        self.server = await asyncio.start_server(self.handle, host, 0)
+        return f"redis://{host}:{self.server.sockets[0].getsockname()[1]}"
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+def write_fake_nmap(directory, latency=0.5):
+    path = os.path.join(directory, "nmap")
+    script = f"""#!{sys.executable}
+import sys, time
+args = sys.argv[1:]
+output = args[args.index("-oX") + 1]
+ports = [22, 80, 443]
+print("Starting Nmap (stand-in)", flush=True)
+for port in ports:
+    time.sleep({latency} / len(ports))
+    print(f"Discovered open port {{port}}/tcp on {{args[-1]}}", flush=True)
+with open(output, "w") as report:
+    entries = "".join(f'<port protocol="tcp" portid="{{port}}"><state state="open"/><service name="svc{{port}}"/></port>' for port in ports)
+    report.write(f'<?xml version="1.0"?><nmaprun><host><ports>{{entries}}</ports></host></nmaprun>')
+"""
+    with open(path, "w") as handle:
+        handle.write(script)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
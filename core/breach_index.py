@@ -0,0 +1,321 @@
+import argparse
+import bisect
+import gzip
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+from itertools import islice
+from struct import Struct
+
+# Layout: header, Bloom filter bits, entries sorted by (key, breach id), breach metadata as JSON.
+# Keys are 64 bit hashes of an address or "@domain", the file never holds a plain address.
+MAGIC = b"MUFBRX01"
+HEADER = Struct("!8sQQQIQQQ")
+ENTRY = Struct("!QHI")
+KEY = Struct("!Q")
+# Import runs hold (address key, domain key) pairs, domains are only counted once addresses are unique across runs
+PAIR = Struct("!QQ")
+HASH_PERSON = b"muffin-breach"
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+EMAIL_PATTERN = re.compile(rb"[\w.+%'-]+@[\w-]+(?:\.[\w-]+)+")
+
+
+def hash_key(value):
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8, person=HASH_PERSON).digest(), "big")
+
+
+def email_key(email):
+    return hash_key(email.strip().lower().encode())
+
+
+def domain_key(domain):
+    return hash_key(b"@" + domain.strip().lower().encode())
+
+
+def bloom_positions(key, bits):
+    # Double hashing, both halves of the 64 bit key act as independent hashes
+    first, second = key & 0xFFFFFFFF, (key >> 32) | 1
+    return [(first + index * second) % bits for index in range(BLOOM_HASHES)]
+
+
+def combine_entries(entries):
+    # Sorted (key, breach, count) entries, duplicates add up their domain counts
+    previous = None
+    for entry in entries:
+        if previous and previous[:2] == entry[:2]:
+            previous = (previous[0], previous[1], previous[2] + entry[2])
+            continue
+        if previous:
+            yield previous
+        previous = entry
+    if previous:
+        yield previous
+
+
+class EntryKeys:
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.count
+
+    def __getitem__(self, position):
+        return KEY.unpack_from(self.index.map, self.index.entries_offset + position * ENTRY.size)[0]
+
+
+class BreachIndex:
+    def __init__(self, path=None):
+        self.path = path or os.getenv("BREACH_INDEX_PATH") or os.path.join(os.getenv("DATA_DIR", "data"), "breaches.idx")
+        self.max_age = float(os.getenv("BREACH_INDEX_MAX_AGE_DAYS", 30)) * 86400
+        self.file = None
+        self.map = None
+        self.identity = None
+        self.count = 0
+        self.built_at = 0
+        self.breaches = []
+        self.counters = {"lookups": 0, "bloom_negatives": 0, "hits": 0, "reloads": 0}
+
+    @property
+    def loaded(self):
+        return self.map is not None
+
+    @property
+    def stale(self):
+        return time.time() - self.built_at > self.max_age
+
+    def refresh(self):
+        # The importer swaps in a new file, a changed inode is picked up on the next lookup
+        try:
+            status = os.stat(self.path)
+        except FileNotFoundError:
+            self.close()
+            return
+        if self.identity == (status.st_ino, status.st_mtime_ns):
+            return
+        try:
+            self.open()
+            self.counters["reloads"] += 1
+        except (OSError, ValueError) as e:
+            print(f"Could not load the breach index {self.path}: {e}")
+            self.close()
+
+    def open(self):
+        self.close()
+        self.file = open(self.path, "rb")
+        status = os.fstat(self.file.fileno())
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (status.st_ino, status.st_mtime_ns)
+        magic, self.count, self.built_at, self.bloom_bits, _, self.bloom_offset, self.entries_offset, meta_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or self.entries_offset + self.count * ENTRY.size > meta_offset or meta_offset > len(self.map):
+            self.close()
+            raise ValueError("not a breach index")
+        self.breaches = json.loads(self.map[meta_offset:])
+        self.keys = EntryKeys(self)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+        self.file = None
+        self.map = None
+        self.identity = None
+        self.count = 0
+
+    def might_contain(self, key):
+        for position in bloom_positions(key, self.bloom_bits):
+            if not self.map[self.bloom_offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def lookup_key(self, key):
+        self.refresh()
+        if not self.loaded:
+            return None
+        self.counters["lookups"] += 1
+        # Most checked addresses were never breached, the Bloom filter answers those without touching the entries
+        if not self.might_contain(key):
+            self.counters["bloom_negatives"] += 1
+            return []
+
+        matches = []
+        position = bisect.bisect_left(self.keys, key)
+        while position < self.count:
+            entry_key, breach_id, count = ENTRY.unpack_from(self.map, self.entries_offset + position * ENTRY.size)
+            if entry_key != key:
+                break
+            matches.append(dict(self.breaches[breach_id], count=count))
+            position += 1
+        if matches:
+            self.counters["hits"] += 1
+        return matches
+
+    def lookup_email(self, email):
+        return self.lookup_key(email_key(email))
+
+    def lookup_domain(self, domain):
+        return self.lookup_key(domain_key(domain))
+
+    def describe_age(self):
+        return time.strftime("%Y-%m-%d", time.gmtime(self.built_at))
+
+    def stats(self):
+        return dict(self.counters, entries=self.count, breaches=len(self.breaches), stale=int(self.loaded and self.stale))
+
+
+def read_addresses(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as file:
+        for line in file:
+            match = EMAIL_PATTERN.search(line)
+            if match:
+                yield match.group().lower()
+
+
+def write_run(entries, directory, layout=ENTRY):
+    run = tempfile.TemporaryFile(dir=directory, buffering=1 << 20)
+    for entry in entries:
+        run.write(layout.pack(*entry))
+    run.seek(0)
+    return run
+
+
+def read_run(run, layout=ENTRY):
+    while True:
+        data = run.read(layout.size * 4096)
+        if not data:
+            return
+        yield from layout.iter_unpack(data)
+
+
+def unique_pairs(runs):
+    # An address repeated across chunks or input files comes out of the merge once
+    for run in runs:
+        run.seek(0)
+    previous = None
+    for pair in heapq.merge(*(read_run(run, PAIR) for run in runs)):
+        if pair[0] != previous:
+            previous = pair[0]
+            yield pair
+
+
+def import_breach(paths, name, date=None, data_classes=None, index_path=None, chunk_size=None):
+    index = BreachIndex(index_path)
+    directory = os.path.dirname(index.path) or "."
+    os.makedirs(directory, exist_ok=True)
+    chunk_size = chunk_size or int(os.getenv("BREACH_IMPORT_CHUNK", 2000000))
+
+    index.refresh()
+    breaches = list(index.breaches)
+    # Importing a breach again replaces its entries instead of counting its domains twice
+    breach_id = next((position for position, breach in enumerate(breaches) if breach["name"] == name), len(breaches))
+    if breach_id > 0xFFFF:
+        raise ValueError("The index is limited to 65536 breaches")
+
+    runs = []
+    seen = 0
+    stream = (address for path in paths for address in read_addresses(path))
+    while True:
+        chunk = list(islice(stream, chunk_size))
+        if not chunk:
+            break
+        seen += len(chunk)
+        pairs = {(hash_key(address), hash_key(b"@" + address.rsplit(b"@", 1)[1])) for address in set(chunk)}
+        runs.append(write_run(sorted(pairs), directory, PAIR))
+        print(f"Sorted {seen:,} addresses")
+
+    # First pass over the merged runs counts every address and its domain once, the second writes the entries
+    addresses = 0
+    domains = Counter()
+    for _, domain in unique_pairs(runs):
+        addresses += 1
+        domains[domain] += 1
+    domain_entries = sorted((domain, breach_id, count) for domain, count in domains.items())
+    upper_bound = addresses + len(domain_entries)
+
+    existing = []
+    if index.loaded:
+        existing = (ENTRY.unpack_from(index.map, index.entries_offset + position * ENTRY.size) for position in range(index.count))
+        existing = (entry for entry in existing if entry[1] != breach_id)
+        upper_bound += index.count
+
+    metadata = {"name": name, "date": date, "data_classes": data_classes or [], "addresses": addresses, "imported_at": int(time.time())}
+    if breach_id == len(breaches):
+        breaches.append(metadata)
+    else:
+        breaches[breach_id] = metadata
+
+    bloom_bits = max(upper_bound * BLOOM_BITS_PER_KEY, 64)
+    bloom = bytearray((bloom_bits + 7) // 8)
+    entries_file = tempfile.TemporaryFile(dir=directory, buffering=1 << 20)
+    count = 0
+    previous_key = None
+    try:
+        address_entries = ((address, breach_id, 0) for address, _ in unique_pairs(runs))
+        for entry in combine_entries(heapq.merge(existing, address_entries, domain_entries)):
+            entries_file.write(ENTRY.pack(*entry))
+            count += 1
+            if entry[0] != previous_key:
+                for position in bloom_positions(entry[0], bloom_bits):
+                    bloom[position >> 3] |= 1 << (position & 7)
+                previous_key = entry[0]
+    finally:
+        for run in runs:
+            run.close()
+        index.close()
+
+    meta = json.dumps(breaches).encode()
+    bloom_offset = HEADER.size
+    entries_offset = bloom_offset + len(bloom)
+    meta_offset = entries_offset + count * ENTRY.size
+    with open(f"{index.path}.tmp", "wb", buffering=1 << 20) as output:
+        output.write(HEADER.pack(MAGIC, count, int(time.time()), bloom_bits, BLOOM_HASHES, bloom_offset, entries_offset, meta_offset))
+        output.write(bloom)
+        entries_file.seek(0)
+        shutil.copyfileobj(entries_file, output, 1 << 20)
+        output.write(meta)
+        output.flush()
+        os.fsync(output.fileno())
+    entries_file.close()
+    # The running bot keeps reading its old map until it notices the new file
+    os.replace(f"{index.path}.tmp", index.path)
+    return addresses, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local breach index used by /breachscan and /domainscan")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    importer = subcommands.add_parser("import", help="Add or replace one breach from files with an email address per line")
+    importer.add_argument("files", nargs="+", help="Text, CSV or combo list files, optionally gzipped")
+    importer.add_argument("--name", required=True, help="Breach name, importing the same name again replaces it")
+    importer.add_argument("--date", help="Breach date, e.g. 2013-10-04")
+    importer.add_argument("--data-classes", default="", help='Comma separated, e.g. "Email addresses,Passwords"')
+    subcommands.add_parser("list", help="Show the breaches in the index")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        index = BreachIndex()
+        index.refresh()
+        if not index.loaded:
+            print(f"No breach index at {index.path}")
+            return
+        print(f"{index.path}: {index.count:,} entries, built {index.describe_age()}")
+        for breach in index.breaches:
+            print(f"  {breach['name']} ({breach.get('date') or 'unknown date'}): {breach['addresses']:,} addresses")
+        return
+
+    started_at = time.perf_counter()
+    data_classes = [value.strip() for value in args.data_classes.split(",") if value.strip()]
+    addresses, count = import_breach(args.files, args.name, args.date, data_classes)
+    print(f"Imported {addresses:,} addresses from {args.name}, the index holds {count:,} entries ({time.perf_counter() - started_at:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import asyncio
+import csv
+import io
+import json
+import time
+from urllib.parse import urlsplit
+
+HEADER_NAMES = {"target", "domain", "host", "hostname", "url", "website", "ip", "address", "email"}
+# Spreadsheets run cells starting with these as formulas, scanned pages and banners are not trusted input
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class BulkInputError(Exception):
+    pass
+
+
+def normalize_host(value):
+    # Accept full URLs and host:port in domain lists, only the hostname is scanned
+    if "://" not in value:
+        value = f"//{value}"
+    try:
+        return urlsplit(value).hostname or ""
+    except ValueError:
+        return ""
+
+
+def normalize_email(value):
+    value = value.strip().lower()
+    local, _, domain = value.rpartition("@")
+    return value if local and "." in domain else ""
+
+
+def parse_targets(data, limit, normalize=None):
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BulkInputError("The attachment must be a UTF-8 text or CSV file.")
+
+    targets = []
+    seen = set()
+    column = None
+
+    for row in csv.reader(io.StringIO(text)):
+        cells = [cell.strip() for cell in row]
+        if not any(cells) or cells[0].startswith("#"):
+            continue
+
+        # A header row picks the column to read, otherwise the first column is used
+        if column is None:
+            header = [cell.lower() for cell in cells]
+            column = next((index for index, name in enumerate(header) if name in HEADER_NAMES), None)
+            if column is not None:
+                continue
+            column = 0
+
+        if column >= len(cells):
+            continue
+        target = normalize(cells[column]) if normalize else cells[column]
+        if not target or target in seen:
+            continue
+
+        seen.add(target)
+        targets.append(target)
+        if len(targets) > limit:
+            raise BulkInputError(f"Too many targets, at most {limit} are allowed per file.")
+
+    if not targets:
+        raise BulkInputError("No targets found in the attachment.")
+    return targets
+
+
+class BulkRun:
+    def __init__(self, targets, worker, concurrency, timeout=None):
+        self.targets = targets
+        self.worker = worker
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rows = [None] * len(targets)
+        self.completed = 0
+        self.failed = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.updated = asyncio.Event()
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    async def run(self):
+        # Workers share one iterator, so at most `concurrency` targets are in flight
+        pending = iter(enumerate(self.targets))
+        try:
+            await asyncio.gather(*(self.work(pending) for _ in range(min(self.concurrency, len(self.targets)))))
+        finally:
+            self.finished_at = time.perf_counter()
+            self.updated.set()
+        return self.rows
+
+    async def work(self, pending):
+        for index, target in pending:
+            try:
+                row = await asyncio.wait_for(self.worker(target), self.timeout)
+            except asyncio.TimeoutError:
+                row = {"error": "Timed out"}
+            except Exception as e:
+                row = {"error": str(e) or type(e).__name__}
+
+            if row.get("error"):
+                self.failed += 1
+            self.rows[index] = {"target": target, **row}
+            self.completed += 1
+            self.updated.set()
+
+    def describe_progress(self):
+        return f"{self.completed}/{len(self.targets)} done · {self.failed} failed · {self.elapsed:.0f}s"
+
+
+def columns(rows):
+    names = {}
+    for row in rows:
+        if row:
+            names.update(dict.fromkeys(row))
+    return list(names)
+
+
+def escape_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns(rows), extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows({key: escape_cell(value) for key, value in row.items()} for row in rows if row)
+    return buffer.getvalue().encode("utf-8")
+
+
+def render_json(rows):
+    return json.dumps([row for row in rows if row], indent=2, default=str).encode("utf-8")
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+SOURCE_TTLS = {
+    "ipinfo": float(os.getenv("CACHE_TTL_IPINFO", 3600)),
+    "wayback": float(os.getenv("CACHE_TTL_WAYBACK", 3600)),
+    "breach": float(os.getenv("CACHE_TTL_BREACH", 21600)),
+}
+DEFAULT_TTL = float(os.getenv("CACHE_TTL_DEFAULT", 300))
+
+
+class CacheEntry:
+    def __init__(self, value, ttl, stale_ttl):
+        now = time.monotonic()
+        self.value = value
+        self.expires_at = now + ttl
+        self.stale_until = self.expires_at + stale_ttl
+
+
+class LookupCache:
+    def __init__(self):
+        self.max_entries = int(os.getenv("CACHE_MAX_ENTRIES", 5000))
+        self.stale_ttl = float(os.getenv("CACHE_STALE_TTL", 600))
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.counters = {}
+        self.store = None
+        self.shared = None
+        self.share_tasks = set()
+
+    def count(self, source, counter):
+        stats = self.counters.setdefault(
+            source, {"hits": 0, "stale_hits": 0, "shared_hits": 0, "store_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+        )
+        stats[counter] += 1
+
+    async def get_or_fetch(self, source, key, fetch, ttl=None):
+        if ttl is None:
+            ttl = SOURCE_TTLS.get(source, DEFAULT_TTL)
+
+        cache_key = (source, key)
+        entry = self.entries.get(cache_key)
+        if entry is None and (self.shared or self.store):
+            entry = await self.restore(cache_key)
+        now = time.monotonic()
+
+        if entry and now < entry.expires_at:
+            self.count(source, "hits")
+            self.entries.move_to_end(cache_key)
+            return entry.value
+
+        if entry and now < entry.stale_until:
+            # Serve the stale value right away and refresh it in the background
+            self.count(source, "stale_hits")
+            self.entries.move_to_end(cache_key)
+            if cache_key not in self.inflight:
+                self.count(source, "refreshes")
+                self.load(cache_key, fetch, ttl)
+            return entry.value
+
+        self.count(source, "misses")
+        return await asyncio.shield(self.load(cache_key, fetch, ttl))
+
+    def shared_key(self, cache_key):
+        source, key = cache_key
+        return f"cache:{source}:{key if isinstance(key, str) else json.dumps(key)}"
+
+    async def restore(self, cache_key):
+        # Values cached by another shard process or persisted by an earlier run keep their remaining freshness
+        stored = None
+        if self.shared:
+            try:
+                stored = await self.shared.get(self.shared_key(cache_key))
+            except Exception:
+                stored = None
+            if stored is not None:
+                self.count(cache_key[0], "shared_hits")
+
+        if stored is None and self.store:
+            try:
+                stored = await self.store.get(*cache_key)
+            except Exception:
+                return None
+            if stored is not None:
+                self.count(cache_key[0], "store_hits")
+        if stored is None:
+            return None
+
+        entry = CacheEntry(stored["value"], stored["fresh_until"] - time.time(), self.stale_ttl)
+        self.entries[cache_key] = entry
+        self.trim()
+        return entry
+
+    def load(self, cache_key, fetch, ttl):
+        # Concurrent lookups for the same key share a single upstream request
+        future = self.inflight.get(cache_key)
+        if future is None:
+            future = asyncio.ensure_future(self.fetch_and_store(cache_key, fetch, ttl))
+            self.inflight[cache_key] = future
+            future.add_done_callback(lambda done: self.finish_load(cache_key, done))
+        return future
+
+    def finish_load(self, cache_key, future):
+        self.inflight.pop(cache_key, None)
+        # Mark background refresh errors as retrieved, they are already counted
+        if not future.cancelled():
+            future.exception()
+
+    async def fetch_and_store(self, cache_key, fetch, ttl):
+        try:
+            value = await fetch()
+        except Exception:
+            self.count(cache_key[0], "errors")
+            raise
+
+        # None means the lookup failed, so it is never cached
+        if value is not None:
+            self.set(cache_key, value, ttl(value) if callable(ttl) else ttl)
+        return value
+
+    def set(self, cache_key, value, ttl):
+        if ttl <= 0:
+            return
+        self.entries[cache_key] = CacheEntry(value, ttl, self.stale_ttl)
+        self.entries.move_to_end(cache_key)
+        self.trim()
+
+        stored = {"value": value, "fresh_until": time.time() + ttl}
+        if self.store:
+            self.store.put(cache_key[0], cache_key[1], stored, ttl + self.stale_ttl)
+        if self.shared:
+            task = asyncio.ensure_future(self.share(cache_key, stored, ttl + self.stale_ttl))
+            self.share_tasks.add(task)
+            task.add_done_callback(self.share_tasks.discard)
+
+    async def share(self, cache_key, stored, ttl):
+        try:
+            await self.shared.set(self.shared_key(cache_key), stored, ttl)
+        except Exception as e:
+            print(f"Shared cache write failed: {e}")
+
+    def trim(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        sources = {}
+        for source, counters in self.counters.items():
+            lookups = counters["hits"] + counters["stale_hits"] + counters["misses"]
+            hits = counters["hits"] + counters["stale_hits"]
+            sources[source] = dict(counters, hit_ratio=hits / lookups if lookups else 0.0)
+        return {"entries": len(self.entries), "max_entries": self.max_entries, "sources": sources}
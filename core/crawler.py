@@ -0,0 +1,381 @@
+import asyncio
+import contextlib
+import ipaddress
+import os
+import random
+import re
+import time
+import zlib
+
+from yarl import URL
+
+from core.page_snapshot import CHUNK_SIZE
+
+USER_AGENT = "muffinbot"
+ROBOTS_MAX_BYTES = 512 * 1024
+SITEMAP_MAX_BYTES = int(os.getenv("SITEMAP_MAX_BYTES", 50 * 1024 * 1024))
+SITEMAP_MAX_FILES = int(os.getenv("SITEMAP_MAX_FILES", 50))
+CRAWL_SAMPLE_SIZE = int(os.getenv("CRAWL_SAMPLE_SIZE", 20))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", 4))
+CRAWL_BUDGET = float(os.getenv("CRAWL_BUDGET", 6))
+CRAWL_SLOW_SECONDS = float(os.getenv("CRAWL_SLOW_SECONDS", 1.5))
+MAX_REDIRECTS = 3
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+def compile_rule(pattern):
+    # robots.txt patterns only know * and a trailing $, everything else is literal
+    anchored = pattern.endswith("$")
+    regex = ".*".join(re.escape(part) for part in pattern.rstrip("$").split("*"))
+    return re.compile(regex + ("$" if anchored else ""))
+
+
+def product_token(agent):
+    # "MuffinBot/1.0" names the same crawler as "muffinbot"
+    return agent.split("/", 1)[0].strip().lower()
+
+
+class RobotsTxt:
+    def __init__(self, text=""):
+        self.groups = {}
+        self.sitemaps = []
+        agents = []
+        in_rules = False
+
+        for line in text.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            key, value = (part.strip() for part in line.split(":", 1))
+            key = key.lower()
+
+            if key == "user-agent":
+                # Consecutive user-agent lines share the rules that follow them
+                if in_rules:
+                    agents, in_rules = [], False
+                agents.append(value.lower())
+                for agent in agents:
+                    self.groups.setdefault(agent, {"rules": [], "crawl_delay": None})
+            elif key in ("allow", "disallow") and agents:
+                in_rules = True
+                if value:
+                    for agent in agents:
+                        self.groups[agent]["rules"].append((len(value), key == "allow", compile_rule(value)))
+            elif key == "crawl-delay" and agents:
+                in_rules = True
+                try:
+                    for agent in agents:
+                        self.groups[agent]["crawl_delay"] = float(value)
+                except ValueError:
+                    pass
+            elif key == "sitemap" and value:
+                self.sitemaps.append(value)
+
+    def group(self, agent=USER_AGENT):
+        # RFC 9309: a group applies when its product token equals ours ignoring case, the most specific name
+        # wins and * is the fallback. "bot" does not apply to muffinbot and an empty name applies to nobody.
+        token = product_token(agent)
+        matches = [name for name in self.groups if name != "*" and token and product_token(name) == token]
+        if matches:
+            return self.groups[max(matches, key=len)]
+        return self.groups.get("*", {"rules": [], "crawl_delay": None})
+
+    def allowed(self, path, agent=USER_AGENT):
+        # Longest matching rule decides, allow wins a tie
+        best = None
+        for length, allow, rule in self.group(agent)["rules"]:
+            if rule.match(path) and (best is None or (length, allow) > best):
+                best = (length, allow)
+        return best is None or best[1]
+
+    def crawl_delay(self, agent=USER_AGENT):
+        return self.group(agent)["crawl_delay"]
+
+
+class Reservoir:
+    # Keeps a uniform sample of a stream of unknown length in constant memory
+    def __init__(self, size, rng=None):
+        self.size = size
+        self.items = []
+        self.seen = 0
+        self.rng = rng or random.Random()
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+            return
+        index = self.rng.randrange(self.seen)
+        if index < self.size:
+            self.items[index] = item
+
+
+class SitemapParser:
+    def __init__(self, on_url, on_sitemap):
+        from xml.etree.ElementTree import XMLPullParser
+
+        self.parser = XMLPullParser(events=("start", "end"))
+        self.on_url = on_url
+        self.on_sitemap = on_sitemap
+        self.root = None
+
+    def feed(self, data):
+        self.parser.feed(data)
+        self.drain()
+
+    def close(self):
+        self.parser.close()
+        self.drain()
+
+    def drain(self):
+        for event, element in self.parser.read_events():
+            if event == "start":
+                if self.root is None:
+                    self.root = element
+                continue
+
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag not in ("url", "sitemap"):
+                continue
+            loc = next((child.text.strip() for child in element if child.tag.rsplit("}", 1)[-1] == "loc" and child.text), None)
+            if loc:
+                (self.on_url if tag == "url" else self.on_sitemap)(loc)
+            # Finished entries are dropped from the tree, a sitemap with 50k urls never sits in memory
+            self.root.clear()
+
+
+def inflate(decoder, data):
+    # Bounded output per step, a small gzip bomb cannot expand into one huge buffer
+    output = decoder.decompress(data, CHUNK_SIZE * 4)
+    while output:
+        yield output
+        output = decoder.decompress(decoder.unconsumed_tail, CHUNK_SIZE * 4) if decoder.unconsumed_tail else b""
+
+
+class SiteCrawler:
+    def __init__(self, http_client, resolver, sample_size=None, concurrency=None, budget=None):
+        self.http_client = http_client
+        self.resolver = resolver
+        self.sample_size = sample_size or CRAWL_SAMPLE_SIZE
+        self.concurrency = concurrency or CRAWL_CONCURRENCY
+        self.budget = budget or CRAWL_BUDGET
+        self.site = None
+        self.hosts = {}
+
+    async def in_scope(self, url):
+        # Sitemaps are written by the site owner, anything they list stays on the audited site and public addresses
+        target = URL(url)
+        host = (target.host or "").lower().rstrip(".")
+        if target.scheme not in ("http", "https") or not (host == self.site or host.endswith("." + self.site)):
+            return False
+        if host not in self.hosts:
+            address = await self.resolver.resolve_address(host)
+            self.hosts[host] = address is not None and ipaddress.ip_address(address).is_global
+        return self.hosts[host]
+
+    @contextlib.asynccontextmanager
+    async def fetch(self, url, timeout, history):
+        # Redirects are followed by hand so every hop gets the same scope check, one leaving the site is not followed
+        if not await self.in_scope(url):
+            raise ValueError("outside the audited site")
+        for hop in range(MAX_REDIRECTS + 1):
+            async with self.http_client.get(url, timeout=timeout, allow_redirects=False) as response:
+                location = response.headers.get("Location")
+                if response.status in REDIRECT_STATUSES and location and hop < MAX_REDIRECTS:
+                    next_url = str(URL(url).join(URL(location)))
+                    if await self.in_scope(next_url):
+                        history.append(url)
+                        url = next_url
+                        continue
+                yield response
+                return
+
+    async def fetch_robots(self, base):
+        try:
+            async with self.http_client.get(str(base / "robots.txt"), timeout=5) as response:
+                if response.status != 200:
+                    return None
+                body = await response.content.read(ROBOTS_MAX_BYTES)
+                return RobotsTxt(body.decode("utf-8", "replace"))
+        except Exception:
+            return None
+
+    async def read_sitemap(self, url, parser, deadline):
+        size = 0
+        decoder = None
+        async with self.fetch(url, max(deadline - time.monotonic(), 1), []) as response:
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status}")
+            first = True
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                # .xml.gz files are served as plain bytes, the gzip magic decides rather than the headers
+                if first and chunk[:2] == b"\x1f\x8b":
+                    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                first = False
+                for data in inflate(decoder, chunk) if decoder else [chunk]:
+                    size += len(data)
+                    if size > SITEMAP_MAX_BYTES:
+                        return False
+                    parser.feed(data)
+                    # A compressed chunk expands into many blocks, parsing them must not hold up the event loop
+                    await asyncio.sleep(0)
+                if time.monotonic() > deadline:
+                    return False
+            parser.close()
+        return True
+
+    async def walk_sitemaps(self, sitemaps, reservoir, deadline):
+        report = {"sitemaps": [], "sitemap_errors": [], "sitemaps_skipped": 0, "complete": True}
+        queue = list(dict.fromkeys(sitemaps))
+        seen = set(queue)
+
+        def queue_sitemap(loc):
+            if loc not in seen and URL(loc).scheme in ("http", "https"):
+                seen.add(loc)
+                queue.append(loc)
+
+        while queue:
+            if len(report["sitemaps"]) >= SITEMAP_MAX_FILES or time.monotonic() > deadline:
+                report["sitemaps_skipped"] = len(queue)
+                report["complete"] = False
+                break
+            url = queue.pop(0)
+            report["sitemaps"].append(url)
+            try:
+                if not await self.read_sitemap(url, SitemapParser(reservoir.add, queue_sitemap), deadline):
+                    report["complete"] = False
+            except Exception as e:
+                report["sitemap_errors"].append(f"{url}: {str(e) or type(e).__name__}")
+        return report
+
+    async def check_url(self, url, pacer):
+        await pacer()
+        started_at = time.perf_counter()
+        history = []
+        try:
+            async with self.fetch(url, 5, history) as response:
+                elapsed = time.perf_counter() - started_at
+                return {
+                    "url": url,
+                    "status": response.status,
+                    "redirects": len(history),
+                    "final_url": str(response.url),
+                    "elapsed": elapsed,
+                }
+        except Exception as e:
+            return {"url": url, "status": None, "error": str(e) or type(e).__name__, "elapsed": time.perf_counter() - started_at}
+
+    def create_pacer(self, delay):
+        lock = asyncio.Lock()
+        next_at = 0
+
+        async def pacer():
+            nonlocal next_at
+            if not delay:
+                return
+            # Requests start at least crawl-delay apart no matter how many run concurrently
+            async with lock:
+                wait = next_at - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                next_at = time.monotonic() + delay
+        return pacer
+
+    async def check_sample(self, urls, delay, deadline):
+        semaphore = asyncio.Semaphore(1 if delay else self.concurrency)
+        pacer = self.create_pacer(delay)
+
+        async def check(url):
+            async with semaphore:
+                return await self.check_url(url, pacer)
+
+        tasks = [asyncio.ensure_future(check(url)) for url in urls]
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=max(deadline - time.monotonic(), 0))
+        for task in pending:
+            task.cancel()
+        return [task.result() for task in tasks if task in done]
+
+    async def run(self, domain):
+        started_at = time.monotonic()
+        base = URL(f"https://{domain}")
+        # www.example.com and example.com are the same site, their other subdomains belong to it as well
+        self.site = base.host.lower().rstrip(".").removeprefix("www.")
+        robots = await self.fetch_robots(base)
+        report = {"robots_txt": robots is not None, "crawl_delay": None, "urls": 0, "checked": [], "disallowed": 0, "out_of_scope": 0}
+
+        sitemaps = [str(base.join(URL(sitemap))) for sitemap in robots.sitemaps] if robots else []
+        report["declared_sitemaps"] = len(sitemaps)
+        sitemaps = sitemaps or [str(base / "sitemap.xml")]
+
+        # Sitemaps get the first part of the budget, checking the sampled pages the rest
+        reservoir = Reservoir(self.sample_size)
+        report.update(await self.walk_sitemaps(sitemaps, reservoir, started_at + self.budget * 0.5))
+        report["urls"] = reservoir.seen
+
+        robots = robots or RobotsTxt()
+        urls = []
+        for url in reservoir.items:
+            target = URL(url)
+            if not await self.in_scope(url):
+                report["out_of_scope"] += 1
+                continue
+            if target.host == base.host and not robots.allowed(target.raw_path_qs):
+                report["disallowed"] += 1
+                continue
+            urls.append(url)
+
+        delay = robots.crawl_delay()
+        report["crawl_delay"] = delay
+        report["delay_skipped"] = 0
+        if delay:
+            # The site's crawl-delay is obeyed as given, a long one shrinks the sample to what fits the budget
+            fits = max(int((started_at + self.budget - time.monotonic()) // delay), 0)
+            report["delay_skipped"] = max(len(urls) - fits, 0)
+            urls = urls[:fits]
+        report["checked"] = await self.check_sample(urls, delay, started_at + self.budget)
+        report["unchecked"] = len(urls) - len(report["checked"])
+
+        report["broken"] = [check for check in report["checked"] if check["status"] is None or check["status"] >= 400]
+        report["slow"] = [check for check in report["checked"] if check["status"] and check["status"] < 400 and check["elapsed"] > CRAWL_SLOW_SECONDS]
+        report["redirected"] = [check for check in report["checked"] if check.get("redirects")]
+        return report
+
+
+def describe_crawl(report):
+    lines = [f"🤖 **robots.txt:** {'✅ Found' if report['robots_txt'] else '❌ Not Found'}"
+             + (f" · crawl-delay {report['crawl_delay']:g}s" if report["crawl_delay"] else "")
+             + (f" · {report['declared_sitemaps']} sitemap(s) declared" if report.get("declared_sitemaps") else "")]
+
+    if not report["urls"]:
+        error = f" ({report['sitemap_errors'][0][:150]})" if report["sitemap_errors"] else ""
+        lines.append(f"🗺 **Sitemap:** ❌ No URLs found{error}")
+        return lines
+
+    sitemap = f"🗺 **Sitemap:** {report['urls']:,} URLs in {len(report['sitemaps'])} file(s)"
+    if not report["complete"]:
+        sitemap += " · stopped early, counts are a lower bound"
+    if report["sitemap_errors"]:
+        sitemap += f" · {len(report['sitemap_errors'])} unreadable"
+    lines.append(sitemap)
+
+    checked = report["checked"]
+    if not checked and report.get("delay_skipped"):
+        lines.append(f"🔎 **Sampled Pages:** skipped, a crawl-delay of {report['crawl_delay']:g}s leaves no time within the audit budget")
+    if checked:
+        elapsed = sorted(check["elapsed"] for check in checked)
+        summary = f"🔎 **Sampled Pages:** {len(checked)} checked · median {elapsed[len(elapsed) // 2]:.2f}s"
+        summary += f" · {len(report['broken'])} broken · {len(report['slow'])} slow · {len(report['redirected'])} redirected"
+        if report["disallowed"] or report["unchecked"]:
+            summary += f" · {report['disallowed']} disallowed, {report['unchecked']} not reached"
+        if report.get("out_of_scope"):
+            summary += f" · {report['out_of_scope']} off-site or private skipped"
+        if report.get("delay_skipped"):
+            summary += f" · {report['delay_skipped']} left out to honour the crawl-delay"
+        lines.append(summary)
+    for check in report["broken"][:5]:
+        lines.append(f"❌ `{check['url'][:120]}` → {check['status'] or check.get('error', 'failed')[:80]}")
+    for check in report["slow"][:3]:
+        lines.append(f"🐢 `{check['url'][:120]}` → {check['elapsed']:.2f}s")
+    return lines
@@ -0,0 +1,408 @@
+import asyncio
+import ipaddress
+import os
+import random
+import socket
+import struct
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+RECORD_TYPES = {"A": 1, "NS": 2, "CNAME": 5, "SOA": 6, "PTR": 12, "MX": 15, "TXT": 16, "AAAA": 28}
+RECORD_NAMES = {value: key for key, value in RECORD_TYPES.items()}
+OPT_RECORD = 41
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+# A server closing mid answer or sending a malformed one, treated like any other failed server
+MALFORMED_ERRORS = (EOFError, ValueError, struct.error, IndexError)
+
+
+class DnsError(Exception):
+    pass
+
+
+class DnsMessage:
+    def __init__(self, query_id, flags, question, answers, authority):
+        self.id = query_id
+        self.rcode = flags & 0x000F
+        self.truncated = bool(flags & 0x0200)
+        self.question = question
+        self.answers = answers
+        self.authority = authority
+
+
+def encode_name(name):
+    encoded = b""
+    for label in filter(None, name.rstrip(".").split(".")):
+        label = label.encode("idna")
+        if len(label) > 63:
+            raise DnsError(f"Label too long in {name}")
+        encoded += bytes([len(label)]) + label
+    return encoded + b"\x00"
+
+
+def build_query(query_id, name, record_type):
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 1)
+    question = encode_name(name) + struct.pack("!HH", RECORD_TYPES[record_type], 1)
+    # EDNS0 lets servers answer with up to 1232 bytes over UDP before truncating
+    edns = b"\x00" + struct.pack("!HHIH", OPT_RECORD, 1232, 0, 0)
+    return header + question + edns
+
+
+def decode_name(message, offset):
+    labels = []
+    end_offset = None
+    for _ in range(128):
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if end_offset is None:
+                end_offset = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            return ".".join(labels) + ".", end_offset if end_offset is not None else offset
+        labels.append(message[offset:offset + length].decode("ascii", errors="replace"))
+        offset += length
+    raise DnsError("Too many compression pointers")
+
+
+def decode_rdata(message, record_type, offset, length):
+    rdata = message[offset:offset + length]
+    if record_type == RECORD_TYPES["A"]:
+        return socket.inet_ntop(socket.AF_INET, rdata)
+    if record_type == RECORD_TYPES["AAAA"]:
+        return socket.inet_ntop(socket.AF_INET6, rdata)
+    if record_type in (RECORD_TYPES["NS"], RECORD_TYPES["CNAME"], RECORD_TYPES["PTR"]):
+        return decode_name(message, offset)[0]
+    if record_type == RECORD_TYPES["MX"]:
+        preference = struct.unpack("!H", rdata[:2])[0]
+        return f"{preference} {decode_name(message, offset + 2)[0]}"
+    if record_type == RECORD_TYPES["TXT"]:
+        parts, position = [], 0
+        while position < len(rdata):
+            size = rdata[position]
+            parts.append(rdata[position + 1:position + 1 + size].decode("utf-8", errors="replace"))
+            position += 1 + size
+        return "".join(parts)
+    if record_type == RECORD_TYPES["SOA"]:
+        primary, position = decode_name(message, offset)
+        mailbox, position = decode_name(message, position)
+        numbers = struct.unpack("!IIIII", message[position:position + 20])
+        return f"{primary} {mailbox} " + " ".join(str(number) for number in numbers)
+    return rdata.hex()
+
+
+def parse_response(message):
+    query_id, flags, question_count, answer_count, authority_count, _ = struct.unpack("!HHHHHH", message[:12])
+    offset = 12
+
+    question = None
+    for _ in range(question_count):
+        name, offset = decode_name(message, offset)
+        record_type, _ = struct.unpack("!HH", message[offset:offset + 4])
+        offset += 4
+        question = (name.lower(), record_type)
+
+    sections = []
+    for count in (answer_count, authority_count):
+        records = []
+        for _ in range(count):
+            name, offset = decode_name(message, offset)
+            record_type, _, ttl, length = struct.unpack("!HHIH", message[offset:offset + 10])
+            offset += 10
+            # Slicing would quietly hand a cut off TXT or unknown record back as a shorter value
+            if offset + length > len(message):
+                raise DnsError("Truncated record data")
+            records.append({
+                "name": name,
+                "type": record_type,
+                "TTL": ttl,
+                "data": decode_rdata(message, record_type, offset, length),
+            })
+            offset += length
+        sections.append(records)
+
+    return DnsMessage(query_id, flags, question, sections[0], sections[1])
+
+
+class DnsBatchProtocol(asyncio.DatagramProtocol):
+    def __init__(self, pending):
+        self.pending = pending
+
+    def datagram_received(self, data, addr):
+        try:
+            message = parse_response(data)
+        except Exception:
+            return
+
+        future = self.pending.get(message.id)
+        if future and not future.done():
+            future.set_result(message)
+
+    def error_received(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+
+def parse_nameservers(value):
+    servers = []
+    for entry in filter(None, (item.strip() for item in value.split(","))):
+        if entry.startswith("["):
+            host, _, port = entry[1:].partition("]:")
+        elif entry.count(":") == 1:
+            host, _, port = entry.partition(":")
+        else:
+            host, port = entry, ""
+        servers.append((host.strip("[]"), int(port) if port else 53))
+    return servers
+
+
+def system_nameservers():
+    servers = []
+    try:
+        with open("/etc/resolv.conf") as resolv_conf:
+            for line in resolv_conf:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    servers.append((parts[1].split("%")[0], 53))
+    except OSError:
+        pass
+    return servers or [("1.1.1.1", 53), ("8.8.8.8", 53)]
+
+
+class DnsResolver:
+    def __init__(self, http_client=None):
+        configured = os.getenv("DNS_SERVERS", "")
+        self.nameservers = parse_nameservers(configured) if configured else system_nameservers()
+        self.timeout = float(os.getenv("DNS_TIMEOUT", 2))
+        self.attempts = int(os.getenv("DNS_ATTEMPTS", 2))
+        self.max_entries = int(os.getenv("DNS_CACHE_MAX_ENTRIES", 10000))
+        self.negative_ttl = int(os.getenv("DNS_NEGATIVE_TTL", 60))
+        self.doh_url = os.getenv("DNS_DOH_URL", "https://dns.google/resolve")
+        self.http_client = http_client
+        self.cache = OrderedDict()
+        # Called with (name, results) for every answer that came from the network rather than the cache
+        self.observers = []
+        self.counters = {"queries": 0, "cache_hits": 0, "negative_hits": 0, "udp": 0, "tcp": 0, "doh": 0, "failures": 0}
+
+    def cache_get(self, name, record_type):
+        entry = self.cache.get((name, record_type))
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.cache[(name, record_type)]
+            return None
+
+        self.cache.move_to_end((name, record_type))
+        self.counters["cache_hits" if entry[1] else "negative_hits"] += 1
+        return entry[1]
+
+    def cache_set(self, name, record_type, answers, ttl):
+        if ttl <= 0:
+            return
+        self.cache[(name, record_type)] = (time.monotonic() + ttl, answers)
+        self.cache.move_to_end((name, record_type))
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    def negative_cache_ttl(self, authority):
+        # RFC 2308: negative answers live for min(SOA TTL, SOA minimum)
+        for record in authority:
+            if record["type"] == RECORD_TYPES["SOA"]:
+                return min(record["TTL"], int(record["data"].split()[-1]))
+        return self.negative_ttl
+
+    async def resolve(self, name, record_type):
+        return (await self.resolve_many(name, [record_type])).get(record_type)
+
+    async def resolve_many(self, name, record_types):
+        try:
+            name = name.strip().rstrip(".").lower().encode("idna").decode("ascii")
+        except UnicodeError:
+            return {record_type: None for record_type in record_types}
+
+        results = {}
+        missing = []
+        for record_type in record_types:
+            cached = self.cache_get(name, record_type)
+            if cached is not None:
+                results[record_type] = cached
+            else:
+                missing.append(record_type)
+
+        if missing:
+            self.counters["queries"] += len(missing)
+            answers = await self.query(name, missing)
+            results.update(answers)
+            for observer in self.observers:
+                observer(name, answers)
+        return results
+
+    async def resolve_address(self, name):
+        try:
+            return str(ipaddress.ip_address(name))
+        except ValueError:
+            pass
+
+        answers = await self.resolve(name, "A") or []
+        addresses = [answer["data"] for answer in answers if answer["type"] == RECORD_TYPES["A"]]
+        return addresses[0] if addresses else None
+
+    async def query(self, name, record_types):
+        results = {}
+        remaining = list(record_types)
+
+        for server in self.nameservers:
+            if not remaining:
+                break
+            try:
+                messages = await self.query_udp_many(server, name, remaining)
+            except (OSError, DnsError):
+                continue
+
+            for record_type, message in messages.items():
+                if message.truncated:
+                    try:
+                        message = await self.query_tcp(server, name, record_type)
+                    except (OSError, DnsError, asyncio.TimeoutError) + MALFORMED_ERRORS:
+                        continue
+
+                if message.rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+                    continue
+
+                ttl = min((answer["TTL"] for answer in message.answers), default=None)
+                if ttl is None:
+                    ttl = self.negative_cache_ttl(message.authority)
+                self.cache_set(name, record_type, message.answers, ttl)
+                results[record_type] = message.answers
+                remaining.remove(record_type)
+
+        if remaining:
+            fallback = await asyncio.gather(*(self.query_doh(name, record_type) for record_type in remaining))
+            for record_type, answers in zip(remaining, fallback):
+                results[record_type] = answers
+                if answers is None:
+                    self.counters["failures"] += 1
+        return results
+
+    async def query_udp_many(self, server, name, record_types):
+        # All record types share one socket and are answered in whatever order they arrive
+        loop = asyncio.get_running_loop()
+        query_ids = random.sample(range(65536), len(record_types))
+        pending = {query_id: loop.create_future() for query_id in query_ids}
+        queries = {
+            query_id: (record_type, build_query(query_id, name, record_type))
+            for query_id, record_type in zip(query_ids, record_types)
+        }
+
+        transport, _ = await loop.create_datagram_endpoint(lambda: DnsBatchProtocol(pending), remote_addr=server)
+        try:
+            for _ in range(self.attempts):
+                unanswered = [query_id for query_id, future in pending.items() if not future.done()]
+                if not unanswered:
+                    break
+                for query_id in unanswered:
+                    transport.sendto(queries[query_id][1])
+                    self.counters["udp"] += 1
+                await asyncio.wait([pending[query_id] for query_id in unanswered], timeout=self.timeout)
+        finally:
+            transport.close()
+
+        messages = {}
+        for query_id, future in pending.items():
+            if not future.done():
+                future.cancel()
+                continue
+            if future.exception():
+                continue
+
+            record_type, _ = queries[query_id]
+            message = future.result()
+            if message.question == (name + ".", RECORD_TYPES[record_type]):
+                messages[record_type] = message
+        return messages
+
+    async def query_tcp(self, server, name, record_type):
+        self.counters["tcp"] += 1
+        query_id = random.randrange(65536)
+        query = build_query(query_id, name, record_type)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*server), timeout=self.timeout)
+        try:
+            writer.write(struct.pack("!H", len(query)) + query)
+            await writer.drain()
+            length = struct.unpack("!H", await asyncio.wait_for(reader.readexactly(2), timeout=self.timeout))[0]
+            message = parse_response(await asyncio.wait_for(reader.readexactly(length), timeout=self.timeout))
+        finally:
+            writer.close()
+        if message.id != query_id or message.question != (name + ".", RECORD_TYPES[record_type]):
+            raise DnsError(f"Mismatched TCP answer for {name} {record_type}")
+        return message
+
+    async def query_doh(self, name, record_type):
+        # Resolving the DoH host itself through DoH would loop forever
+        if not self.http_client or name == urlsplit(self.doh_url).hostname:
+            return None
+
+        self.counters["doh"] += 1
+        try:
+            async with self.http_client.get(f"{self.doh_url}?name={name}&type={record_type}", timeout=5) as response:
+                if response.status != 200:
+                    return None
+                data = await response.json(content_type=None)
+        except Exception:
+            return None
+
+        if data.get("Status") not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            return None
+
+        answers = data.get("Answer", [])
+        ttl = min((answer.get("TTL", 0) for answer in answers), default=None)
+        if ttl is None:
+            ttl = self.negative_ttl
+        self.cache_set(name, record_type, answers, ttl)
+        return answers
+
+    def stats(self):
+        return dict(self.counters, cache_entries=len(self.cache), nameservers=[f"{host}:{port}" for host, port in self.nameservers])
+
+
+class AiohttpResolver(AbstractResolver):
+    def __init__(self, resolver):
+        self.resolver = resolver
+        self.fallback = aiohttp.ThreadedResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        try:
+            address = ipaddress.ip_address(host)
+            family = socket.AF_INET6 if address.version == 6 else socket.AF_INET
+            return [{"hostname": host, "host": host, "port": port, "family": family, "proto": 0, "flags": socket.AI_NUMERICHOST}]
+        except ValueError:
+            pass
+
+        record_types = {socket.AF_INET: ["A"], socket.AF_INET6: ["AAAA"]}.get(family, ["A", "AAAA"])
+        records = await self.resolver.resolve_many(host, record_types)
+
+        hosts = []
+        for record_type in record_types:
+            for answer in records.get(record_type) or []:
+                if answer["type"] == RECORD_TYPES[record_type]:
+                    hosts.append({
+                        "hostname": host,
+                        "host": answer["data"],
+                        "port": port,
+                        "family": socket.AF_INET if record_type == "A" else socket.AF_INET6,
+                        "proto": 0,
+                        "flags": socket.AI_NUMERICHOST,
+                    })
+
+        if not hosts:
+            return await self.fallback.resolve(host, port, family)
+        return hosts
+
+    async def close(self):
+        await self.fallback.close()
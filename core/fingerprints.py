@@ -0,0 +1,242 @@
+import re
+
+from multidict import CIMultiDict
+
+VERSION = r"v?(\d+(?:\.\d+)+)"
+
+# Each signature lists patterns per source. Headers map a header name to a value pattern,
+# cookies match cookie names, script matches script src URLs, meta matches the generator tag.
+# Patterns are lowercase and matched against lowercased text. Body and script patterns must
+# start with a literal character. The first capture group of a match is reported as the version.
+SIGNATURES = [
+    # CMS
+    {"name": "WordPress", "category": "CMS", "icon": "📄",
+     "body": [r"/wp-(?:content|includes)/"], "script": [r"/wp-includes/js/"],
+     "meta": [r"wordpress ?" + VERSION + "?"], "cookies": [r"wordpress_(?:logged_in|sec)_", r"wp-settings-"],
+     "headers": {"link": r"rel=\"https://api\.w\.org/\""}, "implies": ["PHP", "MySQL"]},
+    {"name": "Drupal", "category": "CMS", "icon": "📄",
+     "body": [r"/sites/(?:default|all)/(?:files|modules|themes)/", r"drupal\.settings"], "script": [r"/drupal\.js", r"/misc/drupal\.js"],
+     "meta": [r"drupal ?(\d+)?"], "headers": {"x-drupal-cache": r"", "x-generator": r"drupal ?(\d+)?"}, "implies": ["PHP"]},
+    {"name": "Joomla", "category": "CMS", "icon": "📄",
+     "body": [r"/media/jui/", r"/components/com_[a-z]+/"], "meta": [r"joomla!? ?" + VERSION + "?"], "implies": ["PHP"]},
+    {"name": "Ghost", "category": "CMS", "icon": "📄", "meta": [r"ghost ?" + VERSION + "?"], "headers": {"x-ghost-cache-status": r""}},
+    {"name": "Shopify", "category": "CMS", "icon": "🛒",
+     "body": [r"cdn\.shopify\.com/s/files/"], "cookies": [r"_shopify_(?:y|s)"], "headers": {"x-shopid": r"", "x-shopify-stage": r""}},
+    {"name": "Wix", "category": "CMS", "icon": "📄", "meta": [r"wix\.com website builder"], "headers": {"x-wix-request-id": r""}},
+    {"name": "Squarespace", "category": "CMS", "icon": "📄", "body": [r"static1\.squarespace\.com/"], "cookies": [r"ss_mid"]},
+    {"name": "Hugo", "category": "Static Site Generator", "icon": "📄", "meta": [r"hugo " + VERSION]},
+    {"name": "Jekyll", "category": "Static Site Generator", "icon": "📄", "meta": [r"jekyll v?" + VERSION]},
+
+    # JavaScript frameworks and libraries
+    {"name": "jQuery", "category": "JS Library", "icon": "🛠",
+     "script": [r"jquery[.-]" + VERSION + r"(?:\.min)?\.js", r"jquery(?:\.min)?\.js(?:\?ver=" + VERSION + ")?"]},
+    {"name": "React", "category": "Frontend", "icon": "⚛️",
+     "body": [r"data-reactroot", r"__react_devtools_global_hook__"], "script": [r"react(?:-dom)?(?:\.production)?(?:\.min)?\.js", r"/react@" + VERSION]},
+    {"name": "Next.js", "category": "Frontend", "icon": "⚛️",
+     "body": [r"id=\"__next_data__\""], "script": [r"/_next/static/"], "headers": {"x-powered-by": r"next\.js ?" + VERSION + "?"}, "implies": ["React"]},
+    {"name": "Vue.js", "category": "Frontend", "icon": "🟢",
+     "body": [r"data-v-[0-9a-f]{8}", r"id=\"__vue"], "script": [r"vue(?:\.runtime)?(?:\.global)?(?:\.prod)?(?:\.min)?\.js", r"/vue@" + VERSION]},
+    {"name": "Nuxt.js", "category": "Frontend", "icon": "🟢", "body": [r"window\.__nuxt__", r"id=\"__nuxt\""], "script": [r"/_nuxt/"], "implies": ["Vue.js"]},
+    {"name": "Angular", "category": "Frontend", "icon": "🟥",
+     "body": [r"ng-version=\"" + VERSION + "\"", r"<app-root"], "script": [r"angular(?:\.min)?\.js"]},
+    {"name": "AngularJS", "category": "Frontend", "icon": "🟥", "body": [r"ng-app=", r"ng-controller="], "script": [r"angular\.js/" + VERSION]},
+    {"name": "Svelte", "category": "Frontend", "icon": "🟠", "body": [r"svelte-[a-z0-9]{6}\b"]},
+    {"name": "Alpine.js", "category": "JS Library", "icon": "🛠", "body": [r" x-data="], "script": [r"alpinejs(?:@" + VERSION + ")?"]},
+    {"name": "Lodash", "category": "JS Library", "icon": "🛠", "script": [r"lodash(?:\.min)?\.js", r"/lodash@" + VERSION]},
+    {"name": "Google Analytics", "category": "Analytics", "icon": "📈",
+     "script": [r"google-analytics\.com/(?:ga|analytics)\.js", r"googletagmanager\.com/gtag/js"], "cookies": [r"_ga$", r"_gid$"]},
+    {"name": "Google Tag Manager", "category": "Analytics", "icon": "📈", "body": [r"googletagmanager\.com/gtm\.js"]},
+
+    # CSS frameworks
+    {"name": "Bootstrap", "category": "CSS Framework", "icon": "🟣",
+     "body": [r"bootstrap(?:\.min)?\.css", r"/bootstrap@" + VERSION], "script": [r"bootstrap(?:\.bundle)?(?:\.min)?\.js"]},
+    {"name": "Tailwind CSS", "category": "CSS Framework", "icon": "💠",
+     "body": [r"tailwind(?:css)?(?:\.min)?\.css", r"/tailwindcss@" + VERSION, r"--tw-[a-z-]+:"], "script": [r"cdn\.tailwindcss\.com"]},
+    {"name": "Bulma", "category": "CSS Framework", "icon": "💠", "body": [r"bulma(?:\.min)?\.css", r"/bulma@" + VERSION]},
+    {"name": "Font Awesome", "category": "Font Script", "icon": "🔤",
+     "body": [r"font-?awesome(?:\.min)?\.css", r"/font-awesome/" + VERSION], "script": [r"kit\.fontawesome\.com/"]},
+
+    # Backend frameworks and languages
+    {"name": "Django", "category": "Backend", "icon": "🐍", "body": [r"name=\"csrfmiddlewaretoken\""], "cookies": [r"csrftoken$", r"django_language$"], "implies": ["Python"]},
+    {"name": "Flask", "category": "Backend", "icon": "🥃", "headers": {"server": r"werkzeug/?" + VERSION + "?"}, "implies": ["Python"]},
+    {"name": "Express.js", "category": "Backend", "icon": "🟡", "headers": {"x-powered-by": r"express$"}, "cookies": [r"connect\.sid$"], "implies": ["Node.js"]},
+    {"name": "Laravel", "category": "Backend", "icon": "🟥", "cookies": [r"laravel_session$"], "implies": ["PHP"]},
+    {"name": "Ruby on Rails", "category": "Backend", "icon": "💎",
+     "body": [r"name=\"csrf-param\" content=\"authenticity_token\""], "cookies": [r"_[a-z0-9_]+_session$"], "headers": {"x-runtime": r""}, "implies": ["Ruby"]},
+    {"name": "ASP.NET", "category": "Backend", "icon": "🔵",
+     "body": [r"name=\"__viewstate\""], "cookies": [r"asp\.net_sessionid$", r"\.aspnetcore\."],
+     "headers": {"x-aspnet-version": VERSION, "x-powered-by": r"asp\.net"}},
+    {"name": "PHP", "category": "Language", "icon": "🐘", "cookies": [r"phpsessid$"], "headers": {"x-powered-by": r"php/?" + VERSION + "?"}},
+    {"name": "Python", "category": "Language", "icon": "🐍"},
+    {"name": "Ruby", "category": "Language", "icon": "💎"},
+    {"name": "Node.js", "category": "Language", "icon": "🟩"},
+
+    # Web servers, CDNs and hosting
+    {"name": "Nginx", "category": "Web Server", "icon": "🖥", "headers": {"server": r"nginx(?:/" + VERSION + ")?"}},
+    {"name": "Apache", "category": "Web Server", "icon": "🖥", "headers": {"server": r"apache(?:/" + VERSION + ")?"}},
+    {"name": "Microsoft IIS", "category": "Web Server", "icon": "🖥", "headers": {"server": r"microsoft-iis(?:/" + VERSION + ")?"}},
+    {"name": "LiteSpeed", "category": "Web Server", "icon": "🖥", "headers": {"server": r"litespeed"}},
+    {"name": "Caddy", "category": "Web Server", "icon": "🖥", "headers": {"server": r"caddy"}},
+    {"name": "Cloudflare", "category": "CDN", "icon": "🌐", "headers": {"cf-ray": r"", "server": r"cloudflare"}, "cookies": [r"__cf_bm$", r"__cfruid$"]},
+    {"name": "Fastly", "category": "CDN", "icon": "🌐", "headers": {"x-served-by": r"cache-", "x-fastly-request-id": r""}},
+    {"name": "Amazon CloudFront", "category": "CDN", "icon": "🌐", "headers": {"x-amz-cf-id": r""}},
+    {"name": "Vercel", "category": "Hosting", "icon": "▲", "headers": {"x-vercel-id": r"", "server": r"vercel"}},
+    {"name": "Netlify", "category": "Hosting", "icon": "🌐", "headers": {"x-nf-request-id": r"", "server": r"netlify"}},
+    {"name": "GitHub Pages", "category": "Hosting", "icon": "🐙", "headers": {"x-github-request-id": r"", "server": r"github\.com"}},
+
+    # Databases and backend services
+    {"name": "MySQL", "category": "Database", "icon": "💾"},
+    {"name": "Firebase", "category": "Database", "icon": "🔥", "body": [r"\.firebaseio\.com", r"\.firebaseapp\.com"], "script": [r"firebase(?:-app)?(?:\.js|/" + VERSION + ")"]},
+    {"name": "Supabase", "category": "Database", "icon": "🟩", "body": [r"\.supabase\.co\b"]},
+]
+
+SCRIPT_TAG = r"<script\b[^>]*?\bsrc\s*=\s*[\"']?(?P<script_src>[^\"'\s>]+)"
+GENERATOR_TAG = r"<meta\b[^>]*?\bname\s*=\s*[\"']?generator[\"']?[^>]*?\bcontent\s*=\s*[\"'](?P<generator>[^\"']+)"
+
+
+class Technology:
+    def __init__(self, signature, version=None, source=None):
+        self.name = signature["name"]
+        self.category = signature["category"]
+        self.icon = signature["icon"]
+        self.version = version
+        self.source = source
+
+    def describe(self):
+        version = f" {self.version}" if self.version else ""
+        return f"{self.icon} **{self.category}:** {self.name}{version}"
+
+
+class PatternSet:
+    # All patterns of a source are joined into one alternation and matched against lowercased
+    # text in a single pass. Because every alternative starts with a literal character the
+    # regex engine skips positions that cannot start any signature, so adding signatures
+    # barely changes the cost per page. The matching signature is only worked out at the
+    # (rare) match positions, which is also where the version group is read.
+    def __init__(self, entries, prefix=()):
+        self.candidates = {}
+        alternatives = list(prefix)
+        for signature, pattern in entries:
+            alternatives.append(pattern)
+            self.candidates.setdefault(leading_literal(pattern), []).append((signature, re.compile(pattern)))
+        self.regex = re.compile("|".join(alternatives)) if alternatives else None
+
+    def identify(self, text, position):
+        for signature, pattern in self.candidates.get(text[position], []) + self.candidates.get(None, []):
+            match = pattern.match(text, position)
+            if match:
+                return signature, next((group for group in match.groups() if group), None)
+        return None
+
+    def search(self, text):
+        if self.regex is None or not text:
+            return []
+        text = text.lower()
+        found = []
+        for match in self.regex.finditer(text):
+            entry = self.identify(text, match.start())
+            if entry:
+                found.append(entry)
+        return found
+
+
+def leading_literal(pattern):
+    # Patterns without a required literal first character are tried at every match position
+    if pattern[0] == "\\" and not pattern[1].isalnum():
+        first, following = pattern[1], pattern[2:3]
+    elif pattern[0] not in "\\.^$*+?{}[]()|":
+        first, following = pattern[0], pattern[1:2]
+    else:
+        return None
+    return None if following and following in "?*{" else first
+
+
+class FingerprintEngine:
+    def __init__(self, signatures):
+        self.signatures = {signature["name"]: signature for signature in signatures}
+        self.order = {signature["name"]: index for index, signature in enumerate(signatures)}
+
+        by_source = {"body": [], "script": [], "meta": [], "cookies": []}
+        header_entries = {}
+        self.header_presence = {}
+        for signature in signatures:
+            for source in by_source:
+                by_source[source].extend((signature, pattern) for pattern in signature.get(source, ()))
+            for header, pattern in signature.get("headers", {}).items():
+                if pattern:
+                    header_entries.setdefault(header, []).append((signature, pattern))
+                else:
+                    self.header_presence.setdefault(header, []).append(signature)
+
+        # Script src and generator values are captured in the same pass over the body
+        self.body = PatternSet(by_source["body"], prefix=(SCRIPT_TAG, GENERATOR_TAG))
+        self.script = PatternSet(by_source["script"])
+        self.meta = PatternSet(by_source["meta"])
+        self.cookies = PatternSet(by_source["cookies"])
+        self.headers = {header: PatternSet(entries) for header, entries in header_entries.items()}
+
+    def scan_body(self, html):
+        found = []
+        if self.body.regex is None or not html:
+            return found
+
+        html = html.lower()
+        for match in self.body.regex.finditer(html):
+            if match.group("script_src"):
+                src = match.group("script_src")
+                found.extend((signature, version, "script") for signature, version in self.script.search(src) + self.body.search(src))
+            elif match.group("generator"):
+                found.extend((signature, version, "meta") for signature, version in self.meta.search(match.group("generator")))
+            else:
+                entry = self.body.identify(html, match.start())
+                if entry:
+                    found.append(entry + ("body",))
+        return found
+
+    def scan_headers(self, headers):
+        found = []
+        for header, patterns in self.headers.items():
+            for value in headers.getall(header, ()):
+                found.extend((signature, version, "headers") for signature, version in patterns.search(value))
+        for header, signatures in self.header_presence.items():
+            if header in headers:
+                found.extend((signature, None, "headers") for signature in signatures)
+        return found
+
+    def scan_cookies(self, headers):
+        found = []
+        for cookie in headers.getall("set-cookie", ()):
+            name = cookie.split("=", 1)[0].strip()
+            found.extend((signature, version, "cookies") for signature, version in self.cookies.search(name))
+        return found
+
+    def detect(self, headers=None, html=None):
+        headers = headers if hasattr(headers, "getall") else CIMultiDict(headers or {})
+        detected = {}
+        for signature, version, source in self.scan_headers(headers) + self.scan_cookies(headers) + self.scan_body(html):
+            technology = detected.get(signature["name"])
+            if technology is None:
+                detected[signature["name"]] = Technology(signature, version, source)
+            elif version and not technology.version:
+                technology.version = version
+
+        pending = list(detected.values())
+        while pending:
+            technology = pending.pop()
+            for name in self.signatures[technology.name].get("implies", ()):
+                if name not in detected:
+                    detected[name] = Technology(self.signatures[name], source="implied")
+                    pending.append(detected[name])
+
+        return sorted(detected.values(), key=lambda technology: self.order[technology.name])
+
+
+engine = None
+
+
+def get_engine():
+    # Compiling the signatures costs more than importing every cog, so it waits for the first scan
+    global engine
+    if engine is None:
+        engine = FingerprintEngine(SIGNATURES)
+    return engine
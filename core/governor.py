@@ -0,0 +1,257 @@
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+from core import metrics
+from core.rate_limit import TokenBucket
+
+# Requests per second and burst for upstreams with published or observed limits, overridable
+# with GOVERNOR_RATES="host=rate[:burst],...". Every other host gets the default policy.
+UPSTREAM_RATES = {
+    "ipinfo.io": (5, 10),
+    "api.xposedornot.com": (2, 4),
+    "dns.google": (20, 40),
+    "web.archive.org": (1, 5),
+}
+
+RETRY_STATUSES = {429, 502, 503, 504}
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} is temporarily unavailable, retrying in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def parse_rates(value):
+    rates = {}
+    for entry in value.split(","):
+        if "=" not in entry:
+            continue
+        host, limits = entry.strip().split("=", 1)
+        rate, _, burst = limits.partition(":")
+        rates[host.lower()] = (float(rate), float(burst) if burst else None)
+    return rates
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rate_limit_wait(headers):
+    # Retry-After wins, otherwise an exhausted RateLimit-* / X-RateLimit-* window tells how long to pause
+    retry_after = parse_retry_after(headers.get("Retry-After"))
+    if retry_after is not None:
+        return retry_after
+
+    for prefix in ("RateLimit", "X-RateLimit"):
+        remaining = headers.get(f"{prefix}-Remaining")
+        reset = headers.get(f"{prefix}-Reset")
+        if remaining is None or reset is None:
+            continue
+        try:
+            if float(remaining) > 0:
+                return None
+            reset = float(reset)
+        except ValueError:
+            continue
+        # Some APIs send an epoch timestamp instead of seconds until reset
+        return max(reset - time.time(), 0.0) if reset > 1e9 else reset
+    return None
+
+
+class HostGovernor:
+    def __init__(self, host, rate, burst, failure_threshold, open_seconds, max_wait):
+        self.host = host
+        self.configured_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_wait = max_wait
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.paused_until = 0.0
+
+    def check_circuit(self):
+        if self.state == "open":
+            retry_in = self.opened_at + self.open_seconds - time.monotonic()
+            if retry_in > 0:
+                raise CircuitOpenError(self.host, retry_in)
+            self.state = "half_open"
+
+        if self.state == "half_open":
+            # Only one trial request goes through while the host is recovering
+            if self.probing:
+                raise CircuitOpenError(self.host, self.open_seconds)
+            self.probing = True
+
+    async def acquire(self):
+        # A host that asked for a long pause is treated like an open circuit instead of stalling callers
+        pause = self.paused_until - time.monotonic()
+        if pause > self.max_wait:
+            raise CircuitOpenError(self.host, pause)
+        self.check_circuit()
+        try:
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.bucket.acquire()
+        except BaseException:
+            self.probing = False
+            raise
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        self.state = "closed"
+        # Creep back towards the configured rate after a throttle
+        if self.bucket.rate < self.configured_rate:
+            self.bucket.rate = min(self.configured_rate, self.bucket.rate * 1.1)
+
+    def record_throttled(self):
+        self.probing = False
+        self.bucket.rate = max(self.configured_rate / 16, self.bucket.rate / 2)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            print(f"[governor] Circuit opened for {self.host} after {self.failures} failures")
+        self.probing = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rate": round(self.bucket.rate, 3),
+            "configured_rate": self.configured_rate,
+            "tokens": self.bucket.stats()["tokens"],
+            "paused_for": round(max(self.paused_until - time.monotonic(), 0.0), 1),
+        }
+
+
+class Governor:
+    def __init__(self):
+        self.default_rate = float(os.getenv("GOVERNOR_DEFAULT_RATE", 10))
+        self.default_burst = float(os.getenv("GOVERNOR_DEFAULT_BURST", 20))
+        self.retries = int(os.getenv("GOVERNOR_RETRIES", 2))
+        self.backoff_base = float(os.getenv("GOVERNOR_BACKOFF_BASE", 0.5))
+        self.max_wait = float(os.getenv("GOVERNOR_MAX_WAIT", 10))
+        self.failure_threshold = int(os.getenv("GOVERNOR_FAILURE_THRESHOLD", 5))
+        self.open_seconds = float(os.getenv("GOVERNOR_OPEN_SECONDS", 30))
+        self.max_hosts = int(os.getenv("GOVERNOR_MAX_HOSTS", 10000))
+        self.rates = dict(UPSTREAM_RATES, **parse_rates(os.getenv("GOVERNOR_RATES", "")))
+        self.hosts = {}
+
+    def host(self, host):
+        governor = self.hosts.get(host)
+        if governor is None:
+            rate, burst = self.rates.get(host, (self.default_rate, self.default_burst))
+            governor = self.hosts[host] = HostGovernor(host, rate, burst or rate, self.failure_threshold, self.open_seconds, self.max_wait)
+            if len(self.hosts) > self.max_hosts:
+                self.trim()
+        return governor
+
+    def trim(self):
+        # Forget the oldest healthy hosts, anything throttled or failing keeps its state
+        now = time.monotonic()
+        for host in list(self.hosts):
+            if len(self.hosts) <= self.max_hosts * 0.9:
+                break
+            governor = self.hosts[host]
+            if governor.state == "closed" and not governor.failures and governor.paused_until < now and governor.bucket.rate == governor.configured_rate:
+                del self.hosts[host]
+
+    def label(self, host):
+        # Every scanned website would become its own metric series, only configured upstreams are labelled by name
+        return host if host in self.rates else "other"
+
+    def backoff(self, attempt):
+        # Full jitter keeps retries from many commands from arriving in lockstep
+        return random.uniform(0, min(self.max_wait, self.backoff_base * 2 ** attempt))
+
+    async def send(self, host, send):
+        governor = self.host(host)
+        attempt = 0
+        while True:
+            try:
+                await governor.acquire()
+            except CircuitOpenError:
+                metrics.upstream_rejected.inc(self.label(host))
+                raise
+
+            try:
+                response = await send()
+            except asyncio.TimeoutError:
+                # Timeouts are not retried, the caller's deadline is usually spent already
+                governor.record_failure()
+                raise
+            except aiohttp.ClientConnectionError:
+                governor.record_failure()
+                if attempt >= self.retries or governor.state == "open":
+                    raise
+                wait = self.backoff(attempt)
+            except BaseException:
+                governor.probing = False
+                raise
+            else:
+                if response.status not in RETRY_STATUSES:
+                    governor.record_success()
+                    return response
+
+                wait = parse_rate_limit_wait(response.headers)
+                if response.status == 429:
+                    metrics.upstream_throttled.inc(self.label(host))
+                    governor.record_throttled()
+                else:
+                    governor.record_failure()
+                if wait:
+                    governor.pause(wait)
+
+                # Hand the response back when retrying is pointless or would wait too long
+                if attempt >= self.retries or governor.state == "open" or (wait or 0) > self.max_wait:
+                    return response
+                response.release()
+                wait = wait if wait is not None else self.backoff(attempt)
+
+            attempt += 1
+            metrics.upstream_retries.inc(self.label(host))
+            await asyncio.sleep(wait)
+
+    def stats(self):
+        return {host: governor.stats() for host, governor in self.hosts.items()}
+
+
+class GovernedRequest:
+    def __init__(self, governor, host, send):
+        self.governor = governor
+        self.host = host
+        self.send = send
+        self.response = None
+
+    async def __aenter__(self):
+        self.response = await self.governor.send(self.host, self.send)
+        return self.response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.response.release()
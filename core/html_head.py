@@ -0,0 +1,139 @@
+import json
+from html.parser import HTMLParser
+
+HEADINGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+# Tags that only appear in the body, for pages that never close their head explicitly
+BODY_TAGS = {"body", "div", "main", "header", "section", "article", "nav", "p", "ul", "table", "form"} | set(HEADINGS)
+
+
+class HeadParser(HTMLParser):
+    # Incremental parser fed with decoded chunks while the page downloads. Everything in the
+    # head is collected; after the head only body_budget characters are parsed (for headings
+    # and microdata), then done turns true so the caller can stop reading the response.
+    def __init__(self, body_budget=65536):
+        super().__init__(convert_charrefs=True)
+        self.body_budget = body_budget
+        self.body_seen = 0
+        self.head_closed = False
+
+        self.lang = None
+        self.charset = None
+        self.title = None
+        self.meta = {}
+        self.canonical = None
+        self.hreflang = {}
+        self.links = {}
+        self.headings = {heading: [] for heading in HEADINGS}
+        self.structured_data = []
+        self.microdata = []
+        self.errors = []
+
+        self.capture = None
+        self.captured = []
+
+    @property
+    def done(self):
+        return self.head_closed and self.body_seen >= self.body_budget
+
+    def feed(self, data):
+        super().feed(data)
+        if self.head_closed:
+            self.body_seen += len(data)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or "" for name, value in attrs}
+
+        if tag in BODY_TAGS:
+            self.head_closed = True
+
+        if "itemtype" in attrs:
+            self.microdata.append(attrs["itemtype"].rstrip("/").rsplit("/", 1)[-1])
+
+        if tag == "html":
+            self.lang = attrs.get("lang") or self.lang
+        elif tag == "meta":
+            self.handle_meta(attrs)
+        elif tag == "link":
+            self.handle_link(attrs)
+        elif tag == "title" and self.title is None:
+            self.start_capture(tag)
+        elif tag in HEADINGS:
+            self.start_capture(tag)
+        elif tag == "script" and attrs.get("type", "").lower() == "application/ld+json":
+            self.start_capture(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.head_closed = True
+        if self.capture == tag:
+            self.finish_capture()
+
+    def handle_data(self, data):
+        if self.capture:
+            self.captured.append(data)
+
+    def handle_meta(self, attrs):
+        if "charset" in attrs:
+            self.charset = attrs["charset"]
+        key = (attrs.get("name") or attrs.get("property") or attrs.get("http-equiv") or "").lower()
+        if key and "content" in attrs:
+            self.meta.setdefault(key, attrs["content"].strip())
+
+    def handle_link(self, attrs):
+        href = attrs.get("href")
+        if not href:
+            return
+        for rel in attrs.get("rel", "").lower().split():
+            if rel == "canonical":
+                self.canonical = self.canonical or href
+            elif rel == "alternate" and attrs.get("hreflang"):
+                self.hreflang[attrs["hreflang"]] = href
+            else:
+                self.links.setdefault(rel, href)
+
+    def start_capture(self, tag):
+        if self.capture:
+            self.finish_capture()
+        self.capture = tag
+        self.captured = []
+
+    def finish_capture(self):
+        text = "".join(self.captured)
+        tag = self.capture
+        self.capture = None
+        self.captured = []
+
+        if tag == "title":
+            self.title = " ".join(text.split())
+        elif tag in HEADINGS:
+            self.headings[tag].append(" ".join(text.split()))
+        elif tag == "script":
+            self.handle_structured_data(text)
+
+    def handle_structured_data(self, text):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            self.errors.append("Invalid JSON-LD block")
+            return
+
+        items = data if isinstance(data, list) else [data]
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            graph = item.get("@graph")
+            if isinstance(graph, list):
+                items.extend(entry for entry in graph if isinstance(entry, dict))
+            types = item.get("@type")
+            # Valid JSON is not always valid JSON-LD, only string types are reported
+            for type_name in types if isinstance(types, list) else [types]:
+                if isinstance(type_name, str) and type_name and type_name not in self.structured_data:
+                    self.structured_data.append(type_name)
+
+    def close(self):
+        super().close()
+        if self.capture:
+            self.finish_capture()
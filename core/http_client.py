@@ -0,0 +1,154 @@
+import aiohttp
+import os
+import time
+from yarl import URL
+from core.dns_resolver import AiohttpResolver
+from core.governor import GovernedRequest, Governor
+from core import metrics
+
+
+class HttpClient:
+    def __init__(self):
+        self.limit = int(os.getenv("HTTP_POOL_LIMIT", 100))
+        self.limit_per_host = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 10))
+        self.keepalive_timeout = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+        self.dns_cache_ttl = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+        self.session = None
+        self.connector = None
+        self.dns_resolver = None
+        self.governor = Governor()
+        # host -> base URL, "*" matches every host. Used to point the bot at local stand-in upstreams
+        self.upstream_overrides = {}
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.requests = 0
+
+    def create_resolver(self):
+        if self.dns_resolver:
+            return AiohttpResolver(self.dns_resolver)
+        try:
+            return aiohttp.AsyncResolver()
+        except Exception:
+            # aiodns is not installed, fall back to the threaded resolver
+            return aiohttp.ThreadedResolver()
+
+    def create_trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+
+        def marker(phase):
+            async def mark(session, context, params):
+                timings = context.trace_request_ctx
+                if hasattr(timings, "mark"):
+                    timings.mark(phase)
+            return mark
+
+        async def on_request_start(session, context, params):
+            self.requests += 1
+            context.started_at = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            metrics.upstream_duration.observe(time.perf_counter() - context.started_at, self.governor.label(params.url.host), params.response.status)
+
+        async def on_request_exception(session, context, params):
+            metrics.upstream_duration.observe(time.perf_counter() - context.started_at, self.governor.label(params.url.host), "error")
+
+        async def on_response_chunk_received(session, context, params):
+            metrics.record_bytes(self.governor.label(params.url.host), len(params.chunk))
+
+        async def on_connection_create_end(session, context, params):
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.connections_reused += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_response_chunk_received.append(on_response_chunk_received)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+        # Requests passing a RequestTimings as trace_request_ctx get their phases recorded
+        trace_config.on_request_start.append(marker("request_start"))
+        trace_config.on_dns_resolvehost_start.append(marker("dns_start"))
+        trace_config.on_dns_resolvehost_end.append(marker("dns_end"))
+        trace_config.on_connection_create_start.append(marker("connect_start"))
+        trace_config.on_connection_create_end.append(marker("connect_end"))
+        trace_config.on_request_headers_sent.append(marker("headers_sent"))
+        trace_config.on_request_end.append(marker("headers_received"))
+        return trace_config
+
+    async def start(self):
+        if self.session and not self.session.closed:
+            return
+
+        # Keep-alive connections are reused for sequential requests to the same host,
+        # which is what HTTP/1.1 pipelining-friendly clients rely on.
+        self.connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+            resolver=self.create_resolver(),
+        )
+        self.session = self.create_session(self.connector)
+
+    def create_session(self, connector):
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=15, connect=5),
+            headers={"User-Agent": "MuffinBot (+https://github.com/lytexdev/muffin-bot)"},
+            trace_configs=[self.create_trace_config()],
+        )
+
+    def create_cold_session(self):
+        # Never keeps a connection, so every request on it pays for DNS, TCP and TLS again
+        return self.create_session(aiohttp.TCPConnector(force_close=True, resolver=self.create_resolver()))
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self.connector = None
+
+    def get(self, url, session=None, **kwargs):
+        if not self.session or self.session.closed:
+            raise RuntimeError("HTTP client is not started")
+        # Rate limits and circuits belong to the real upstream, not to an override
+        host = URL(url).host
+        if self.upstream_overrides:
+            url, kwargs = self.override_upstream(url, kwargs)
+        session = session or self.session
+        return GovernedRequest(self.governor, host, lambda: session.get(url, **kwargs))
+
+    def override_upstream(self, url, kwargs):
+        url = URL(url)
+        base = self.upstream_overrides.get(url.host) or self.upstream_overrides.get("*")
+        if not base:
+            return url, kwargs
+
+        base = URL(base)
+        headers = dict(kwargs.get("headers") or {})
+        headers["Host"] = url.host
+        return url.with_scheme(base.scheme).with_host(base.host).with_port(base.port), dict(kwargs, headers=headers)
+
+    def stats(self):
+        idle = 0
+        active = 0
+        if self.connector and not self.connector.closed:
+            idle = sum(len(conns) for conns in getattr(self.connector, "_conns", {}).values())
+            active = len(getattr(self.connector, "_acquired", ()))
+
+        total_connections = self.connections_created + self.connections_reused
+        return {
+            "open": idle + active,
+            "active": active,
+            "idle": idle,
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_ratio": self.connections_reused / total_connections if total_connections else 0.0,
+        }
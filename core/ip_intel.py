@@ -0,0 +1,543 @@
+import asyncio
+import bisect
+import csv
+import gzip
+import io
+import ipaddress
+import itertools
+import json
+import mmap
+import os
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from struct import Struct
+
+MMDB_MARKER = b"\xab\xcd\xefMaxMind.com"
+# Compiled CSV layout: header, record blob, then non-overlapping ranges sorted by start
+RANGES_MAGIC = b"MUFIPR01"
+RANGES_HEADER = Struct("!8sQQQ")
+RANGE = Struct("!16s16sIB")
+# Every 64th range start is kept in memory, a search touches the map only inside one block
+SPARSE_STEP = 64
+IPV4_MAPPED = 0xFFFF << 32
+
+COLUMNS = {
+    "network": ("network", "cidr", "prefix", "ip_network"),
+    "start": ("start_ip", "range_start", "ip_start", "first_ip", "start", "ip_from"),
+    "end": ("end_ip", "range_end", "ip_end", "last_ip", "end", "ip_to"),
+    "country": ("country", "country_code", "country_iso_code", "cc"),
+    "region": ("region", "subdivision", "subdivision_1_name", "state"),
+    "city": ("city", "city_name"),
+    "asn": ("asn", "as_number", "autonomous_system_number"),
+    "org": ("org", "as_name", "organization", "autonomous_system_organization", "as_description", "isp"),
+}
+
+
+class DatasetError(ValueError):
+    pass
+
+
+def ip_to_int(value):
+    # One 128 bit space for both families, IPv4 lives in ::ffff:0:0/96
+    value = str(value)
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, value), "big") | IPV4_MAPPED
+    except OSError:
+        return int(ipaddress.IPv6Address(value))
+
+
+def english_name(value):
+    # GeoLite2 and DB-IP nest localized names, CSV datasets have plain strings
+    return value.get("names", {}).get("en") if isinstance(value, dict) else value
+
+
+def normalize_record(record):
+    # Flattens the shapes of GeoLite2, DB-IP, IPinfo and CSV datasets into the fields /checkip shows
+    if not isinstance(record, dict):
+        return {}
+    country = record.get("country")
+    result = {
+        "country": country.get("iso_code") if isinstance(country, dict) else country or record.get("country_code"),
+        "city": english_name(record.get("city")),
+        "region": english_name((record.get("subdivisions") or [None])[0]) or record.get("region"),
+        "asn": record.get("autonomous_system_number") or record.get("asn"),
+        "org": record.get("autonomous_system_organization") or record.get("as_name") or record.get("org"),
+    }
+    location = record.get("location")
+    if isinstance(location, dict) and "latitude" in location:
+        result["location"] = f"{location['latitude']},{location['longitude']}"
+    if isinstance(result["asn"], str) and result["asn"].upper().startswith("AS"):
+        result["asn"] = result["asn"][2:]
+    if result["asn"] not in (None, ""):
+        try:
+            result["asn"] = int(result["asn"])
+        except (TypeError, ValueError):
+            result["asn"] = None
+    return {key: value for key, value in result.items() if value not in (None, "", 0)}
+
+
+class MmdbReader:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        marker = self.map.rfind(MMDB_MARKER, max(len(self.map) - 128 * 1024, 0))
+        if marker < 0:
+            self.close()
+            raise DatasetError(f"{path} is not a MaxMind DB file")
+
+        self.data_start = marker + len(MMDB_MARKER)
+        self.metadata, _ = self.decode(0)
+        self.node_count = self.metadata["node_count"]
+        self.record_size = self.metadata["record_size"]
+        if self.record_size not in (24, 28, 32):
+            self.close()
+            raise DatasetError(f"Unsupported record size {self.record_size}")
+        self.node_size = self.record_size // 4
+        self.ip_version = self.metadata["ip_version"]
+        self.data_start = self.node_count * self.node_size + 16
+        self.cache = {}
+
+        # IPv4 addresses sit below 96 zero bits in an IPv6 tree, walk them once
+        self.ipv4_start = 0
+        if self.ip_version == 6:
+            for _ in range(96):
+                if self.ipv4_start >= self.node_count:
+                    break
+                self.ipv4_start = self.read_node(self.ipv4_start, 0)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    @property
+    def description(self):
+        return self.metadata.get("database_type", "MMDB")
+
+    def read_node(self, node, bit):
+        offset = node * self.node_size
+        data = self.map
+        if self.record_size == 24:
+            offset += bit * 3
+            return (data[offset] << 16) | (data[offset + 1] << 8) | data[offset + 2]
+        if self.record_size == 28:
+            if bit:
+                return ((data[offset + 3] & 0x0F) << 24) | (data[offset + 4] << 16) | (data[offset + 5] << 8) | data[offset + 6]
+            return ((data[offset + 3] & 0xF0) << 20) | (data[offset] << 16) | (data[offset + 1] << 8) | data[offset + 2]
+        return struct.unpack_from("!I", data, offset + bit * 4)[0]
+
+    def lookup(self, value):
+        address = ipaddress.ip_address(value)
+        if address.version == 6 and self.ip_version == 4:
+            return None, None
+        bits = 32 if address.version == 4 else 128
+        number = int(address)
+        node = self.ipv4_start if address.version == 4 else 0
+
+        depth = 0
+        while depth < bits and node < self.node_count:
+            node = self.read_node(node, (number >> (bits - 1 - depth)) & 1)
+            depth += 1
+        if node <= self.node_count:
+            return None, None
+        # Many networks share one record, decoded records are cached by their offset
+        offset = node - self.node_count - 16
+        record = self.cache.get(offset)
+        if record is None:
+            record = self.cache[offset] = self.decode(offset)[0]
+            if len(self.cache) > 100000:
+                self.cache.clear()
+        return record, f"{ipaddress.ip_network((address, depth), strict=False)}"
+
+    def decode(self, offset):
+        data = self.map
+        start = self.data_start
+        control = data[start + offset]
+        offset += 1
+        kind = control >> 5
+
+        if kind == 1:
+            size = (control >> 3) & 0x3
+            value = control & 0x7
+            if size == 3:
+                pointer = int.from_bytes(data[start + offset:start + offset + 4], "big")
+            else:
+                pointer = (value << (8 * (size + 1))) | int.from_bytes(data[start + offset:start + offset + size + 1], "big")
+                pointer += (0, 2048, 526336)[size]
+            return self.decode(pointer)[0], offset + size + 1
+
+        if kind == 0:
+            kind = 7 + data[start + offset]
+            offset += 1
+        size = control & 0x1F
+        if size >= 29:
+            extra = size - 28
+            size = (29, 285, 65821)[extra - 1] + int.from_bytes(data[start + offset:start + offset + extra], "big")
+            offset += extra
+
+        if kind == 2:
+            return data[start + offset:start + offset + size].decode("utf-8", "replace"), offset + size
+        if kind == 3:
+            return struct.unpack_from("!d", data, start + offset)[0], offset + size
+        if kind == 4:
+            return bytes(data[start + offset:start + offset + size]), offset + size
+        if kind in (5, 6, 9, 10):
+            return int.from_bytes(data[start + offset:start + offset + size], "big"), offset + size
+        if kind == 7:
+            record = {}
+            for _ in range(size):
+                key, offset = self.decode(offset)
+                record[key], offset = self.decode(offset)
+            return record, offset
+        if kind == 8:
+            return int.from_bytes(data[start + offset:start + offset + size].rjust(4, b"\x00"), "big", signed=True), offset + size
+        if kind == 11:
+            values = []
+            for _ in range(size):
+                value, offset = self.decode(offset)
+                values.append(value)
+            return values, offset
+        if kind == 14:
+            return bool(size), offset
+        if kind == 15:
+            return struct.unpack_from("!f", data, start + offset)[0], offset + size
+        raise DatasetError(f"Unsupported MMDB data type {kind}")
+
+
+class RangeStarts:
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return self.table.count
+
+    def __getitem__(self, index):
+        offset = self.table.ranges_offset + index * RANGE.size
+        return self.table.map[offset:offset + 16]
+
+
+class RangeTable:
+    def __init__(self, path, description):
+        self.path = path
+        self.description = description
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.blob_offset, self.ranges_offset = RANGES_HEADER.unpack_from(self.map, 0)
+        if magic != RANGES_MAGIC or self.ranges_offset + self.count * RANGE.size > len(self.map):
+            self.close()
+            raise DatasetError(f"{path} is not a compiled IP range table")
+        self.starts = RangeStarts(self)
+        self.sparse = [self.starts[index] for index in range(0, self.count, SPARSE_STEP)]
+        self.cache = {}
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def find(self, key, lo=0):
+        block = bisect.bisect_right(self.sparse, key, lo // SPARSE_STEP) - 1
+        if block < 0:
+            return -1
+        first = block * SPARSE_STEP
+        return bisect.bisect_right(self.starts, key, max(first, lo), min(first + SPARSE_STEP, self.count)) - 1
+
+    def describe(self, key, index):
+        start, end, _, prefix = RANGE.unpack_from(self.map, self.ranges_offset + index * RANGE.size)
+        if prefix:
+            # The announced prefix, flattening may have split it around more specific ones
+            start = int.from_bytes(key, "big") >> (128 - prefix) << (128 - prefix)
+            end = start | ((1 << (128 - prefix)) - 1)
+            return describe_range(start, end)
+        return describe_range(int.from_bytes(start, "big"), int.from_bytes(end, "big"))
+
+    def decode(self, offset):
+        record = self.cache.get(offset)
+        if record is None:
+            length = struct.unpack_from("!I", self.map, self.blob_offset + offset)[0]
+            position = self.blob_offset + offset + 4
+            record = self.cache[offset] = json.loads(self.map[position:position + length])
+        return record
+
+    def lookup(self, value):
+        key = ip_to_int(value).to_bytes(16, "big")
+        index = self.find(key)
+        if index < 0:
+            return None, None
+        _, end, offset, _ = RANGE.unpack_from(self.map, self.ranges_offset + index * RANGE.size)
+        if key > end:
+            return None, None
+        return self.decode(offset), self.describe(key, index)
+
+    def lookup_sorted(self, keys):
+        # Keys arrive sorted, each search starts where the previous one ended
+        results = []
+        lo = 0
+        for key in keys:
+            index = self.find(key, lo)
+            if index < 0:
+                results.append(None)
+                continue
+            lo = index
+            _, end, offset, _ = RANGE.unpack_from(self.map, self.ranges_offset + index * RANGE.size)
+            results.append(self.decode(offset) if key <= end else None)
+        return results
+
+
+def int_to_ip(value):
+    if value >> 32 == 0xFFFF:
+        return ipaddress.IPv4Address(value & 0xFFFFFFFF)
+    return ipaddress.IPv6Address(value)
+
+
+def cidr_prefix(start, end):
+    size = end - start + 1
+    if size & (size - 1) or start % size:
+        return 0
+    return 129 - size.bit_length()
+
+
+def describe_range(start, end):
+    # Ranges that are not a single CIDR are shown as first - last
+    prefix = cidr_prefix(start, end)
+    if not prefix:
+        return f"{int_to_ip(start)} - {int_to_ip(end)}"
+    return f"{int_to_ip(start)}/{prefix - 96 if start >> 32 == 0xFFFF and prefix >= 96 else prefix}"
+
+
+def open_text(path):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", errors="replace", newline="")
+    return open(path, encoding="utf-8", errors="replace", newline="")
+
+
+def read_ranges(path):
+    with open_text(path) as file:
+        sample = file.read(4096)
+        file.seek(0)
+        dialect = csv.excel_tab if "\t" in sample.split("\n", 1)[0] else csv.excel
+        rows = csv.reader(file, dialect)
+        first = next(rows, None)
+        if first is None:
+            return
+
+        header = [cell.strip().lower() for cell in first]
+        columns = {field: next((header.index(name) for name in names if name in header), None) for field, names in COLUMNS.items()}
+        if columns["network"] is None and columns["start"] is None:
+            # Headerless ip2asn style: start, end, asn, country, org
+            columns = {"start": 0, "end": 1, "asn": 2, "country": 3, "org": 4}
+            rows = itertools.chain([first], rows)
+
+        for row in rows:
+            try:
+                if columns.get("network") is not None:
+                    network = ipaddress.ip_network(row[columns["network"]].strip(), strict=False)
+                    start = ip_to_int(network.network_address)
+                    end = start | ((1 << (network.max_prefixlen - network.prefixlen)) - 1)
+                else:
+                    start, end = ip_to_int(row[columns["start"]].strip()), ip_to_int(row[columns["end"]].strip())
+            except (ValueError, IndexError):
+                continue
+            record = {field: row[index].strip() for field, index in columns.items() if field not in ("network", "start", "end") and index is not None and index < len(row) and row[index].strip()}
+            if record.get("asn") in ("0", "") or record.get("org") == "Not routed":
+                continue
+            yield start, end, normalize_record(record)
+
+
+def flatten_ranges(ranges):
+    # Nested ranges are split so the most specific one owns its addresses, the result never overlaps.
+    # A range reaching past the one it starts in keeps its tail, entries it outlives are skipped when popped.
+    stack = []
+    position = None
+    for start, end, record in sorted(ranges, key=lambda item: (item[0], -item[1])):
+        while stack and stack[-1][0] < start:
+            top_end, top_record = stack.pop()
+            if position <= top_end:
+                yield position, top_end, top_record
+                position = top_end + 1
+        if stack and position < start:
+            yield position, start - 1, stack[-1][1]
+        stack.append((end, record))
+        position = start
+    while stack:
+        top_end, top_record = stack.pop()
+        if position <= top_end:
+            yield position, top_end, top_record
+            position = top_end + 1
+
+
+def compile_ranges(source, target):
+    records = {}
+    blob = io.BytesIO()
+
+    def parsed():
+        # Records are stored once, ranges only carry their offset and the prefix they came from
+        for start, end, record in read_ranges(source):
+            encoded = json.dumps(record, sort_keys=True).encode()
+            offset = records.get(encoded)
+            if offset is None:
+                offset = records[encoded] = blob.tell()
+                blob.write(struct.pack("!I", len(encoded)) + encoded)
+            yield start, end, (offset, cidr_prefix(start, end))
+
+    ranges = []
+    for start, end, (offset, prefix) in flatten_ranges(parsed()):
+        # Adjacent plain ranges with the same record are merged, ip2asn dumps are full of them
+        if ranges and not prefix and ranges[-1][2:] == (offset, 0) and ranges[-1][1] + 1 == start:
+            ranges[-1] = (ranges[-1][0], end, offset, 0)
+        else:
+            ranges.append((start, end, offset, prefix))
+
+    blob_data = blob.getvalue()
+    with open(f"{target}.tmp", "wb", buffering=1 << 20) as output:
+        output.write(RANGES_HEADER.pack(RANGES_MAGIC, len(ranges), RANGES_HEADER.size, RANGES_HEADER.size + len(blob_data)))
+        output.write(blob_data)
+        for start, end, offset, prefix in ranges:
+            output.write(RANGE.pack(start.to_bytes(16, "big"), end.to_bytes(16, "big"), offset, prefix))
+    os.replace(f"{target}.tmp", target)
+    return len(ranges)
+
+
+class IpIntel:
+    def __init__(self, paths=None, cache_dir=None):
+        configured = os.getenv("IP_INTEL_PATHS", "") if paths is None else paths
+        self.paths = [path.strip() for path in configured.split(",") if path.strip()]
+        self.cache_dir = cache_dir or os.path.join(os.getenv("DATA_DIR", "data"), "ip_intel")
+        self.reload_interval = float(os.getenv("IP_INTEL_RELOAD_INTERVAL", 60))
+        self.datasets = {}
+        self.versions = {}
+        self.task = None
+        # CSV datasets are compiled off the event loop, a large ASN dump takes a few seconds
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="muffin-ip-intel")
+        self.counters = {"lookups": 0, "hits": 0, "reloads": 0, "reload_failures": 0}
+
+    @property
+    def loaded(self):
+        return bool(self.datasets)
+
+    async def start(self):
+        if not self.paths:
+            return
+        await self.reload()
+        self.task = asyncio.create_task(self.watch())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for dataset in self.datasets.values():
+            dataset.close()
+        self.datasets = {}
+        self.executor.shutdown(wait=True)
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                print(f"IP intel reload failed: {e}")
+
+    async def reload(self):
+        for path in self.paths:
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            version = (status.st_ino, status.st_mtime_ns, status.st_size)
+            if self.versions.get(path) == version:
+                continue
+            try:
+                dataset = await asyncio.get_running_loop().run_in_executor(self.executor, self.open_dataset, path)
+            except (OSError, ValueError) as e:
+                self.counters["reload_failures"] += 1
+                print(f"Could not load IP dataset {path}: {e}")
+                continue
+
+            # Lookups never see a half loaded dataset, the old one is closed after the swap
+            previous = self.datasets.get(path)
+            self.datasets[path] = dataset
+            self.versions[path] = version
+            if previous:
+                previous.close()
+            self.counters["reloads"] += 1
+            print(f"Loaded IP dataset {path} ({dataset.description})")
+
+    def open_dataset(self, path):
+        if path.endswith(".mmdb"):
+            return MmdbReader(path)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        compiled = os.path.join(self.cache_dir, os.path.basename(path) + ".ranges")
+        if not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(path):
+            started_at = time.perf_counter()
+            count = compile_ranges(path, compiled)
+            print(f"Compiled {count:,} ranges from {path} in {time.perf_counter() - started_at:.1f}s")
+        return RangeTable(compiled, os.path.basename(path))
+
+    def lookup(self, ip):
+        self.counters["lookups"] += 1
+        result = {}
+        # Datasets are merged in configured order, e.g. a city database and an ASN database
+        for dataset in self.datasets.values():
+            record, network = dataset.lookup(ip)
+            if record:
+                for key, value in normalize_record(record).items():
+                    result.setdefault(key, value)
+                result.setdefault("network", network)
+        if not result:
+            return None
+        self.counters["hits"] += 1
+        return result
+
+    def lookup_many(self, ips):
+        # Bulk annotation, duplicates are looked up once and range tables walk the sorted keys in one pass
+        unique = {}
+        for ip in ips:
+            if ip in unique:
+                continue
+            try:
+                unique[ip] = ip_to_int(ip).to_bytes(16, "big")
+            except ValueError:
+                continue
+        if not self.datasets:
+            return dict.fromkeys(unique)
+
+        keys = sorted((key, ip) for ip, key in unique.items())
+        merged = {ip: {} for _, ip in keys}
+        for dataset in self.datasets.values():
+            if isinstance(dataset, RangeTable):
+                records = dataset.lookup_sorted([key for key, _ in keys])
+            else:
+                records = [dataset.lookup(ip)[0] for _, ip in keys]
+            # Range tables hold normalized records already, MMDB records are normalized once per record
+            normalized = {}
+            for (_, ip), record in zip(keys, records):
+                if record:
+                    if not isinstance(dataset, RangeTable):
+                        if id(record) not in normalized:
+                            normalized[id(record)] = normalize_record(record)
+                        record = normalized[id(record)]
+                    for key, value in record.items():
+                        merged[ip].setdefault(key, value)
+        self.counters["lookups"] += len(keys)
+        self.counters["hits"] += sum(1 for record in merged.values() if record)
+        return {ip: record or None for ip, record in merged.items()}
+
+    def stats(self):
+        return dict(self.counters, datasets=len(self.datasets))
+
+
+def describe_network(record):
+    if not record:
+        return None
+    parts = []
+    if record.get("asn"):
+        parts.append(f"AS{record['asn']}" + (f" {record['org']}" if record.get("org") else ""))
+    elif record.get("org"):
+        parts.append(record["org"])
+    if record.get("country"):
+        parts.append(record["country"])
+    return " · ".join(parts) or None
@@ -0,0 +1,247 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+
+import discord
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+current_command = contextvars.ContextVar("current_command", default=None)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][index] += 1
+                break
+        series["sum"] += value
+        series["count"] += 1
+
+    def quantile(self, q, *labels):
+        series = self.series.get(labels)
+        if not series or not series["count"]:
+            return None
+
+        # Linear interpolation inside the bucket that holds the requested rank
+        rank = q * series["count"]
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, series["buckets"]):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["buckets"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), labels + ('+Inf',))} {series['count']}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {series['sum']}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def counter(self, name, description, labels=()):
+        return self.metrics.setdefault(name, Counter(name, description, labels))
+
+    def histogram(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, description, labels, buckets))
+
+    def add_collector(self, collector):
+        # Collectors return (name, description, labels dict, value) tuples rendered as gauges
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+
+        gauges = {}
+        for collector in self.collectors:
+            try:
+                samples = collector()
+            except Exception:
+                continue
+            for name, description, labels, value in samples:
+                gauges.setdefault(name, (description, []))[1].append((labels, value))
+
+        for name, (description, samples) in gauges.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+command_duration = registry.histogram("muffin_command_duration_seconds", "Total slash command handler time", ("command", "outcome"))
+command_defer = registry.histogram("muffin_command_defer_seconds", "Time from handler start until the interaction was deferred", ("command",))
+command_bytes = registry.histogram("muffin_command_upstream_bytes", "Bytes fetched from upstreams per command", ("command",), SIZE_BUCKETS)
+commands_total = registry.counter("muffin_commands_total", "Slash command invocations", ("command", "outcome"))
+upstream_duration = registry.histogram("muffin_upstream_request_seconds", "Outbound HTTP request latency until headers", ("host", "status"))
+upstream_bytes = registry.counter("muffin_upstream_bytes_total", "Bytes received from outbound HTTP requests", ("host",))
+upstream_retries = registry.counter("muffin_upstream_retries_total", "Outbound HTTP requests retried by the governor", ("host",))
+upstream_throttled = registry.counter("muffin_upstream_throttled_total", "Outbound HTTP requests answered with 429", ("host",))
+upstream_rejected = registry.counter("muffin_upstream_rejected_total", "Outbound HTTP requests failed fast by an open circuit", ("host",))
+probe_duration = registry.histogram("muffin_probe_duration_seconds", "Latency of individual command probes", ("probe", "outcome"))
+
+
+class CommandRecord:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.deferred_at = None
+        self.bytes = 0
+
+
+def record_bytes(host, amount):
+    upstream_bytes.inc(host, amount=amount)
+    record = current_command.get()
+    if record:
+        record.bytes += amount
+
+
+def install_defer_timer():
+    original_defer = discord.InteractionResponse.defer
+    if getattr(original_defer, "muffin_timed", False):
+        return
+
+    @functools.wraps(original_defer)
+    async def timed_defer(response, *args, **kwargs):
+        result = await original_defer(response, *args, **kwargs)
+        record = current_command.get()
+        if record and record.deferred_at is None:
+            record.deferred_at = time.perf_counter()
+        return result
+
+    timed_defer.muffin_timed = True
+    discord.InteractionResponse.defer = timed_defer
+
+
+def instrument_command(command):
+    callback = command._callback
+    if getattr(callback, "muffin_instrumented", False):
+        return
+
+    @functools.wraps(callback)
+    async def instrumented(*args, **kwargs):
+        record = CommandRecord(command.qualified_name)
+        token = current_command.set(record)
+        outcome = "success"
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            current_command.reset(token)
+            command_duration.observe(time.perf_counter() - record.started_at, record.name, outcome)
+            commands_total.inc(record.name, outcome)
+            command_bytes.observe(record.bytes, record.name)
+            if record.deferred_at is not None:
+                command_defer.observe(record.deferred_at - record.started_at, record.name)
+
+    instrumented.muffin_instrumented = True
+    command._callback = instrumented
+
+
+def instrument_tree(tree):
+    install_defer_timer()
+    for command in tree.walk_commands():
+        if isinstance(command, discord.app_commands.Command):
+            instrument_command(command)
+
+
+class MetricsServer:
+    def __init__(self, metrics=registry):
+        self.metrics = metrics
+        self.host = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.port = int(os.getenv("METRICS_PORT", 9464))
+        self.log_interval = float(os.getenv("METRICS_LOG_INTERVAL", 0))
+        self.runner = None
+        self.log_task = None
+
+    async def start(self):
+        if self.port:
+            # aiohttp.web is only needed for the endpoint, shard processes with metrics disabled skip the import
+            from aiohttp import web
+
+            app = web.Application()
+            app.router.add_get("/metrics", self.handle_metrics)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, self.host, self.port).start()
+            print(f"Metrics available on http://{self.host}:{self.port}/metrics")
+
+        if self.log_interval:
+            self.log_task = asyncio.create_task(self.log_summaries())
+
+    async def close(self):
+        if self.log_task:
+            self.log_task.cancel()
+            await asyncio.gather(self.log_task, return_exceptions=True)
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def log_summaries(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            for labels, series in list(command_duration.series.items()):
+                p50 = command_duration.quantile(0.5, *labels)
+                p99 = command_duration.quantile(0.99, *labels)
+                print(f"[metrics] /{labels[0]} ({labels[1]}): {series['count']} calls, p50 {p50:.2f}s, p99 {p99:.2f}s")
@@ -0,0 +1,121 @@
+import codecs
+import os
+import time
+from datetime import datetime
+
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", 2 * 1024 * 1024))
+CHUNK_SIZE = 16384
+
+
+class RequestTimings:
+    def __init__(self):
+        self.marks = {}
+
+    def mark(self, phase):
+        self.marks[phase] = time.perf_counter()
+
+    def between(self, start, end):
+        if start in self.marks and end in self.marks:
+            return max(self.marks[end] - self.marks[start], 0.0)
+        return None
+
+    def phases(self):
+        return {
+            "dns": self.between("dns_start", "dns_end"),
+            "connect": self.between("connect_start", "connect_end"),
+            "ttfb": self.between("headers_sent", "headers_received"),
+            "download": self.between("headers_received", "body_received"),
+            "headers": self.between("request_start", "headers_received"),
+            "total": self.between("request_start", "body_received"),
+        }
+
+
+class PageSnapshot:
+    def __init__(self, url):
+        self.url = url
+        self.final_url = url
+        self.redirected = False
+        self.status = None
+        self.headers = {}
+        self.body = b""
+        self.text = ""
+        self.timings = {}
+        self.tls = None
+        self.truncated = False
+        self.error = None
+
+    @classmethod
+    def unavailable(cls, url, error="Timed out"):
+        snapshot = cls(url)
+        snapshot.error = error
+        snapshot.timings = RequestTimings().phases()
+        return snapshot
+
+    @property
+    def ok(self):
+        return self.error is None and self.status == 200
+
+
+def read_tls_info(response):
+    connection = response.connection
+    if connection is None or connection.transport is None:
+        return None
+
+    ssl_object = connection.transport.get_extra_info("ssl_object")
+    if ssl_object is None:
+        return None
+
+    tls = {"version": ssl_object.version(), "cipher": ssl_object.cipher()[0] if ssl_object.cipher() else None}
+    cert = ssl_object.getpeercert()
+    if cert:
+        issuer = dict(x[0] for x in cert.get("issuer", ()))
+        tls["issuer"] = issuer.get("organizationName", "Unknown")
+        tls["expires"] = datetime.strptime(cert["notAfter"], "%b %d %H:%M:%S %Y GMT")
+    return tls
+
+
+def text_decoder(response):
+    try:
+        return codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+async def fetch_page_snapshot(http_client, url, timeout=5, max_bytes=None, parser=None):
+    snapshot = PageSnapshot(url)
+    timings = RequestTimings()
+    max_bytes = max_bytes or PAGE_MAX_BYTES
+
+    try:
+        async with http_client.get(url, timeout=timeout, trace_request_ctx=timings) as response:
+            snapshot.status = response.status
+            snapshot.final_url = str(response.url)
+            snapshot.redirected = bool(response.history)
+            snapshot.headers = response.headers
+            snapshot.tls = read_tls_info(response)
+
+            # Stream the body so huge pages stay bounded and a parser can stop the download early
+            body = bytearray()
+            text = []
+            decoder = text_decoder(response)
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                chunk = chunk[:max_bytes - len(body)]
+                body += chunk
+                text.append(decoder.decode(chunk))
+                if parser:
+                    parser.feed(text[-1])
+                if len(body) >= max_bytes or (parser and parser.done):
+                    break
+            text.append(decoder.decode(b"", final=True))
+            timings.mark("body_received")
+
+            snapshot.truncated = not response.content.at_eof()
+            snapshot.body = bytes(body)
+            snapshot.text = "".join(text)
+            if parser:
+                parser.close()
+    except Exception as e:
+        snapshot.error = str(e) or type(e).__name__
+
+    snapshot.timings = timings.phases()
+    return snapshot
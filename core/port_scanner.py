@@ -0,0 +1,202 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import time
+
+# The ports nmap -F scans, ordered by how often they are found open
+TOP_PORTS = [
+    80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080, 1723, 111, 995, 993, 5900,
+    1025, 587, 8888, 199, 1720, 465, 548, 113, 81, 6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554,
+    26, 1433, 49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153, 8081, 2049, 88, 79, 5800, 106,
+    2121, 1110, 49155, 6000, 513, 990, 5357, 427, 49156, 543, 544, 5101, 144, 7, 389, 8009, 3128, 444, 9999, 5009,
+    7070, 5190, 3000, 5432, 1900, 3986, 13, 1029, 9, 5051, 6646, 49157, 1028, 873, 1755, 2717, 4899, 9100, 119, 37,
+]
+SERVICE_NAMES = {
+    21: "ftp", 22: "ssh", 23: "telnet", 25: "smtp", 53: "domain", 80: "http", 110: "pop3", 111: "rpcbind", 135: "msrpc",
+    139: "netbios-ssn", 143: "imap", 389: "ldap", 443: "https", 445: "microsoft-ds", 465: "smtps", 587: "submission",
+    631: "ipp", 873: "rsync", 993: "imaps", 995: "pop3s", 1433: "ms-sql-s", 1723: "pptp", 2049: "nfs", 3128: "squid-http",
+    3306: "mysql", 3389: "ms-wbt-server", 5060: "sip", 5432: "postgresql", 5900: "vnc", 6379: "redis", 8000: "http-alt",
+    8008: "http", 8080: "http-proxy", 8443: "https-alt", 8888: "sun-answerbook", 9100: "jetdirect", 27017: "mongod",
+}
+# Web servers stay silent until they are asked something, other silent services get the same request after a pause
+HTTP_PORTS = {80, 81, 3000, 5000, 8000, 8008, 8080, 8081, 8888}
+HTTP_PROBE = b"HEAD / HTTP/1.0\r\n\r\n"
+MAX_PORTS = 65535
+
+
+def parse_ports(spec):
+    # nmap style port lists: 22,80,8000-8100
+    ports = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        first, last = int(first), int(last or first)
+        if not 1 <= first <= last <= MAX_PORTS:
+            raise ValueError(f"Invalid port range {part}")
+        ports.update(range(first, last + 1))
+    if not ports:
+        raise ValueError("No ports given")
+    return sorted(ports)
+
+
+def ports_for_arguments(arguments):
+    # Plain port scans run natively, anything else (-sV, scripts, OS detection) still needs nmap
+    tokens = arguments.split()
+    if tokens == ["-F"]:
+        return TOP_PORTS
+    if tokens == ["-p-"]:
+        return range(1, MAX_PORTS + 1)
+    if len(tokens) == 2 and tokens[0] == "-p":
+        return parse_ports(tokens[1])
+    return None
+
+
+def describe_banner(port, banner):
+    name = SERVICE_NAMES.get(port)
+    if not banner:
+        return name
+    text = banner.decode("utf-8", "replace")
+    if text.startswith("HTTP/"):
+        server = next((line.split(":", 1)[1].strip() for line in text.splitlines() if line.lower().startswith("server:")), None)
+        return f"http ({server})" if server else "http"
+    lines = text.strip().splitlines()
+    first_line = "".join(character for character in lines[0] if character.isprintable()).strip()[:60] if lines else ""
+    if not first_line:
+        return name
+    return f"{name} ({first_line})" if name else first_line
+
+
+class RttEstimator:
+    # Smoothed RTT as TCP computes it, the connect timeout follows the target instead of a fixed guess
+    def __init__(self, initial, minimum, maximum):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt = None
+        self.rttvar = None
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+            return
+        self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+        self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    @property
+    def timeout(self):
+        if self.srtt is None:
+            return self.initial
+        return min(max(self.srtt + 4 * self.rttvar, self.minimum), self.maximum)
+
+
+class PortScanner:
+    def __init__(self):
+        self.concurrency = int(os.getenv("PORT_SCAN_CONCURRENCY", 256))
+        # Shared by every running scan, keeps the bot below its file descriptor limit
+        self.sockets = asyncio.Semaphore(int(os.getenv("PORT_SCAN_MAX_SOCKETS", 512)))
+        self.initial_timeout = float(os.getenv("PORT_SCAN_TIMEOUT", 1.0))
+        self.min_timeout = float(os.getenv("PORT_SCAN_MIN_TIMEOUT", 0.25))
+        self.max_timeout = float(os.getenv("PORT_SCAN_MAX_TIMEOUT", 3.0))
+        self.banners = os.getenv("PORT_SCAN_BANNERS", "true").lower() == "true"
+        self.banner_timeout = float(os.getenv("PORT_SCAN_BANNER_TIMEOUT", 1.0))
+        self.max_retries = int(os.getenv("PORT_SCAN_MAX_RETRIES", 64))
+        # Lets the benchmarks point scans at a local stand-in, like HttpClient.upstream_overrides
+        self.address_overrides = {}
+        self.counters = {"scans": 0, "probes": 0, "open": 0, "closed": 0, "filtered": 0, "retries": 0}
+
+    def resolve(self, target):
+        # Targets arrive as addresses the cog already checked, hostnames are refused rather than resolved again
+        target = self.address_overrides.get(target) or self.address_overrides.get("*") or target
+        return str(ipaddress.ip_address(target))
+
+    async def grab_banner(self, port, sock):
+        loop = asyncio.get_running_loop()
+        try:
+            if port not in HTTP_PORTS:
+                # SSH, FTP and mail servers greet first
+                try:
+                    return await asyncio.wait_for(loop.sock_recv(sock, 512), self.banner_timeout / 2)
+                except asyncio.TimeoutError:
+                    pass
+            await loop.sock_sendall(sock, HTTP_PROBE)
+            return await asyncio.wait_for(loop.sock_recv(sock, 512), self.banner_timeout / 2)
+        except (asyncio.TimeoutError, OSError):
+            return b""
+
+    async def probe(self, address, port, rtt):
+        # open, closed or filtered, plus a service hint for open ports
+        async with self.sockets:
+            self.counters["probes"] += 1
+            timeout = rtt.timeout
+            # Bare non-blocking sockets, a stream reader and writer per probe would cost more than the probe itself
+            sock = socket.socket(socket.AF_INET6 if ":" in address else socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                started_at = time.perf_counter()
+                try:
+                    await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (address, port)), timeout)
+                except ConnectionRefusedError:
+                    # A reset is an answer too, it measures the round trip as well as an accepted connection
+                    rtt.sample(time.perf_counter() - started_at)
+                    return "closed", None, timeout
+                except (asyncio.TimeoutError, OSError):
+                    return "filtered", None, timeout
+                rtt.sample(time.perf_counter() - started_at)
+
+                banner = await self.grab_banner(port, sock) if self.banners else b""
+                return "open", describe_banner(port, banner), timeout
+            finally:
+                sock.close()
+
+    async def scan(self, target, ports, on_open=None, on_progress=None, should_stop=None):
+        address = self.resolve(target)
+        self.counters["scans"] += 1
+        rtt = RttEstimator(self.initial_timeout, self.min_timeout, self.max_timeout)
+        queue = iter(ports)
+        total = len(ports)
+        done = 0
+        retries = 0
+        result = {"open": [], "closed": 0, "filtered": 0}
+
+        async def worker():
+            nonlocal done, retries
+            # Workers pull from one iterator, a full range scan never holds 65535 pending tasks
+            for port in queue:
+                if should_stop and should_stop():
+                    return
+                state, service, timeout = await self.probe(address, port, rtt)
+                # Firewalled hosts drop almost every port, only retry when the timeout was clearly tighter than the
+                # measured round trip, and at most max_retries times per scan
+                if state == "filtered" and rtt.srtt is not None and timeout < 2 * rtt.srtt and retries < self.max_retries:
+                    retries += 1
+                    self.counters["retries"] += 1
+                    state, service, _ = await self.probe_with_timeout(address, port, rtt, self.max_timeout)
+                self.counters[state] += 1
+                if state == "open":
+                    entry = {"port": port, "protocol": "tcp", "service": service}
+                    result["open"].append(entry)
+                    if on_open:
+                        on_open(entry)
+                else:
+                    result[state] += 1
+                done += 1
+                if on_progress and done % 50 == 0:
+                    on_progress(done * 100 / total)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, total))))
+        result["open"].sort(key=lambda entry: entry["port"])
+        result["rtt"] = rtt.srtt
+        return result
+
+    async def probe_with_timeout(self, address, port, rtt, timeout):
+        fixed = RttEstimator(timeout, timeout, timeout)
+        state, service, _ = await self.probe(address, port, fixed)
+        if fixed.srtt is not None:
+            rtt.sample(fixed.srtt)
+        return state, service, timeout
+
+    def stats(self):
+        return dict(self.counters)
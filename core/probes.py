@@ -0,0 +1,75 @@
+import asyncio
+import os
+import time
+from core import metrics
+
+COMMAND_DEADLINE = float(os.getenv("COMMAND_DEADLINE", 12))
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", 8))
+
+
+class ProbeResults(dict):
+    def __init__(self):
+        super().__init__()
+        self.timed_out = []
+        self.failed = []
+
+    @property
+    def partial(self):
+        return bool(self.timed_out or self.failed)
+
+    def partial_note(self):
+        notes = []
+        if self.timed_out:
+            notes.append(f"timed out: {', '.join(self.timed_out)}")
+        if self.failed:
+            notes.append(f"failed: {', '.join(self.failed)}")
+        return f"⚠️ Partial results ({'; '.join(notes)})"
+
+
+async def timed_probe(name, probe, timeout):
+    started_at = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await asyncio.wait_for(probe, timeout=timeout)
+        outcome = "success"
+        return result
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        outcome = "timeout"
+        raise
+    finally:
+        metrics.probe_duration.observe(time.perf_counter() - started_at, name, outcome)
+
+
+async def run_probes(probes, deadline=None, probe_timeout=None):
+    deadline = COMMAND_DEADLINE if deadline is None else deadline
+    probe_timeout = PROBE_TIMEOUT if probe_timeout is None else probe_timeout
+
+    tasks = {
+        asyncio.ensure_future(timed_probe(name, probe, probe_timeout)): name
+        for name, probe in probes.items()
+    }
+    results = ProbeResults()
+    if not tasks:
+        return results
+
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    for task, name in tasks.items():
+        if task in pending:
+            results.timed_out.append(name)
+            continue
+
+        error = task.exception()
+        if isinstance(error, asyncio.TimeoutError):
+            results.timed_out.append(name)
+        elif error is not None:
+            results.failed.append(name)
+        else:
+            results[name] = task.result()
+
+    return results
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.waits = 0
+        self.total_wait = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # Waiters queue on the lock in FIFO order, so a burst drains at the refill rate
+        async with self.lock:
+            self.refill()
+            if self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                self.waits += 1
+                self.total_wait += delay
+                await asyncio.sleep(delay)
+                self.refill()
+            self.tokens -= 1
+
+    def stats(self):
+        self.refill()
+        return {
+            "rate": self.rate,
+            "burst": self.capacity,
+            "tokens": round(self.tokens, 2),
+            "waits": self.waits,
+            "total_wait": round(self.total_wait, 3),
+        }
@@ -0,0 +1,472 @@
+import asyncio
+import bisect
+import fcntl
+import gzip
+import heapq
+import ipaddress
+import json
+import mmap
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from struct import Struct
+
+# Segment layout: header, domain names back to back, then fixed size entries sorted by (ip, domain)
+MAGIC = b"MUFRIP01"
+HEADER = Struct("!8sQQ")
+ENTRY = Struct("!16sQHI")
+IPV4_MAPPED = b"\x00" * 10 + b"\xff\xff"
+RECORD_TYPE_A = 1
+RECORD_TYPE_AAAA = 28
+
+
+def pack_ip(value):
+    # IPv4 is stored IPv4-mapped so every key has the same width
+    address = ipaddress.ip_address(value)
+    if address.version == 4:
+        return IPV4_MAPPED + address.packed
+    return address.packed
+
+
+def address_key(value):
+    # Imports run this for every record, inet_pton is far cheaper than parsing with ipaddress
+    try:
+        packed = socket.inet_pton(socket.AF_INET, value)
+        key = IPV4_MAPPED + packed
+    except (OSError, TypeError):
+        try:
+            packed = key = socket.inet_pton(socket.AF_INET6, value)
+        except (OSError, TypeError):
+            return None
+    return key if ipaddress.ip_address(packed).is_global else None
+
+
+def normalize_domain(name):
+    name = name.strip().rstrip(".").lower()
+    if not name or len(name) > 253 or " " in name:
+        return None
+    if name.isascii():
+        return name.encode("ascii")
+    try:
+        return name.encode("idna")
+    except UnicodeError:
+        return None
+
+
+def merge_records(*streams):
+    # Streams are sorted (ip, domain, last_seen) tuples, duplicates keep the latest sighting
+    previous = None
+    for record in heapq.merge(*streams):
+        if previous and previous[:2] != record[:2]:
+            yield previous
+        previous = record
+    if previous:
+        yield previous
+
+
+class IpKeys:
+    def __init__(self, segment):
+        self.segment = segment
+
+    def __len__(self):
+        return self.segment.count
+
+    def __getitem__(self, index):
+        return self.segment.ip_at(index)
+
+
+class Segment:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            status = os.fstat(self.file.fileno())
+            self.identity = (status.st_ino, status.st_mtime_ns)
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.file.close()
+            raise
+        magic, self.count, self.entries_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or self.entries_offset + self.count * ENTRY.size > len(self.map):
+            self.close()
+            raise ValueError(f"{path} is not a reverse IP index")
+        self.keys = IpKeys(self)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def ip_at(self, index):
+        offset = self.entries_offset + index * ENTRY.size
+        return self.map[offset:offset + 16]
+
+    def record(self, index):
+        ip, offset, length, last_seen = ENTRY.unpack_from(self.map, self.entries_offset + index * ENTRY.size)
+        start = HEADER.size + offset
+        return ip, self.map[start:start + length], last_seen
+
+    def find(self, ip):
+        lo = bisect.bisect_left(self.keys, ip)
+        return lo, bisect.bisect_right(self.keys, ip, lo)
+
+    def records(self, lo=0, hi=None):
+        for index in range(lo, self.count if hi is None else hi):
+            yield self.record(index)
+
+    def contains(self, domain, lo, hi):
+        end = hi
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if self.record(middle)[1] < domain:
+                lo = middle + 1
+            else:
+                hi = middle
+        return lo < end and self.record(lo)[1] == domain
+
+
+def open_segment(path):
+    try:
+        return Segment(path)
+    except FileNotFoundError:
+        return None
+
+
+class SegmentWriter:
+    def __init__(self, path):
+        self.path = path
+        self.output = open(f"{path}.tmp", "wb", buffering=1 << 20)
+        self.output.write(HEADER.pack(MAGIC, 0, 0))
+        self.entries = tempfile.TemporaryFile(dir=os.path.dirname(path) or ".", buffering=1 << 20)
+        self.count = 0
+        self.size = 0
+
+    def add(self, ip, domain, last_seen):
+        self.entries.write(ENTRY.pack(ip, self.size, len(domain), last_seen))
+        self.output.write(domain)
+        self.size += len(domain)
+        self.count += 1
+
+    def commit(self):
+        self.entries.seek(0)
+        shutil.copyfileobj(self.entries, self.output, 1 << 20)
+        self.entries.close()
+        self.output.seek(0)
+        self.output.write(HEADER.pack(MAGIC, self.count, HEADER.size + self.size))
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        self.output.close()
+        # Readers keep their old map until they notice the new inode, so swapping files never breaks a lookup
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def abort(self):
+        self.entries.close()
+        self.output.close()
+        os.unlink(f"{self.path}.tmp")
+
+
+def write_segment(path, records):
+    writer = SegmentWriter(path)
+    try:
+        for record in records:
+            writer.add(*record)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+    return writer.count
+
+
+class IndexLock:
+    # Shard processes on one host share the files, merges take turns through an advisory lock
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+class ReverseIpIndex:
+    def __init__(self, directory=None):
+        directory = directory or os.getenv("DATA_DIR", "data")
+        self.directory = directory
+        self.base_path = os.path.join(directory, "reverse_ip.idx")
+        self.delta_path = os.path.join(directory, "reverse_ip.delta.idx")
+        self.lock_path = os.path.join(directory, "reverse_ip.lock")
+        self.flush_interval = float(os.getenv("REVERSE_IP_FLUSH_INTERVAL", 60))
+        self.max_pending = int(os.getenv("REVERSE_IP_MAX_PENDING", 50000))
+        self.delta_max = int(os.getenv("REVERSE_IP_DELTA_MAX", 1000000))
+        # Merges rewrite files, they run on one thread of their own and never on the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="muffin-reverse-ip")
+        self.segments = {}
+        self.pending = {}
+        self.pending_count = 0
+        self.task = None
+        self.flush_task = None
+        self.counters = {"recorded": 0, "lookups": 0, "flushes": 0, "merges": 0}
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.refresh()
+        self.task = asyncio.create_task(self.periodic_flush())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = {}
+        self.executor.shutdown(wait=True)
+
+    async def periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Reverse IP flush failed: {e}")
+
+    def observe(self, name, results):
+        # Resolver hook, answers can also hold the CNAME chain which is not an address
+        for record_type, type_code in (("A", RECORD_TYPE_A), ("AAAA", RECORD_TYPE_AAAA)):
+            for answer in results.get(record_type) or []:
+                if answer.get("type") == type_code:
+                    self.record(name, answer["data"])
+
+    def record(self, name, address, last_seen=None):
+        domain = normalize_domain(name)
+        key = address_key(address)
+        if domain is None or key is None:
+            return
+
+        domains = self.pending.setdefault(key, {})
+        if domain not in domains:
+            self.pending_count += 1
+        domains[domain] = int(last_seen or time.time())
+        self.counters["recorded"] += 1
+        if self.pending_count >= self.max_pending and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending, self.pending_count = self.pending, {}, 0
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.write_pending, batch)
+        self.counters["flushes"] += 1
+        self.refresh()
+
+    def write_pending(self, batch):
+        records = sorted((ip, domain, last_seen) for ip, domains in batch.items() for domain, last_seen in domains.items())
+        with IndexLock(self.lock_path):
+            # Another process may have written since our last refresh, always merge into the files on disk
+            delta = open_segment(self.delta_path)
+            try:
+                count = write_segment(self.delta_path, merge_records(delta.records() if delta else [], records))
+            finally:
+                if delta:
+                    delta.close()
+            if count >= self.delta_max:
+                self.compact()
+
+    def compact(self):
+        # Caller holds the lock. Small flushes only rewrite the delta, the big base file is rewritten rarely
+        base, delta = open_segment(self.base_path), open_segment(self.delta_path)
+        try:
+            write_segment(self.base_path, merge_records(*(segment.records() for segment in (base, delta) if segment)))
+        finally:
+            for segment in (base, delta):
+                if segment:
+                    segment.close()
+        if delta:
+            os.unlink(self.delta_path)
+        self.counters["merges"] += 1
+
+    def refresh(self):
+        for path in (self.base_path, self.delta_path):
+            current = self.segments.get(path)
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                if current:
+                    self.segments.pop(path).close()
+                continue
+            if current and current.identity == (status.st_ino, status.st_mtime_ns):
+                continue
+            try:
+                segment = Segment(path)
+            except (OSError, ValueError) as e:
+                print(f"Could not open {path}: {e}")
+                continue
+            if current:
+                current.close()
+            self.segments[path] = segment
+
+    def lookup(self, ip, offset=0, limit=10):
+        key = pack_ip(ip)
+        self.refresh()
+        self.counters["lookups"] += 1
+
+        streams = []
+        base = self.segments.get(self.base_path)
+        base_range = base.find(key) if base else (0, 0)
+        total = base_range[1] - base_range[0]
+        if base:
+            streams.append(base.records(*base_range))
+
+        # Newer levels are small, their domains are checked against the base so the total counts each domain once
+        newer = {}
+        delta = self.segments.get(self.delta_path)
+        if delta:
+            delta_range = delta.find(key)
+            streams.append(delta.records(*delta_range))
+            newer.update((domain, last_seen) for _, domain, last_seen in delta.records(*delta_range))
+        pending = self.pending.get(key, {})
+        streams.append(sorted((key, domain, last_seen) for domain, last_seen in pending.items()))
+        newer.update(pending)
+        total += sum(1 for domain in newer if not (base and base.contains(domain, *base_range)))
+
+        if not newer and base:
+            # Usually only the base knows the IP, then a page is a direct slice of its entries
+            lo, hi = base_range
+            page = base.records(min(lo + offset, hi), min(lo + offset + limit, hi))
+        else:
+            page = islice(merge_records(*streams), offset, offset + limit)
+        return {"total": total, "domains": [(domain.decode("ascii", "replace"), last_seen) for _, domain, last_seen in page]}
+
+    def stats(self):
+        return dict(
+            self.counters,
+            pending=self.pending_count,
+            records=sum(segment.count for segment in self.segments.values()),
+        )
+
+
+def parse_line(line, origin=None, previous=None):
+    # Accepts passive DNS JSON lines, zone file records and "domain,ip" or "ip domain" pairs
+    line = line.strip()
+    if not line or line[0] in "#;":
+        return None
+    if line[0] == "{":
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        record_type = str(entry.get("type") or entry.get("rrtype") or "").upper()
+        if record_type not in ("A", "AAAA"):
+            return None
+        seen = entry.get("time_last") or entry.get("timestamp")
+        try:
+            seen = int(float(seen))
+        except (TypeError, ValueError):
+            seen = None
+        return entry.get("name") or entry.get("rrname"), entry.get("value") or entry.get("rdata"), seen
+
+    fields = line.replace(",", " ").replace("\t", " ").split()
+    upper = [field.upper() for field in fields]
+    for record_type in ("A", "AAAA"):
+        if record_type in upper[:-1]:
+            index = upper.index(record_type)
+            # Zone records without an owner name continue the previous one
+            if index == 0 or fields[0].isdigit() or upper[0] == "IN":
+                return previous, fields[index + 1], None
+            name = fields[0]
+            if name == "@":
+                name = origin
+            elif origin and not name.endswith("."):
+                name = f"{name}.{origin}"
+            return name, fields[index + 1], None
+
+    if len(fields) == 2:
+        first, second = fields
+        if ":" in first or first.replace(".", "").isdigit():
+            return second, first, None
+        return first, second, None
+    return None
+
+
+def read_records(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    origin = None
+    previous = None
+    default_seen = int(os.path.getmtime(path))
+    with opener(path, "rt", encoding="utf-8", errors="replace") as file:
+        for line in file:
+            if line.startswith("$ORIGIN"):
+                origin = line.split()[1].rstrip(".")
+                continue
+            parsed = parse_line(line, origin, previous)
+            if not parsed:
+                continue
+            name, address, seen = parsed
+            if not line[0].isspace() and name:
+                previous = name
+            domain = normalize_domain(name or "")
+            key = address_key(address)
+            if domain and key:
+                yield key, domain, seen or default_seen
+
+
+def import_files(paths, directory=None, chunk_size=None):
+    index = ReverseIpIndex(directory)
+    chunk_size = chunk_size or int(os.getenv("REVERSE_IP_IMPORT_CHUNK", 2000000))
+    os.makedirs(index.directory, exist_ok=True)
+    runs = []
+    total = 0
+
+    # External sort: sorted runs on disk, then one streaming merge, memory stays at one chunk
+    try:
+        records = (record for path in paths for record in read_records(path))
+        while True:
+            chunk = sorted(islice(records, chunk_size))
+            if not chunk:
+                break
+            total += len(chunk)
+            run_path = os.path.join(index.directory, f"reverse_ip.run{len(runs)}.idx")
+            write_segment(run_path, merge_records(chunk))
+            runs.append(run_path)
+            print(f"Sorted {total:,} records")
+
+        with IndexLock(index.lock_path):
+            segments = [segment for segment in (open_segment(path) for path in [index.base_path, index.delta_path] + runs) if segment]
+            try:
+                count = write_segment(index.base_path, merge_records(*(segment.records() for segment in segments)))
+            finally:
+                for segment in segments:
+                    segment.close()
+            if os.path.exists(index.delta_path):
+                os.unlink(index.delta_path)
+    finally:
+        for run_path in runs:
+            if os.path.exists(run_path):
+                os.unlink(run_path)
+    index.executor.shutdown()
+    return total, count
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != "import":
+        print("Usage: python -m core.reverse_ip import <file> [<file> ...]")
+        print("Files can be zone files, passive DNS JSON lines or domain,ip pairs, optionally gzipped")
+        sys.exit(1)
+
+    started_at = time.perf_counter()
+    imported, count = import_files(sys.argv[2:])
+    print(f"Imported {imported:,} records, the index now holds {count:,} in {time.perf_counter() - started_at:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
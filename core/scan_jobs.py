@@ -0,0 +1,309 @@
+import asyncio
+import os
+import re
+import secrets
+import tempfile
+import time
+
+from core.port_scanner import PortScanner, ports_for_arguments
+
+DISCOVERED_PORT = re.compile(r"Discovered open port (\d+)/(\w+) on (\S+)")
+PROGRESS = re.compile(r"About ([\d.]+)% done")
+
+
+class ScanJobLimitExceeded(Exception):
+    pass
+
+
+class ScanJob:
+    def __init__(self, user_id, target, arguments, lane):
+        self.id = secrets.token_hex(4)
+        self.user_id = user_id
+        self.target = target
+        self.arguments = arguments
+        self.lane = lane
+        self.status = "queued"
+        self.ports = {}
+        self.progress = None
+        self.error = None
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.process = None
+        self.updated = asyncio.Event()
+        self.done = asyncio.Event()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def open_ports(self):
+        return [self.ports[key] for key in sorted(self.ports)]
+
+    def touch(self):
+        self.updated.set()
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.monotonic()
+        self.touch()
+        self.done.set()
+
+
+class ScanQueue:
+    def __init__(self, store=None, state=None):
+        self.store = store
+        self.state = state
+        # Shard processes publish their active jobs under short leases, a crashed process drops out on its own
+        self.state_interval = float(os.getenv("SCAN_STATE_INTERVAL", 5))
+        self.state_task = None
+        self.result_ttl = float(os.getenv("SCAN_RESULT_TTL", 604800))
+        self.nmap_path = os.getenv("NMAP_PATH", "nmap")
+        # Plain port scans run on the built-in connect scanner, PORT_SCAN_ENGINE=nmap sends everything to nmap
+        self.engine = os.getenv("PORT_SCAN_ENGINE", "native").lower()
+        self.scanner = PortScanner()
+        self.max_jobs = int(os.getenv("SCAN_MAX_JOBS", 20))
+        self.max_jobs_per_user = int(os.getenv("SCAN_MAX_JOBS_PER_USER", 2))
+        # Separate lanes so long Full Scans can never starve quick ones
+        self.lane_workers = {
+            "fast": int(os.getenv("SCAN_FAST_WORKERS", 3)),
+            "slow": int(os.getenv("SCAN_SLOW_WORKERS", 1)),
+        }
+        self.queues = {}
+        self.workers = []
+        self.jobs = {}
+
+    async def start(self):
+        if self.workers:
+            return
+        for lane, count in self.lane_workers.items():
+            self.queues[lane] = asyncio.Queue()
+            for _ in range(count):
+                self.workers.append(asyncio.create_task(self.worker(lane)))
+        if self.shared:
+            self.state_task = asyncio.create_task(self.sync_state())
+
+    async def close(self):
+        for job in self.jobs.values():
+            if job.active:
+                self.cancel(job.id, job.user_id)
+        tasks = self.workers + ([self.state_task] if self.state_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.state_task = None
+        if self.shared:
+            await self.publish(set(job.user_id for job in self.jobs.values()))
+
+    @property
+    def shared(self):
+        return self.state is not None and self.state.shared
+
+    @property
+    def lease(self):
+        return self.state_interval * 3
+
+    def peer_keys(self, suffix):
+        return [f"scan:{index}:{suffix}" for index in range(self.state.process_count) if index != self.state.process_index]
+
+    def active_jobs(self, user_id=None):
+        return [job for job in self.jobs.values() if job.active and (user_id is None or job.user_id == user_id)]
+
+    async def peer_jobs(self, user_id):
+        # Active totals and job ids that other shard processes published for this user
+        if not self.shared:
+            return 0, []
+        try:
+            values = await self.state.get_many(self.peer_keys("active") + self.peer_keys(f"user:{user_id}"))
+        except Exception as e:
+            print(f"Scan queue state unavailable, only local limits apply: {e}")
+            return 0, []
+
+        half = len(values) // 2
+        return sum(total or 0 for total in values[:half]), [job_id for job_ids in values[half:] if job_ids for job_id in job_ids]
+
+    async def submit(self, user_id, target, arguments, lane):
+        peer_total, peer_user_jobs = await self.peer_jobs(user_id)
+        # Limits are checked without a distributed lock, processes racing on the last slot can overshoot by one
+        if len(self.active_jobs()) + peer_total >= self.max_jobs:
+            raise ScanJobLimitExceeded("Too many scans are running right now, please try again later.")
+        if len(self.active_jobs(user_id)) + len(peer_user_jobs) >= self.max_jobs_per_user:
+            raise ScanJobLimitExceeded(f"You can only run {self.max_jobs_per_user} scans at the same time.")
+
+        self.prune()
+        job = ScanJob(user_id, target, arguments, lane)
+        self.jobs[job.id] = job
+        self.queues[lane].put_nowait(job)
+        if self.shared:
+            await self.publish({user_id})
+        return job
+
+    def cancel(self, job_id, user_id):
+        job = self.jobs.get(job_id)
+        if not job or job.user_id != user_id or not job.active:
+            return False
+
+        if job.process and job.process.returncode is None:
+            job.process.kill()
+        job.finish("cancelled")
+        return True
+
+    async def request_cancel(self, job_id, user_id):
+        if self.cancel(job_id, user_id):
+            return True
+
+        # The job may belong to another shard process, which picks the request up on its next sync
+        _, peer_user_jobs = await self.peer_jobs(user_id)
+        if job_id not in peer_user_jobs:
+            return False
+        try:
+            await self.state.set(f"scan:cancel:{job_id}", user_id, self.lease)
+        except Exception as e:
+            print(f"Failed to forward cancel for scan {job_id}: {e}")
+            return False
+        return True
+
+    async def publish(self, user_ids):
+        index = self.state.process_index
+        try:
+            await self.state.set(f"scan:{index}:active", len(self.active_jobs()), self.lease)
+            for user_id in user_ids:
+                await self.state.set(f"scan:{index}:user:{user_id}", [job.id for job in self.active_jobs(user_id)], self.lease)
+        except Exception as e:
+            print(f"Failed to publish scan queue state: {e}")
+
+    async def sync_state(self):
+        published = set()
+        while True:
+            await asyncio.sleep(self.state_interval)
+            active = self.active_jobs()
+            try:
+                requests = await self.state.get_many([f"scan:cancel:{job.id}" for job in active])
+            except Exception:
+                requests = []
+            for job, user_id in zip(active, requests):
+                if user_id == job.user_id:
+                    self.cancel(job.id, job.user_id)
+
+            # Users whose last job finished are published once more so their empty list replaces the old one
+            users = set(job.user_id for job in self.active_jobs())
+            await self.publish(users | published)
+            published = users
+
+    def prune(self, keep_seconds=3600):
+        now = time.monotonic()
+        for job_id, job in list(self.jobs.items()):
+            if not job.active and now - job.finished_at > keep_seconds:
+                del self.jobs[job_id]
+
+    async def worker(self, lane):
+        queue = self.queues[lane]
+        while True:
+            job = await queue.get()
+            try:
+                if job.active:
+                    await self.run(job)
+            except Exception as e:
+                if job.active:
+                    job.finish("failed", str(e))
+            finally:
+                queue.task_done()
+                if self.shared:
+                    await self.publish({job.user_id})
+
+    async def run(self, job):
+        job.status = "running"
+        job.started_at = time.monotonic()
+        job.touch()
+
+        ports = ports_for_arguments(job.arguments) if self.engine == "native" else None
+        if ports is not None:
+            await self.run_native(job, ports)
+            return
+
+        fd, xml_path = tempfile.mkstemp(prefix="muffin-nmap-", suffix=".xml")
+        os.close(fd)
+        try:
+            job.process = await asyncio.create_subprocess_exec(
+                self.nmap_path, *job.arguments.split(), "-v", "--stats-every", "5s", "-oX", xml_path, job.target,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+
+            # stderr is drained alongside stdout, nmap stalls once a pipe nobody reads fills up
+            stderr_task = asyncio.ensure_future(job.process.stderr.read())
+            try:
+                async for raw_line in job.process.stdout:
+                    self.parse_output_line(job, raw_line.decode(errors="replace"))
+                stderr = await stderr_task
+            finally:
+                stderr_task.cancel()
+            return_code = await job.process.wait()
+            if not job.active:
+                return
+            if return_code != 0:
+                job.finish("failed", stderr.decode(errors="replace").strip() or f"nmap exited with code {return_code}")
+                return
+
+            self.parse_xml_report(job, xml_path)
+            job.finish("done")
+            self.save_result(job)
+        finally:
+            job.process = None
+            os.unlink(xml_path)
+
+    async def run_native(self, job, ports):
+        def on_open(entry):
+            job.ports[(entry["port"], entry["protocol"])] = entry
+            job.touch()
+
+        def on_progress(percent):
+            job.progress = percent
+            job.touch()
+
+        try:
+            await self.scanner.scan(job.target, ports, on_open, on_progress, should_stop=lambda: not job.active)
+        except ValueError:
+            job.finish("failed", f"{job.target} is not an IP address")
+            return
+        if not job.active:
+            return
+        job.progress = 100.0
+        job.finish("done")
+        self.save_result(job)
+
+    def save_result(self, job):
+        if self.store:
+            self.store.put("nmap", f"{job.target} {job.arguments}", {"ports": job.open_ports(), "finished_at": time.time()}, self.result_ttl)
+
+    def parse_output_line(self, job, line):
+        discovered = DISCOVERED_PORT.search(line)
+        if discovered:
+            port, protocol = int(discovered.group(1)), discovered.group(2)
+            job.ports.setdefault((port, protocol), {"port": port, "protocol": protocol, "service": None})
+            job.touch()
+            return
+
+        progress = PROGRESS.search(line)
+        if progress:
+            job.progress = float(progress.group(1))
+            job.touch()
+
+    def parse_xml_report(self, job, xml_path):
+        import xml.etree.ElementTree as ElementTree
+
+        # iterparse keeps memory flat even for -p- reports with many port elements
+        for _, element in ElementTree.iterparse(xml_path, events=("end",)):
+            if element.tag != "port":
+                continue
+
+            state = element.find("state")
+            if state is not None and state.get("state") == "open":
+                port, protocol = int(element.get("portid")), element.get("protocol")
+                service = element.find("service")
+                entry = job.ports.setdefault((port, protocol), {"port": port, "protocol": protocol, "service": None})
+                if service is not None:
+                    entry["service"] = " ".join(filter(None, [service.get("name"), service.get("product"), service.get("version")]))
+            element.clear()
@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import os
+import random
+import secrets
+import time
+
+
+def diff_states(old, new):
+    return {key: (old.get(key), new.get(key)) for key in sorted(set(old) | set(new)) if old.get(key) != new.get(key)}
+
+
+class WatchScheduler:
+    def __init__(self, store, checks, notify, owns=None):
+        self.store = store
+        # kind -> async check(target) returning a row, and a function reducing the row to the state that is diffed
+        self.checks = checks
+        self.notify = notify
+        self.owns = owns or (lambda watch: True)
+        self.concurrency = int(os.getenv("MONITOR_CONCURRENCY", 16))
+        self.batch_window = float(os.getenv("MONITOR_BATCH_WINDOW", 5))
+        self.failure_threshold = int(os.getenv("MONITOR_FAILURE_THRESHOLD", 3))
+        self.startup_spread = float(os.getenv("MONITOR_STARTUP_SPREAD", 300))
+        self.watches = {}
+        self.heap = []
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.running = set()
+        self.counters = {"checks": 0, "coalesced": 0, "alerts": 0, "failures": 0}
+
+    async def start(self):
+        if self.task:
+            return
+        now = time.time()
+        for watch_id, watch in (await self.store.get_all("watch")).items():
+            self.watches[watch_id] = watch
+            # Overdue watches are spread out so a restart does not fire thousands of checks at once
+            due_at = max(watch.get("checked_at", 0) + watch["interval"], now + random.uniform(0, min(self.startup_spread, watch["interval"])))
+            self.schedule(watch, due_at)
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self):
+        tasks = list(self.running) + ([self.task] if self.task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = None
+
+    def schedule(self, watch, due_at):
+        # Entries are never removed from the heap, a changed due_at or a removed watch makes the old entry stale
+        watch["due_at"] = due_at
+        heapq.heappush(self.heap, (due_at, watch["id"]))
+        self.wakeup.set()
+
+    def add(self, kind, target, interval, guild_id, channel_id, user_id):
+        watch = {
+            "id": secrets.token_hex(4),
+            "kind": kind,
+            "target": target,
+            "interval": interval,
+            "guild_id": guild_id,
+            "channel_id": channel_id,
+            "user_id": user_id,
+            "state": None,
+            "failures": 0,
+            "checked_at": 0,
+        }
+        self.watches[watch["id"]] = watch
+        self.save(watch)
+        self.schedule(watch, time.time())
+        return watch
+
+    async def remove(self, watch_id):
+        watch = self.watches.pop(watch_id, None)
+        if watch:
+            await self.store.delete("watch", watch_id)
+        return watch
+
+    def save(self, watch):
+        self.store.put("watch", watch["id"], {key: value for key, value in watch.items() if key != "due_at"})
+
+    def for_guild(self, guild_id):
+        return sorted((watch for watch in self.watches.values() if watch["guild_id"] == guild_id), key=lambda watch: watch["due_at"])
+
+    def pop_due(self):
+        # Everything due within the batch window runs now, so watches on the same target share one check
+        horizon = time.time() + self.batch_window
+        due = []
+        while self.heap and self.heap[0][0] <= horizon:
+            due_at, watch_id = heapq.heappop(self.heap)
+            watch = self.watches.get(watch_id)
+            if watch and watch["due_at"] == due_at:
+                due.append(watch)
+        return due
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            self.wakeup.clear()
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            hosts = {}
+            for watch in self.pop_due():
+                if not self.owns(watch):
+                    self.schedule(watch, time.time() + watch["interval"])
+                    continue
+                hosts.setdefault(watch["target"], {}).setdefault(watch["kind"], []).append(watch)
+
+            # The loop keeps scheduling while a batch runs, a slow host only delays its own watches
+            for kinds in hosts.values():
+                task = asyncio.create_task(self.check_host(semaphore, kinds))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+
+    async def check_host(self, semaphore, kinds):
+        async with semaphore:
+            # Checks against one host run one after another so a watched site never sees a burst from us
+            for kind, watches in kinds.items():
+                self.counters["coalesced"] += len(watches) - 1
+                await self.check(kind, watches)
+
+    async def check(self, kind, watches):
+        check, reduce_state = self.checks[kind]
+        target = watches[0]["target"]
+        self.counters["checks"] += 1
+        try:
+            row = await check(target)
+            error = row.get("error")
+        except Exception as e:
+            row, error = None, str(e) or type(e).__name__
+
+        now = time.time()
+        for watch in watches:
+            if watch["id"] not in self.watches:
+                continue
+            watch["checked_at"] = now
+
+            if error:
+                self.counters["failures"] += 1
+                watch["failures"] += 1
+                # Single failed checks are noise, only a run of them counts as the target being down
+                state = {"status": "unreachable"} if watch["failures"] >= self.failure_threshold else watch["state"]
+            else:
+                watch["failures"] = 0
+                state = reduce_state(row)
+
+            previous, watch["state"] = watch["state"], state
+            if previous is not None and state is not None and previous != state:
+                self.counters["alerts"] += 1
+                try:
+                    await self.notify(watch, diff_states(previous, state), row, error)
+                except Exception as e:
+                    print(f"Failed to send alert for watch {watch['id']}: {e}")
+
+            self.save(watch)
+            self.schedule(watch, now + watch["interval"])
+
+    def stats(self):
+        return dict(self.counters, watches=len(self.watches), queued=len(self.heap))
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import time
+from urllib.parse import unquote, urlsplit
+
+
+class SharedStateError(Exception):
+    pass
+
+
+class MemoryState:
+    # Default backend for a single process, nothing is shared with other shard processes
+    shared = False
+
+    def __init__(self):
+        self.values = {}
+        self.process_index = int(os.getenv("SHARD_PROCESS_INDEX", 0))
+        self.process_count = int(os.getenv("SHARD_PROCESS_COUNT", 1))
+
+    async def get(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.values[key]
+            return None
+        return value
+
+    async def get_many(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key, value, ttl=None):
+        self.values[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    async def close(self):
+        self.values.clear()
+
+    def stats(self):
+        return {"backend": "memory", "keys": len(self.values)}
+
+
+class RespState:
+    # Minimal RESP2 client, enough for Redis or any compatible server (KeyDB, Valkey, Dragonfly)
+    shared = True
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.username = unquote(parts.username) if parts.username else None
+        self.database = int(parts.path.strip("/") or 0)
+        self.prefix = os.getenv("SHARED_STATE_PREFIX", "muffin:")
+        self.timeout = float(os.getenv("SHARED_STATE_TIMEOUT", 2))
+        self.process_index = int(os.getenv("SHARD_PROCESS_INDEX", 0))
+        self.process_count = int(os.getenv("SHARD_PROCESS_COUNT", 1))
+        self.reader = None
+        self.writer = None
+        # One connection with one command in flight at a time keeps replies in order
+        self.lock = asyncio.Lock()
+        self.commands = 0
+        self.errors = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self.exchange(*(["AUTH", self.username, self.password] if self.username else ["AUTH", self.password]))
+        if self.database:
+            await self.exchange("SELECT", self.database)
+
+    def disconnect(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    def encode(self, args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def read_reply(self):
+        line = await self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Shared state connection closed")
+
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise SharedStateError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await self.reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise SharedStateError(f"Unexpected reply {line[:20]!r}")
+
+    async def exchange(self, *args):
+        self.writer.write(self.encode(args))
+        await self.writer.drain()
+        return await self.read_reply()
+
+    async def command(self, *args):
+        async with self.lock:
+            self.commands += 1
+            try:
+                if self.writer is None:
+                    await asyncio.wait_for(self.connect(), self.timeout)
+                return await asyncio.wait_for(self.exchange(*args), self.timeout)
+            except SharedStateError:
+                self.errors += 1
+                raise
+            except (OSError, EOFError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                # The reply stream is out of sync after a failure, start over on the next command
+                self.errors += 1
+                self.disconnect()
+                raise SharedStateError(f"Shared state unavailable: {e}") from e
+
+    async def get(self, key):
+        value = await self.command("GET", self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    async def get_many(self, keys):
+        if not keys:
+            return []
+        values = await self.command("MGET", *(self.prefix + key for key in keys))
+        return [json.loads(value) if value is not None else None for value in values]
+
+    async def set(self, key, value, ttl=None):
+        args = ["SET", self.prefix + key, json.dumps(value)]
+        if ttl:
+            args += ["PX", max(int(ttl * 1000), 1)]
+        await self.command(*args)
+
+    async def delete(self, key):
+        await self.command("DEL", self.prefix + key)
+
+    async def close(self):
+        async with self.lock:
+            self.disconnect()
+
+    def stats(self):
+        return {"backend": "resp", "commands": self.commands, "errors": self.errors}
+
+
+def create_state():
+    url = os.getenv("SHARED_STATE_URL", "")
+    if not url or url.startswith("memory://"):
+        return MemoryState()
+    if url.startswith(("redis://", "resp://")):
+        return RespState(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {url}")
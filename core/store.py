@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ResultStore:
+    def __init__(self):
+        self.path = os.path.join(os.getenv("DATA_DIR", "data"), "muffin.db")
+        self.max_rows = int(os.getenv("STORE_MAX_ROWS", 100000))
+        self.batch_size = int(os.getenv("STORE_BATCH_SIZE", 100))
+        self.flush_interval = float(os.getenv("STORE_FLUSH_INTERVAL", 2))
+        self.compact_interval = float(os.getenv("STORE_COMPACT_INTERVAL", 600))
+        # SQLite connections are bound to one thread, so every query runs on this single worker
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="muffin-store")
+        self.connection = None
+        self.pending = {}
+        self.tasks = []
+        self.flush_task = None
+
+    def encode_key(self, key):
+        return key if isinstance(key, str) else json.dumps(key)
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def start(self):
+        if self.connection:
+            return
+        await self.run(self.open)
+        await self.compact()
+        self.tasks = [
+            asyncio.create_task(self.periodic(self.flush, self.flush_interval)),
+            asyncio.create_task(self.periodic(self.compact, self.compact_interval)),
+        ]
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        if self.connection:
+            await self.flush()
+            await self.run(self.connection.close)
+            self.connection = None
+        self.executor.shutdown(wait=True)
+
+    async def periodic(self, fn, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await fn()
+            except Exception as e:
+                print(f"Result store {fn.__name__} failed: {e}")
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA busy_timeout=5000")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)")
+        self.connection.commit()
+
+    async def get(self, namespace, key):
+        key = self.encode_key(key)
+        pending = self.pending.get((namespace, key))
+        if pending:
+            return json.loads(pending[0]) if pending[2] is None or pending[2] > time.time() else None
+
+        if not self.connection:
+            return None
+        row = await self.run(self.read_row, namespace, key)
+        return json.loads(row[0]) if row else None
+
+    def read_row(self, namespace, key):
+        return self.connection.execute(
+            "SELECT value FROM results WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time()),
+        ).fetchone()
+
+    async def get_all(self, namespace):
+        if not self.connection:
+            return {}
+        await self.flush()
+        rows = await self.run(self.read_namespace, namespace)
+        return {key: json.loads(value) for key, value in rows}
+
+    def read_namespace(self, namespace):
+        return self.connection.execute(
+            "SELECT key, value FROM results WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time()),
+        ).fetchall()
+
+    def put(self, namespace, key, value, ttl=None):
+        now = time.time()
+        self.pending[(namespace, self.encode_key(key))] = (json.dumps(value), now, now + ttl if ttl else None)
+
+        # Writes are batched, a full batch is flushed without waiting for the next interval
+        if len(self.pending) >= self.batch_size and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.ensure_future(self.flush())
+
+    async def delete(self, namespace, key):
+        key = self.encode_key(key)
+        self.pending.pop((namespace, key), None)
+        if self.connection:
+            await self.run(self.delete_row, namespace, key)
+
+    def delete_row(self, namespace, key):
+        self.connection.execute("DELETE FROM results WHERE namespace = ? AND key = ?", (namespace, key))
+        self.connection.commit()
+
+    async def flush(self):
+        if not self.pending or not self.connection:
+            return
+        # Rows stay pending, and readable by get(), until the commit succeeds; a failed write is retried next time
+        batch = dict(self.pending)
+        await self.run(self.write_batch, batch)
+        for entry, row in batch.items():
+            if self.pending.get(entry) is row:
+                del self.pending[entry]
+
+    def write_batch(self, batch):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO results (namespace, key, value, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, key, value, created_at, expires_at) for (namespace, key), (value, created_at, expires_at) in batch.items()],
+            )
+
+    async def compact(self):
+        if self.connection:
+            await self.run(self.delete_expired)
+
+    def delete_expired(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            # Enforce the size cap by dropping the oldest rows first
+            self.connection.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            )
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self):
+        return {"path": self.path, "pending_writes": len(self.pending), "max_rows": self.max_rows}
@@ -0,0 +1,223 @@
+import asyncio
+import math
+import os
+import statistics
+import time
+import zlib
+
+from yarl import URL
+
+from core.page_snapshot import CHUNK_SIZE, RequestTimings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TIMING_SAMPLES = int(os.getenv("TIMING_SAMPLES", 4))
+TIMING_TIMEOUT = float(os.getenv("TIMING_TIMEOUT", 5))
+TIMING_MAX_BYTES = int(os.getenv("TIMING_MAX_BYTES", 2 * 1024 * 1024))
+MAX_REDIRECTS = 3
+# Only encodings the probe can decode are offered, otherwise the compression ratio would be unknown
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+PHASES = ["dns", "tcp", "tls", "connect", "ttfb", "download", "headers", "total"]
+
+
+def decompressor(encoding):
+    encoding = (encoding or "").lower().strip()
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompressobj()
+    if encoding == "br" and brotli:
+        return brotli.Decompressor()
+    return None
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+def summarize(samples):
+    summary = {}
+    for phase in PHASES:
+        values = [sample["phases"][phase] for sample in samples if sample["phases"].get(phase) is not None]
+        if values:
+            summary[phase] = {"median": statistics.median(values), "p90": percentile(values, 0.9)}
+    return summary
+
+
+async def measure_tcp_connect(address, port, timeout):
+    started_at = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    elapsed = time.perf_counter() - started_at
+    writer.close()
+    return elapsed
+
+
+class TimingProbe:
+    def __init__(self, http_client, resolver, samples=None, timeout=None, max_bytes=None):
+        self.http_client = http_client
+        self.resolver = resolver
+        self.samples = samples or TIMING_SAMPLES
+        self.timeout = timeout or TIMING_TIMEOUT
+        self.max_bytes = max_bytes or TIMING_MAX_BYTES
+
+    async def resolve_redirects(self, url):
+        # Redirect hops would mix several requests into one set of marks, so only the final URL is sampled.
+        # Bodies are read so the last connection stays in the pool for the warm samples
+        for _ in range(MAX_REDIRECTS):
+            async with self.http_client.get(url, timeout=self.timeout, allow_redirects=False) as response:
+                read = 0
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    read += len(chunk)
+                    if read >= self.max_bytes:
+                        break
+                location = response.headers.get("Location")
+                if response.status not in (301, 302, 303, 307, 308) or not location:
+                    return url
+                url = str(URL(url).join(URL(location)))
+        return url
+
+    async def tcp_target(self, url):
+        # Upstream overrides decide where the connection really goes, the raw TCP connect has to follow them
+        target = URL(url)
+        if self.http_client.upstream_overrides:
+            target = URL(str(self.http_client.override_upstream(url, {})[0]))
+        address = await self.resolver.resolve_address(target.host) if self.resolver else target.host
+        return target.scheme, address or target.host, target.port
+
+    async def sample(self, url, session, tcp_target):
+        timings = RequestTimings()
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+
+        wire_bytes = 0
+        body_bytes = 0
+        async with self.http_client.get(
+            url, session=session, timeout=self.timeout, allow_redirects=False, auto_decompress=False, headers=headers, trace_request_ctx=timings,
+        ) as response:
+            encoding = response.headers.get("Content-Encoding")
+            decoder = decompressor(encoding)
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                wire_bytes += len(chunk)
+                body_bytes += len(decoder.decompress(chunk)) if decoder else len(chunk)
+                if wire_bytes >= self.max_bytes:
+                    break
+            timings.mark("body_received")
+            status = response.status
+            complete = response.content.at_eof()
+
+        phases = timings.phases()
+        cold = "connect_start" in timings.marks
+        phases["tcp"] = phases["tls"] = None
+        if cold:
+            scheme, address, port = tcp_target
+            # aiohttp reports TCP and TLS as one connect phase, a bare TCP connect right after splits them
+            tcp = await measure_tcp_connect(address, port, self.timeout)
+            if tcp is not None and phases["connect"] is not None:
+                phases["tcp"] = min(tcp, phases["connect"])
+                phases["tls"] = phases["connect"] - phases["tcp"] if scheme == "https" else None
+
+        return {
+            "cold": cold,
+            "status": status,
+            "phases": phases,
+            "wire_bytes": wire_bytes,
+            "body_bytes": body_bytes if decoder or not encoding else None,
+            "encoding": encoding or "identity",
+            "complete": complete,
+        }
+
+    def snapshot_sample(self, snapshot):
+        # A complete page fetch that needed no redirect already is a sample, its connection is still pooled for the warm ones
+        if snapshot.redirected or snapshot.truncated or snapshot.timings.get("total") is None:
+            return None
+        return {"cold": snapshot.timings["connect"] is not None, "phases": dict(snapshot.timings, tcp=None, tls=None)}
+
+    async def run(self, url, snapshot=None):
+        report = {"url": url, "samples": 0, "errors": [], "cold": {}, "warm": {}}
+        first = None
+        try:
+            if snapshot and not snapshot.error:
+                url = snapshot.final_url if snapshot.redirected else url
+                first = self.snapshot_sample(snapshot)
+            else:
+                url = await self.resolve_redirects(url)
+            tcp_target = await self.tcp_target(url)
+        except Exception as e:
+            report["errors"].append(str(e) or type(e).__name__)
+            return report
+        report["url"] = url
+
+        # The first half runs on a session that never reuses a connection, the rest on the shared pool
+        cold_samples = max(self.samples // 2, 1) - bool(first and first["cold"])
+        samples = []
+        async with self.http_client.create_cold_session() as cold_session:
+            for index in range(max(self.samples - bool(first), 1)):
+                try:
+                    samples.append(await self.sample(url, cold_session if index < cold_samples else None, tcp_target))
+                except Exception as e:
+                    report["errors"].append(str(e) or type(e).__name__)
+
+        if not samples:
+            return report
+        # Transfer figures below come from the probe's own samples, only they read the raw body
+        if first:
+            samples.insert(0, first)
+        report["samples"] = len(samples)
+
+        report["cold"] = summarize([sample for sample in samples if sample["cold"]])
+        report["warm"] = summarize([sample for sample in samples if not sample["cold"]])
+        report["all"] = summarize(samples)
+        report["cold_samples"] = sum(sample["cold"] for sample in samples)
+        report["status"] = samples[-1]["status"]
+        report["encoding"] = samples[-1]["encoding"]
+        report["wire_bytes"] = samples[-1]["wire_bytes"]
+        report["body_bytes"] = samples[-1]["body_bytes"]
+        report["truncated"] = not samples[-1]["complete"]
+        if report["body_bytes"] and report["wire_bytes"]:
+            report["compression_ratio"] = report["body_bytes"] / report["wire_bytes"]
+        return report
+
+
+def median_phase(report, phase, group="all"):
+    stats = report.get(group, {}).get(phase)
+    return stats["median"] if stats else None
+
+
+def format_size(size):
+    return f"{size / 1024:.1f} KB" if size >= 1024 else f"{size} B"
+
+
+def describe_phases(summary, phases):
+    parts = [f"{label} {summary[phase]['median'] * 1000:.0f}ms" for phase, label in phases if phase in summary]
+    if "total" in summary:
+        parts.append(f"p90 {summary['total']['p90'] * 1000:.0f}ms")
+    return " · ".join(parts)
+
+
+def describe_timing_report(report):
+    if not report["samples"]:
+        return "⚠️ Could not measure response time" + (f" ({report['errors'][0]})" if report["errors"] else "")
+
+    lines = []
+    cold = describe_phases(report["cold"], [("dns", "DNS"), ("tcp", "TCP"), ("tls", "TLS"), ("ttfb", "TTFB"), ("total", "Total")])
+    if cold:
+        lines.append(f"🧊 **Cold** ({report['cold_samples']}x): {cold}")
+    warm = describe_phases(report["warm"], [("ttfb", "TTFB"), ("download", "Download"), ("total", "Total")])
+    if warm:
+        lines.append(f"🔥 **Warm** ({report['samples'] - report['cold_samples']}x): {warm}")
+
+    transfer = f"📦 **Transfer:** {format_size(report['wire_bytes'])} {report['encoding']}"
+    if report.get("compression_ratio") and report["encoding"] != "identity":
+        transfer += f" for {format_size(report['body_bytes'])} ({report['compression_ratio']:.1f}x)"
+    if report["truncated"]:
+        transfer += " · stopped early"
+    lines.append(transfer)
+    if report["errors"]:
+        lines.append(f"⚠️ {len(report['errors'])} sample(s) failed")
+    return "\n".join(lines)
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import ssl
+import time
+from collections import OrderedDict
+
+from core.x509 import Certificate
+
+PROTOCOLS = {
+    "TLSv1": ssl.TLSVersion.TLSv1,
+    "TLSv1.1": ssl.TLSVersion.TLSv1_1,
+    "TLSv1.2": ssl.TLSVersion.TLSv1_2,
+    "TLSv1.3": ssl.TLSVersion.TLSv1_3,
+}
+
+
+def peer_chain(sslobj):
+    # SSLObject.get_unverified_chain is public from Python 3.13, older versions only expose it on the C object
+    if hasattr(sslobj, "get_unverified_chain"):
+        chain = sslobj.get_unverified_chain()
+    else:
+        chain = getattr(sslobj._sslobj, "get_unverified_chain", lambda: None)()
+    return [cert if isinstance(cert, bytes) else cert.public_bytes(ssl._ssl.ENCODING_DER) for cert in chain or []]
+
+
+def describe_certificate(certificate):
+    return {
+        "subject": certificate.common_name,
+        "issuer": certificate.issuer_name,
+        "expires": certificate.not_after.strftime("%Y-%m-%d"),
+        "key": certificate.describe_key(),
+    }
+
+
+class TlsProbe:
+    def __init__(self):
+        self.timeout = float(os.getenv("TLS_TIMEOUT", 5))
+        self.ticket_wait = float(os.getenv("TLS_TICKET_WAIT", 0.2))
+        self.max_entries = int(os.getenv("TLS_CACHE_MAX_ENTRIES", 2000))
+        # One context per purpose for the whole process, sessions can only resume on the context that created them
+        self.context = ssl.create_default_context()
+        self.insecure_context = self.create_probe_context()
+        self.protocol_contexts = {}
+        for name, version in PROTOCOLS.items():
+            try:
+                self.protocol_contexts[name] = self.create_probe_context(version)
+            except (ValueError, ssl.SSLError):
+                pass
+        self.sessions = OrderedDict()
+        self.analyses = OrderedDict()
+        self.counters = {"handshakes": 0, "resumed": 0, "cache_hits": 0, "verify_failures": 0}
+
+    def create_probe_context(self, version=None):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        if version is not None:
+            # Legacy protocols are disabled by the default security level, the probe only asks whether they work
+            context.set_ciphers("ALL:@SECLEVEL=0")
+            context.minimum_version = version
+            context.maximum_version = version
+        return context
+
+    def remember(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    async def handshake(self, context, host, address, port, session=None):
+        reader, writer = await asyncio.open_connection(address, port)
+        incoming, outgoing = ssl.MemoryBIO(), ssl.MemoryBIO()
+        sslobj = context.wrap_bio(incoming, outgoing, server_hostname=host, session=session)
+        self.counters["handshakes"] += 1
+        try:
+            while True:
+                try:
+                    sslobj.do_handshake()
+                    break
+                except ssl.SSLWantReadError:
+                    pass
+                finally:
+                    if outgoing.pending:
+                        writer.write(outgoing.read())
+                        await writer.drain()
+
+                data = await reader.read(65536)
+                if not data:
+                    raise ConnectionResetError("Connection closed during the TLS handshake")
+                incoming.write(data)
+
+            # TLS 1.3 servers send session tickets after the handshake, wait briefly so the session can resume
+            if context is self.context and sslobj.version() == "TLSv1.3" and not sslobj.session_reused:
+                try:
+                    data = await asyncio.wait_for(reader.read(65536), self.ticket_wait)
+                    incoming.write(data)
+                    sslobj.read(1)
+                except (asyncio.TimeoutError, ssl.SSLError):
+                    pass
+            return sslobj
+        finally:
+            writer.close()
+
+    async def supports(self, name, host, address, port):
+        try:
+            await asyncio.wait_for(self.handshake(self.protocol_contexts[name], host, address, port), self.timeout)
+            return True
+        except ssl.SSLError:
+            return False
+        except (OSError, asyncio.TimeoutError):
+            return None
+
+    async def probe_protocols(self, host, address, port):
+        names = list(self.protocol_contexts)
+        results = await asyncio.gather(*(self.supports(name, host, address, port) for name in names))
+        return [name for name, supported in zip(names, results) if supported]
+
+    async def probe(self, host, address=None, port=443, protocols=True):
+        address = address or host
+        key = f"{host}:{port}"
+        verify_error = None
+
+        try:
+            sslobj = await asyncio.wait_for(self.handshake(self.context, host, address, port, self.sessions.get(key)), self.timeout)
+        except ssl.SSLCertVerificationError as e:
+            # Untrusted or expired certificates are still worth reporting, fetch them without verification
+            self.counters["verify_failures"] += 1
+            verify_error = e.verify_message
+            sslobj = await asyncio.wait_for(self.handshake(self.insecure_context, host, address, port), self.timeout)
+
+        if verify_error is None and sslobj.session is not None:
+            self.remember(self.sessions, key, sslobj.session)
+        if sslobj.session_reused:
+            self.counters["resumed"] += 1
+
+        leaf = sslobj.getpeercert(binary_form=True)
+        analysis = await self.analyze(key, leaf, sslobj, host, address, port, protocols)
+        certificate = analysis["certificate"]
+
+        return {
+            "host": host,
+            "address": address,
+            "port": port,
+            "tls_version": sslobj.version(),
+            "cipher": sslobj.cipher()[0],
+            "session_reused": sslobj.session_reused,
+            "verified": verify_error is None,
+            "verify_error": verify_error,
+            "fingerprint": certificate.fingerprint,
+            "subject": certificate.common_name,
+            "issuer": certificate.issuer_name,
+            "expires": certificate.not_after.strftime("%Y-%m-%d"),
+            "days_left": certificate.days_left(),
+            "valid": verify_error is None and certificate.days_left() > 0,
+            "alt_names": certificate.alt_names,
+            "key": certificate.describe_key(),
+            "ocsp_urls": certificate.ocsp_urls,
+            "chain": analysis["chain"],
+            "protocols": analysis["protocols"],
+        }
+
+    async def analyze(self, key, leaf, sslobj, host, address, port, protocols):
+        # Chain and protocol support only change with the certificate, so they are cached by fingerprint until expiry
+        cached = self.analyses.get(key)
+        if cached and cached["certificate"].der == leaf and cached["certificate"].days_left() > 0:
+            self.counters["cache_hits"] += 1
+            if protocols and cached["protocols"] is None:
+                cached["protocols"] = await self.probe_protocols(host, address, port)
+            return cached
+
+        # A resumed session does not resend the chain, the leaf alone still describes the certificate
+        chain = peer_chain(sslobj) or [leaf]
+        certificates = [Certificate(der) for der in chain]
+        if certificates[0].der != leaf:
+            certificates.insert(0, Certificate(leaf))
+
+        analysis = {
+            "certificate": certificates[0],
+            "chain": [describe_certificate(certificate) for certificate in certificates],
+            "protocols": await self.probe_protocols(host, address, port) if protocols else None,
+            "checked_at": time.time(),
+        }
+        self.remember(self.analyses, key, analysis)
+        return analysis
+
+    def stats(self):
+        return dict(self.counters, sessions=len(self.sessions), cached=len(self.analyses))
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import time
+from collections import deque
+from urllib.parse import urlencode
+
+CDX_URL = "https://web.archive.org/cdx/search/cdx"
+# Granularity -> server side collapse, one capture per day or hour, or only captures whose content changed
+COLLAPSE_MODES = {"day": "timestamp:8", "hour": "timestamp:10", "change": "digest"}
+CDX_PAGE_SIZE = int(os.getenv("CDX_PAGE_SIZE", 5000))
+ARCHIVE_TIMELINE_BUDGET = float(os.getenv("ARCHIVE_TIMELINE_BUDGET", 10))
+ARCHIVE_TIMELINE_REFRESH = float(os.getenv("ARCHIVE_TIMELINE_REFRESH", 3600))
+ARCHIVE_TIMELINE_TTL = float(os.getenv("ARCHIVE_TIMELINE_TTL_DAYS", 30)) * 86400
+# The lookup cache already stores /webarchive snapshots under "wayback", timelines get a namespace of their own
+STORE_NAMESPACE = "wayback_cdx"
+RECENT_CHANGES = 10
+SPARKS = "▁▂▃▄▅▆▇█"
+
+
+class CdxError(Exception):
+    pass
+
+
+class Timeline:
+    # Monthly counters and the last few changes, memory stays the same no matter how many captures stream through
+    def __init__(self, url, mode, state=None):
+        state = state or {}
+        self.url = url
+        self.mode = mode
+        self.months = state.get("months", {})
+        self.change_months = state.get("change_months", {})
+        self.captures = state.get("captures", 0)
+        self.changes = state.get("changes", 0)
+        self.first = state.get("first")
+        self.first_original = state.get("first_original")
+        self.last = state.get("last")
+        self.last_digest = state.get("last_digest")
+        self.last_original = state.get("last_original")
+        self.recent = deque((tuple(change) for change in state.get("recent", [])), maxlen=RECENT_CHANGES)
+        self.complete = state.get("complete", False)
+        self.fetched_at = state.get("fetched_at", 0)
+        self.error = None
+
+    def add(self, timestamp, digest, original):
+        if len(timestamp) != 14 or not timestamp.isdigit():
+            return
+        # Incremental fetches start at the last seen timestamp, the boundary capture must not count twice
+        if self.last and timestamp <= self.last:
+            return
+        collapse = COLLAPSE_MODES[self.mode]
+        if self.last and collapse.startswith("timestamp:"):
+            digits = int(collapse.split(":")[1])
+            if timestamp[:digits] == self.last[:digits]:
+                return
+
+        month = timestamp[:6]
+        self.months[month] = self.months.get(month, 0) + 1
+        self.captures += 1
+        if self.last_digest is not None and digest != self.last_digest:
+            self.changes += 1
+            self.change_months[month] = self.change_months.get(month, 0) + 1
+            self.recent.append((timestamp, original))
+        self.last_digest = digest
+        if not self.first:
+            self.first, self.first_original = timestamp, original
+        self.last = timestamp
+        self.last_original = original
+
+    def years(self):
+        years = {}
+        for month, count in self.months.items():
+            year = years.setdefault(month[:4], {"months": [0] * 12, "captures": 0, "changes": 0})
+            year["months"][int(month[4:]) - 1] = count
+            year["captures"] += count
+        for month, count in self.change_months.items():
+            years.setdefault(month[:4], {"months": [0] * 12, "captures": 0, "changes": 0})["changes"] += count
+        return dict(sorted(years.items()))
+
+    def to_dict(self):
+        return {
+            "months": self.months,
+            "change_months": self.change_months,
+            "captures": self.captures,
+            "changes": self.changes,
+            "first": self.first,
+            "first_original": self.first_original,
+            "last": self.last,
+            "last_digest": self.last_digest,
+            "last_original": self.last_original,
+            "recent": list(self.recent),
+            "complete": self.complete,
+            "fetched_at": self.fetched_at,
+        }
+
+
+def sparkline(values):
+    peak = max(values) or 1
+    return "".join(" " if not value else SPARKS[min(value * len(SPARKS) // (peak + 1), len(SPARKS) - 1)] for value in values)
+
+
+def snapshot_link(timestamp, original):
+    return f"https://web.archive.org/web/{timestamp}/{original}"
+
+
+def format_timestamp(timestamp):
+    return f"{timestamp[:4]}-{timestamp[4:6]}-{timestamp[6:8]}"
+
+
+class WaybackClient:
+    def __init__(self, http_client, store):
+        self.http_client = http_client
+        self.store = store
+        self.inflight = {}
+        self.counters = {"pages": 0, "rows": 0, "cached": 0, "incremental": 0, "errors": 0}
+
+    def cdx_url(self, url, fields, collapse=None, since=None, resume_key=None, limit=CDX_PAGE_SIZE):
+        params = [("url", url), ("fl", ",".join(fields)), ("filter", "statuscode:200"), ("limit", limit), ("showResumeKey", "true")]
+        if collapse:
+            params.append(("collapse", collapse))
+        if since:
+            params.append(("from", since))
+        if resume_key:
+            params.append(("resumeKey", resume_key))
+        return f"{CDX_URL}?{urlencode(params)}"
+
+    async def fetch_page(self, url, on_row, deadline):
+        # Text output is one capture per line, followed by a blank line and the resume key when more pages exist
+        resume_key = None
+        after_blank = False
+        async with self.http_client.get(url, timeout=max(deadline - time.monotonic(), 1)) as response:
+            if response.status != 200:
+                raise CdxError(f"Archive.org answered HTTP {response.status}")
+            self.counters["pages"] += 1
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    after_blank = True
+                elif after_blank:
+                    resume_key = line.decode("utf-8", "replace")
+                else:
+                    self.counters["rows"] += 1
+                    on_row(line.decode("utf-8", "replace").split(" "))
+                if time.monotonic() > deadline:
+                    return None, False
+        return resume_key, True
+
+    async def stream(self, url, fields, on_row, deadline, collapse=None, since=None, limit=CDX_PAGE_SIZE, max_rows=None):
+        # Follows resume keys page by page, returns False when the deadline or max_rows cut it short
+        resume_key = None
+        seen = 0
+
+        def count(row):
+            nonlocal seen
+            seen += 1
+            on_row(row)
+
+        while True:
+            page_size = limit if max_rows is None else min(limit, max_rows - seen)
+            resume_key, finished = await self.fetch_page(self.cdx_url(url, fields, collapse, since, resume_key, page_size), count, deadline)
+            if not finished:
+                return False
+            if not resume_key:
+                return True
+            if time.monotonic() > deadline or (max_rows is not None and seen >= max_rows):
+                return False
+
+    async def snapshots(self, url, limit=5, timeout=5):
+        rows = []
+        await self.stream(url, ("timestamp", "original"), lambda row: rows.append(row[:2]), time.monotonic() + timeout, limit=limit, max_rows=limit)
+        return rows
+
+    async def timeline(self, url, mode="day"):
+        key = f"{mode}:{url}"
+        # Concurrent requests for the same site share one fetch
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(self.refresh(url, mode, key))
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def refresh(self, url, mode, key):
+        timeline = Timeline(url, mode, await self.store.get(STORE_NAMESPACE, key))
+        if timeline.complete and time.time() - timeline.fetched_at < ARCHIVE_TIMELINE_REFRESH:
+            self.counters["cached"] += 1
+            return timeline
+        if timeline.last:
+            self.counters["incremental"] += 1
+
+        # Only captures after the last seen one are fetched, an unfinished history continues where it stopped
+        deadline = time.monotonic() + ARCHIVE_TIMELINE_BUDGET
+
+        def add(row):
+            if len(row) >= 3:
+                timeline.add(*row[:3])
+
+        try:
+            timeline.complete = await self.stream(url, ("timestamp", "digest", "original"), add, deadline, COLLAPSE_MODES[mode], timeline.last)
+        except Exception as e:
+            self.counters["errors"] += 1
+            timeline.complete = False
+            timeline.error = str(e) or type(e).__name__
+            if not timeline.captures:
+                raise
+
+        timeline.fetched_at = time.time()
+        self.store.put(STORE_NAMESPACE, key, timeline.to_dict(), ttl=ARCHIVE_TIMELINE_TTL)
+        return timeline
+
+    def stats(self):
+        return dict(self.counters, inflight=len(self.inflight))
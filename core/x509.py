@@ -0,0 +1,177 @@
+import hashlib
+import ipaddress
+from datetime import datetime, timezone
+
+# Just enough DER to read the fields the TLS probe reports, the ssl module only decodes verified peer certificates
+NAME_OIDS = {
+    "2.5.4.3": "common_name",
+    "2.5.4.6": "country",
+    "2.5.4.10": "organization",
+    "2.5.4.11": "organizational_unit",
+}
+KEY_OIDS = {
+    "1.2.840.113549.1.1.1": "RSA",
+    "1.2.840.10045.2.1": "EC",
+    "1.3.101.112": "Ed25519",
+    "1.3.101.113": "Ed448",
+    "1.2.840.10040.4.1": "DSA",
+}
+CURVE_OIDS = {
+    "1.2.840.10045.3.1.7": ("P-256", 256),
+    "1.3.132.0.34": ("P-384", 384),
+    "1.3.132.0.35": ("P-521", 521),
+}
+KEY_SIZES = {"Ed25519": 256, "Ed448": 456}
+SUBJECT_ALT_NAME = "2.5.29.17"
+AUTHORITY_INFO_ACCESS = "1.3.6.1.5.5.7.1.1"
+OCSP = "1.3.6.1.5.5.7.48.1"
+CA_ISSUERS = "1.3.6.1.5.5.7.48.2"
+
+
+class DerError(ValueError):
+    pass
+
+
+def read_element(data, offset):
+    if offset + 2 > len(data):
+        raise DerError("Truncated DER element")
+    tag, length = data[offset], data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7F
+        if not 0 < count <= 4:
+            raise DerError("Unsupported DER length")
+        length = int.from_bytes(data[offset:offset + count], "big")
+        offset += count
+    end = offset + length
+    if end > len(data):
+        raise DerError("Truncated DER element")
+    return tag, data[offset:end], end
+
+
+def children(data):
+    elements = []
+    offset = 0
+    while offset < len(data):
+        tag, value, offset = read_element(data, offset)
+        elements.append((tag, value))
+    return elements
+
+
+def decode_oid(value):
+    numbers = []
+    number = 0
+    for byte in value:
+        number = (number << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            numbers.append(number)
+            number = 0
+    if not numbers:
+        raise DerError("Empty object identifier")
+    # The first subidentifier packs two arcs and can span several bytes under arc 2, e.g. 2.999
+    first = min(numbers[0] // 40, 2)
+    return ".".join(map(str, [first, numbers[0] - 40 * first] + numbers[1:]))
+
+
+def decode_string(tag, value):
+    if tag == 0x1E:
+        return value.decode("utf-16-be", "replace")
+    return value.decode("utf-8", "replace")
+
+
+def decode_time(tag, value):
+    text = value.decode("ascii")
+    parsed = datetime.strptime(text, "%y%m%d%H%M%SZ" if tag == 0x17 else "%Y%m%d%H%M%SZ")
+    return parsed.replace(tzinfo=timezone.utc)
+
+
+def decode_name(value):
+    attributes = {}
+    for _, relative_name in children(value):
+        for _, pair in children(relative_name):
+            (_, oid), (tag, text) = children(pair)[:2]
+            name = NAME_OIDS.get(decode_oid(oid))
+            if name:
+                attributes.setdefault(name, decode_string(tag, text))
+    return attributes
+
+
+def decode_public_key(value):
+    (_, algorithm), (_, key) = children(value)[:2]
+    algorithm = children(algorithm)
+    key_type = KEY_OIDS.get(decode_oid(algorithm[0][1]), decode_oid(algorithm[0][1]))
+
+    if key_type == "RSA":
+        # The bit string holds an RSAPublicKey sequence, the first byte counts unused bits
+        modulus = children(children(key[1:])[0][1])[0][1]
+        return key_type, int.from_bytes(modulus, "big").bit_length()
+    if key_type == "EC" and len(algorithm) > 1 and algorithm[1][0] == 0x06:
+        curve = decode_oid(algorithm[1][1])
+        name, size = CURVE_OIDS.get(curve, (curve, None))
+        return f"EC {name}", size
+    return key_type, KEY_SIZES.get(key_type)
+
+
+class Certificate:
+    def __init__(self, der):
+        self.der = der
+        self.fingerprint = hashlib.sha256(der).hexdigest()
+        self.alt_names = []
+        self.ocsp_urls = []
+        self.ca_issuer_urls = []
+
+        try:
+            tbs = children(children(children(der)[0][1])[0][1])
+            # The version field is optional and tagged [0], everything after it is positional
+            index = 1 if tbs[0][0] == 0xA0 else 0
+            self.serial = tbs[index][1].hex()
+            self.issuer = decode_name(tbs[index + 2][1])
+            not_before, not_after = children(tbs[index + 3][1])[:2]
+            self.not_before = decode_time(*not_before)
+            self.not_after = decode_time(*not_after)
+            self.subject = decode_name(tbs[index + 4][1])
+            self.key_type, self.key_size = decode_public_key(tbs[index + 5][1])
+            for tag, value in tbs[index + 6:]:
+                if tag == 0xA3:
+                    self.parse_extensions(children(value)[0][1])
+        except (IndexError, ValueError) as e:
+            raise DerError(f"Could not parse certificate: {e}")
+
+    def parse_extensions(self, value):
+        for _, extension in children(value):
+            parts = children(extension)
+            oid, data = decode_oid(parts[0][1]), parts[-1][1]
+
+            if oid == SUBJECT_ALT_NAME:
+                for tag, name in children(children(data)[0][1]):
+                    if tag == 0x82:
+                        self.alt_names.append(name.decode("ascii", "replace"))
+                    elif tag == 0x87:
+                        self.alt_names.append(str(ipaddress.ip_address(name)))
+            elif oid == AUTHORITY_INFO_ACCESS:
+                for _, access in children(children(data)[0][1]):
+                    (_, method), (tag, location) = children(access)[:2]
+                    if tag != 0x86:
+                        continue
+                    if decode_oid(method) == OCSP:
+                        self.ocsp_urls.append(location.decode("ascii", "replace"))
+                    elif decode_oid(method) == CA_ISSUERS:
+                        self.ca_issuer_urls.append(location.decode("ascii", "replace"))
+
+    @property
+    def common_name(self):
+        return self.subject.get("common_name") or self.subject.get("organization") or "Unknown"
+
+    @property
+    def issuer_name(self):
+        return self.issuer.get("organization") or self.issuer.get("common_name") or "Unknown"
+
+    @property
+    def self_signed(self):
+        return self.issuer == self.subject
+
+    def days_left(self):
+        return (self.not_after - datetime.now(timezone.utc)).total_seconds() / 86400
+
+    def describe_key(self):
+        return f"{self.key_type} {self.key_size}" if self.key_size else self.key_type
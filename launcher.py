@@ -0,0 +1,121 @@
+from dotenv import load_dotenv
+import aiohttp
+import asyncio
+import os
+import signal
+import sys
+import time
+
+load_dotenv()
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+
+async def recommended_shard_count(token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def split_shards(shard_count, processes):
+    # Round robin keeps guild load even, shard ids are assigned to guilds by (guild_id >> 22) % shard_count
+    return [list(range(index, shard_count, processes)) for index in range(min(processes, shard_count))]
+
+
+class ShardProcess:
+    def __init__(self, index, shard_ids):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+
+
+class Supervisor:
+    def __init__(self, shard_count, groups):
+        self.shard_count = shard_count
+        self.shards = [ShardProcess(index, shard_ids) for index, shard_ids in enumerate(groups)]
+        self.metrics_port = int(os.getenv("METRICS_PORT", 9464))
+        self.restart_delay = float(os.getenv("SHARD_RESTART_DELAY", 1))
+        self.restart_max_delay = float(os.getenv("SHARD_RESTART_MAX_DELAY", 60))
+        self.stable_seconds = float(os.getenv("SHARD_STABLE_SECONDS", 300))
+        self.stop_timeout = float(os.getenv("SHARD_STOP_TIMEOUT", 15))
+        self.stopping = asyncio.Event()
+
+    def environment(self, shard):
+        env = dict(os.environ)
+        env["SHARD_COUNT"] = str(self.shard_count)
+        env["SHARD_IDS"] = ",".join(map(str, shard.shard_ids))
+        env["SHARD_PROCESS_INDEX"] = str(shard.index)
+        env["SHARD_PROCESS_COUNT"] = str(len(self.shards))
+        # Every process exposes its own metrics endpoint on consecutive ports
+        if self.metrics_port:
+            env["METRICS_PORT"] = str(self.metrics_port + shard.index)
+        return env
+
+    async def supervise(self, shard):
+        while not self.stopping.is_set():
+            print(f"[launcher] Starting process {shard.index} with shards {shard.shard_ids}")
+            shard.started_at = time.monotonic()
+            shard.process = await asyncio.create_subprocess_exec(
+                sys.executable, "main.py", env=self.environment(shard),
+                # Own session, so a Ctrl+C on the terminal reaches the supervisor only and is forwarded once
+                start_new_session=True,
+            )
+            return_code = await shard.process.wait()
+
+            if self.stopping.is_set():
+                return
+            if return_code == 0:
+                print(f"[launcher] Process {shard.index} exited cleanly, not restarting")
+                return
+
+            # A process that stayed up for a while starts over with a short delay
+            if time.monotonic() - shard.started_at > self.stable_seconds:
+                shard.restarts = 0
+            delay = min(self.restart_max_delay, self.restart_delay * 2 ** shard.restarts)
+            shard.restarts += 1
+            print(f"[launcher] Process {shard.index} exited with code {return_code}, restarting in {delay:.0f}s")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        self.stopping.set()
+        running = [shard.process for shard in self.shards if shard.process and shard.process.returncode is None]
+        # SIGINT lets every bot close its sessions, store and scans before exiting
+        for process in running:
+            process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in running)), self.stop_timeout)
+        except asyncio.TimeoutError:
+            for process in running:
+                if process.returncode is None:
+                    process.kill()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(self.stop()))
+        await asyncio.gather(*(self.supervise(shard) for shard in self.shards))
+
+
+async def main():
+    shard_count = int(os.getenv("SHARD_COUNT", 0))
+    if not shard_count:
+        try:
+            shard_count = await recommended_shard_count(os.getenv("TOKEN"))
+        except Exception as e:
+            print(f"[launcher] Could not fetch the recommended shard count: {e}")
+            return 1
+
+    processes = int(os.getenv("SHARD_PROCESSES", 0)) or os.cpu_count() or 1
+    groups = split_shards(shard_count, processes)
+    print(f"[launcher] Running {shard_count} shards in {len(groups)} processes")
+    await Supervisor(shard_count, groups).run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,41 +1,238 @@
+import time
+started_at = time.perf_counter()
+
 import discord
 from discord.ext import commands
 from discord import app_commands
 from dotenv import load_dotenv
 import os
 import asyncio
+import hashlib
+import json
+from functools import cached_property
+from core.http_client import HttpClient
+from core.scan_jobs import ScanQueue
+from core.cache import LookupCache
+from core.store import ResultStore
+from core.dns_resolver import DnsResolver
+from core.metrics import MetricsServer, instrument_tree, registry
+from core.governor import CIRCUIT_STATES
+from core.shared_state import create_state
 
 load_dotenv()
+imported_at = time.perf_counter()
+
 
+def parse_shard_ids(value):
+    return [int(shard_id) for shard_id in value.split(",") if shard_id.strip()] or None
 
-class MuffinBot(commands.Bot):
+
+class MuffinBot(commands.AutoShardedBot):
     def __init__(self):
+        # The launcher hands every process its slice of shards, a plain `python main.py` runs all of them
+        shard_count = int(os.getenv("SHARD_COUNT", 0)) or None
         super().__init__(
+            shard_ids=parse_shard_ids(os.getenv("SHARD_IDS", "")) if shard_count else None,
+            shard_count=shard_count,
             command_prefix="/",
             intents=discord.Intents.default(),
             activity=discord.Activity(type=discord.ActivityType.playing, name=os.getenv('STATUS', 'lytex.dev')),
             status=discord.Status.online,
             help_command=None,
         )
+        self.process_index = int(os.getenv("SHARD_PROCESS_INDEX", 0))
+        self.state = create_state()
+        self.store = ResultStore()
+        self.http_client = HttpClient()
+        self.resolver = DnsResolver(self.http_client)
+        self.http_client.dns_resolver = self.resolver
+        self.scan_queue = ScanQueue(store=self.store, state=self.state)
+        self.cache = LookupCache()
+        self.cache.store = self.store
+        if self.state.shared:
+            self.cache.shared = self.state
+        self.metrics_server = MetricsServer()
+        registry.add_collector(self.collect_metrics)
+        self.startup = {"imports": imported_at - started_at}
+        self.extension_timings = {}
+        self.phase_started_at = imported_at
+        self.sync_task = None
+        self.mark_startup("services")
+
+    # Optional subsystems are imported and built on first use, a bot that never needs one never pays for it
+    @cached_property
+    def tls_probe(self):
+        from core.tls_probe import TlsProbe
+        return TlsProbe()
+
+    @cached_property
+    def wayback(self):
+        from core.wayback import WaybackClient
+        return WaybackClient(self.http_client, self.store)
+
+    @cached_property
+    def breach_index(self):
+        from core.breach_index import BreachIndex
+        return BreachIndex()
+
+    @cached_property
+    def ip_intel(self):
+        from core.ip_intel import IpIntel
+        return IpIntel()
+
+    @cached_property
+    def reverse_ip(self):
+        from core.reverse_ip import ReverseIpIndex
+        index = ReverseIpIndex()
+        self.resolver.observers.append(index.observe)
+        return index
+
+    def built(self, name):
+        return self.__dict__.get(name)
+
+    def mark_startup(self, phase):
+        now = time.perf_counter()
+        self.startup[phase] = now - self.phase_started_at
+        self.phase_started_at = now
+
+    def describe_startup(self):
+        phases = " · ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup.items())
+        slowest = sorted(self.extension_timings.items(), key=lambda item: item[1], reverse=True)[:3]
+        extensions = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in slowest)
+        return f"Ready {time.perf_counter() - started_at:.2f}s after start: {phases} (slowest modules: {extensions or 'none'})"
+
+    async def setup_hook(self):
+        self.mark_startup("login")
+        await self.store.start()
+        await self.http_client.start()
+        await self.scan_queue.start()
+        # The reverse IP index records every resolution, it has to be listening before the first command
+        await self.reverse_ip.start()
+        if os.getenv("IP_INTEL_PATHS", "").strip():
+            await self.ip_intel.start()
+        instrument_tree(self.tree)
+        await self.metrics_server.start()
+        # Commands are global, syncing them from every shard process would only burn rate limit
+        if self.process_index == 0 and self.application_id:
+            self.sync_task = asyncio.create_task(self.sync_commands())
+        self.mark_startup("setup")
+
+    def command_tree_hash(self):
+        commands = sorted((command.to_dict(self.tree) for command in self.tree.get_commands()), key=lambda command: command["name"])
+        payload = json.dumps({"application_id": self.application_id, "commands": commands}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def sync_commands(self):
+        # Syncing is rate limited by Discord, so it only runs when the commands differ from the last sync
+        digest = self.command_tree_hash()
+        if os.getenv("FORCE_COMMAND_SYNC", "false").lower() != "true" and await self.store.get("bot", "command_tree_hash") == digest:
+            print("Command tree unchanged since the last sync, skipping it.")
+            return
 
-    async def on_ready(self):
-        print(f'{self.user} is now running!')
         try:
             synced = await self.tree.sync()
-            print(f"Synced {len(synced)} commands globally.")
         except Exception as e:
             print(f"Failed to sync commands: {e}")
+            return
+        self.store.put("bot", "command_tree_hash", digest)
+        print(f"Synced {len(synced)} commands globally.")
+
+    async def close(self):
+        if self.sync_task:
+            self.sync_task.cancel()
+            await asyncio.gather(self.sync_task, return_exceptions=True)
+        await self.metrics_server.close()
+        await self.scan_queue.close()
+        await self.http_client.close()
+        if self.built("reverse_ip"):
+            await self.reverse_ip.close()
+        if self.built("breach_index"):
+            self.breach_index.close()
+        if self.built("ip_intel"):
+            await self.ip_intel.close()
+        await self.store.close()
+        await self.state.close()
+        await super().close()
+
+    def collect_metrics(self):
+        pool = self.http_client.stats()
+        samples = [("muffin_http_pool_connections", "Pooled HTTP connections", {"state": state}, pool[state]) for state in ("active", "idle")]
+        samples.append(("muffin_http_pool_reuse_ratio", "Share of requests served on a reused connection", {}, pool["reuse_ratio"]))
+
+        for source, stats in self.cache.stats()["sources"].items():
+            samples.append(("muffin_cache_hit_ratio", "Lookup cache hit ratio", {"source": source}, stats["hit_ratio"]))
+
+        for counter, value in self.resolver.stats().items():
+            if isinstance(value, int):
+                samples.append(("muffin_dns_resolver_total", "DNS resolver counters", {"counter": counter}, value))
+
+        if self.built("tls_probe"):
+            for counter, value in self.tls_probe.stats().items():
+                samples.append(("muffin_tls_probe_total", "TLS probe counters", {"counter": counter}, value))
+
+        if self.built("reverse_ip"):
+            for counter, value in self.reverse_ip.stats().items():
+                samples.append(("muffin_reverse_ip_total", "Reverse IP index counters", {"counter": counter}, value))
+
+        if self.built("breach_index"):
+            for counter, value in self.breach_index.stats().items():
+                samples.append(("muffin_breach_index_total", "Local breach index counters", {"counter": counter}, value))
+
+        if self.built("ip_intel"):
+            for counter, value in self.ip_intel.stats().items():
+                samples.append(("muffin_ip_intel_total", "Local IP dataset counters", {"counter": counter}, value))
+
+        for counter, value in self.scan_queue.scanner.stats().items():
+            samples.append(("muffin_port_scanner_total", "Built-in port scanner counters", {"counter": counter}, value))
+
+        if self.built("wayback"):
+            for counter, value in self.wayback.stats().items():
+                samples.append(("muffin_wayback_total", "Archive.org CDX client counters", {"counter": counter}, value))
+
+        governor = self.http_client.governor
+        for host, stats in governor.stats().items():
+            # Scanned websites come and go, only known upstreams and hosts in trouble are exported
+            if host not in governor.rates and stats["state"] == "closed":
+                continue
+            samples.append(("muffin_governor_rate", "Current allowed requests per second", {"host": host}, stats["rate"]))
+            samples.append(("muffin_governor_tokens", "Tokens left in the host bucket", {"host": host}, stats["tokens"]))
+            samples.append(("muffin_governor_circuit_state", "Circuit state (0 closed, 1 half open, 2 open)", {"host": host}, CIRCUIT_STATES[stats["state"]]))
+
+        samples.append(("muffin_scan_jobs_active", "Queued or running nmap jobs", {}, len(self.scan_queue.active_jobs())))
+        monitor = self.get_cog("Monitor")
+        if monitor:
+            for counter, value in monitor.scheduler.stats().items():
+                samples.append(("muffin_monitor_total", "Watch scheduler counters", {"counter": counter}, value))
+        for shard_id, latency in self.latencies:
+            if latency == float("inf"):
+                continue
+            samples.append(("muffin_shard_latency_seconds", "Gateway heartbeat latency", {"shard": str(shard_id)}, latency))
+        for phase, seconds in self.startup.items():
+            samples.append(("muffin_startup_seconds", "Time spent in each startup phase", {"phase": phase}, seconds))
+        return samples
+
+    async def on_ready(self):
+        print(f'{self.user} is now running on shards {sorted(self.shards)} of {self.shard_count}!')
+        # on_ready fires again after reconnects, only the first one ends the cold start
+        if "gateway" not in self.startup:
+            self.mark_startup("gateway")
+            print(self.describe_startup())
 
 client = MuffinBot()
 
+async def load_extension(file):
+    loading_started_at = time.perf_counter()
+    try:
+        await client.load_extension(f"modules.{file[:-3]}")
+        client.extension_timings[file[:-3]] = time.perf_counter() - loading_started_at
+        print(f"Module loaded: {file}")
+    except Exception as e:
+        print(f"Error loading {file}: {e}")
+
 async def load_extensions():
-    for file in os.listdir("modules"):
-        if file.endswith(".py"):
-            try:
-                await client.load_extension(f"modules.{file[:-3]}")
-                print(f"Module loaded: {file}")
-            except Exception as e:
-                print(f"Error loading {file}: {e}")
+    # Cog setups run concurrently, one slow or failing module does not hold up the others
+    await asyncio.gather(*(load_extension(file) for file in sorted(os.listdir("modules")) if file.endswith(".py")))
+    client.mark_startup("extensions")
 
 async def main():
     async with client:
@@ -1,39 +1,76 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiohttp
+from core.governor import CircuitOpenError
 
 
 class BreachScan(commands.Cog):
     def __init__(self, client):
         self.client = client
 
+    async def fetch_json(self, url):
+        async with self.client.http_client.get(url) as response:
+            if response.status == 200:
+                return await response.json()
+            # XposedOrNot answers 404 for addresses and domains without breaches
+            if response.status == 404:
+                return {}
+            return None
+
     async def check_email(self, email):
         url = f"https://api.xposedornot.com/v1/check-email/{email}"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    return await response.json()
-                return None
+        return await self.client.cache.get_or_fetch("breach", ("check-email", email.lower()), lambda: self.fetch_json(url))
 
     async def check_domain(self, domain):
         url = f"https://api.xposedornot.com/v1/breaches?domain={domain}"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    return await response.json()
-                return None
+        return await self.client.cache.get_or_fetch("breach", ("domain", domain.lower()), lambda: self.fetch_json(url))
 
     async def get_breach_details(self, email):
         url = f"https://api.xposedornot.com/v1/breach-analytics?email={email}"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    return await response.json()
-                return None
+        return await self.client.cache.get_or_fetch("breach", ("analytics", email.lower()), lambda: self.fetch_json(url))
+
+    def local_lookup(self, lookup, target):
+        # None means the API has to answer: no index, a hit that needs details, or a miss in an outdated index
+        index = self.client.breach_index
+        matches = lookup(target)
+        if matches is None:
+            return None, None
+        if matches or index.stale:
+            return None, matches
+        return matches, matches
+
+    async def domain_breach_row(self, domain):
+        answer, local = self.local_lookup(self.client.breach_index.lookup_domain, domain)
+        if answer is not None:
+            return {"breaches": 0, "services": "", "source": "local index"}
+        try:
+            results = await self.check_domain(domain)
+        except CircuitOpenError:
+            results = None
+        breaches = (results or {}).get("Breaches") or []
+        # The API being down or answering 404 does not outweigh hits in the local index
+        if not breaches and local:
+            return {"breaches": len(local), "services": " ".join(breach["name"] for breach in local), "source": "local index"}
+        if results is None:
+            return {"error": "Error retrieving breach information"}
+        return {"breaches": len(breaches), "services": " ".join(str(breach) for breach in breaches), "source": "xposedornot"}
+
+    async def email_breach_row(self, email):
+        # Bulk checks only read the local index, the API could not keep up with thousands of addresses
+        matches = self.client.breach_index.lookup_email(email)
+        if matches is None:
+            return {"error": "No local breach index is loaded"}
+        return {
+            "breaches": len(matches),
+            "names": " ".join(breach["name"] for breach in matches),
+            "data_classes": ", ".join(sorted({data_class for breach in matches for data_class in breach["data_classes"]})),
+        }
+
+    def describe_local(self, matches):
+        return "\n".join(f"- {breach['name']}" + (f" ({breach['date']})" if breach.get("date") else "") for breach in matches[:10])
+
+    def local_footer(self):
+        return f"Local breach index built {self.client.breach_index.describe_age()}"
 
     @app_commands.command(name="breachscan", description="Scan an email for data breaches")
     @commands.cooldown(1, 600, commands.BucketType.user)
@@ -41,7 +78,33 @@ class BreachScan(commands.Cog):
         await interaction.response.defer(thinking=True, ephemeral=True)
         
         scan_message = await interaction.followup.send(f"🔍 Scanning `{email}` for data breaches... Please wait.", wait=True)
-        check_result = await self.check_email(email)
+        answer, local = self.local_lookup(self.client.breach_index.lookup_email, email)
+        if answer is not None:
+            embed = discord.Embed(
+                title="✅ No Breaches Found!",
+                description=f"**{email}** is not in any known data breaches.",
+                color=discord.Color.green()
+            )
+            embed.set_footer(text=self.local_footer())
+            await scan_message.edit(content="", embed=embed)
+            return
+
+        try:
+            check_result = await self.check_email(email)
+        except CircuitOpenError as e:
+            check_result = None
+            if not local:
+                await scan_message.edit(content=f"⚠️ {e}")
+                return
+
+        if local and not (check_result or {}).get("breaches"):
+            # The API is down or answered 404, but the local index already knows this address
+            embed = discord.Embed(title=f"⚠️ {email} was found in breaches!", color=discord.Color.red())
+            embed.add_field(name="🔍 Total Breaches", value=f"**{len(local)}** breaches found.", inline=False)
+            embed.add_field(name="📂 Breaches", value=self.describe_local(local), inline=False)
+            embed.set_footer(text=self.local_footer())
+            await scan_message.edit(content="", embed=embed)
+            return
 
         if not check_result or not check_result.get("breaches", []):
             embed = discord.Embed(
@@ -52,7 +115,7 @@ class BreachScan(commands.Cog):
             await scan_message.edit(content="", embed=embed)
             return
 
-        breach_details = await self.get_breach_details(email)
+        breach_details = await self.get_breach_details(email) or {}
         breaches = breach_details.get("DataClasses", [])
 
         embed = discord.Embed(title=f"⚠️ {email} was found in breaches!", color=discord.Color.red())
@@ -70,8 +133,33 @@ class BreachScan(commands.Cog):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
         scan_message = await interaction.followup.send(f"🔍 Scanning `{domain}` for domain-wide data breaches... Please wait.", wait=True)
+        answer, local = self.local_lookup(self.client.breach_index.lookup_domain, domain)
+        if answer is not None:
+            embed = discord.Embed(
+                title="✅ No Breaches Found!",
+                description=f"**{domain}** has not been involved in any known data breaches.",
+                color=discord.Color.green()
+            )
+            embed.set_footer(text=self.local_footer())
+            await scan_message.edit(content="", embed=embed)
+            return
 
-        results = await self.check_domain(domain)
+        try:
+            results = await self.check_domain(domain)
+        except CircuitOpenError as e:
+            results = None
+            if not local:
+                await scan_message.edit(content=f"⚠️ {e}")
+                return
+
+        if local and not (results or {}).get("Breaches"):
+            embed = discord.Embed(title=f"⚠️ {domain} has been breached!", color=discord.Color.red())
+            embed.add_field(name="🔍 Total Breaches", value=f"**{len(local)}** breaches found.", inline=False)
+            affected = "\n".join(f"- {breach['name']}: {breach['count']:,} addresses" for breach in local[:10])
+            embed.add_field(name="📂 Breached Services", value=affected, inline=False)
+            embed.set_footer(text=self.local_footer())
+            await scan_message.edit(content="", embed=embed)
+            return
 
         if not results or not results.get("Breaches"):
             embed = discord.Embed(
@@ -87,6 +175,9 @@ class BreachScan(commands.Cog):
 
         breach_list = "\n".join([f"- {b}" for b in results['Breaches'][:10]])
         embed.add_field(name="📂 Breached Services", value=breach_list, inline=False)
+        if local:
+            affected = "\n".join(f"- {breach['name']}: {breach['count']:,} addresses" for breach in local[:10])
+            embed.add_field(name="🗃 Addresses in the Local Index", value=affected, inline=False)
 
         await scan_message.edit(content="", embed=embed)
 
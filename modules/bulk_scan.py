@@ -0,0 +1,157 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import asyncio
+import io
+import os
+from core.bulk import BulkInputError, BulkRun, normalize_email, normalize_host, parse_targets, render_csv, render_json
+
+OUTPUT_FORMATS = [
+    app_commands.Choice(name="CSV", value="csv"),
+    app_commands.Choice(name="JSON", value="json"),
+]
+
+# Bulk kind -> (label, cog, row method, normalizer). Upstream rates are left to the HTTP client's governor
+BULK_KINDS = {
+    "websitescan": ("Website Scan", "WebsiteScan", "website_scan_row", normalize_host),
+    "seocheck": ("SEO Check", "SEOCheck", "seo_row", normalize_host),
+    "dns": ("DNS Lookup", "NetworkScan", "dns_row", normalize_host),
+    "checkip": ("IP Check", "NetworkScan", "ip_info_row", None),
+    "domainscan": ("Domain Breach Scan", "BreachScan", "domain_breach_row", normalize_host),
+    "certexpiry": ("Certificate Expiry", "WebsiteScan", "certificate_row", normalize_host),
+    "breachscan": ("Email Breach Check", "BreachScan", "email_breach_row", normalize_email),
+}
+
+# Kinds that only talk to the scanned hosts themselves can sweep with more workers
+KIND_CONCURRENCY = {
+    "certexpiry": ("BULK_CONCURRENCY_CERTEXPIRY", 32),
+    "breachscan": ("BULK_CONCURRENCY_BREACHSCAN", 64),
+}
+
+# Kinds answered from local data can take far longer lists than the default limit
+KIND_MAX_TARGETS = {
+    "breachscan": ("BULK_MAX_TARGETS_BREACHSCAN", 20000),
+}
+
+class BulkScan(commands.Cog):
+    def __init__(self, client):
+        self.client = client
+        self.max_targets = int(os.getenv("BULK_MAX_TARGETS", 500))
+        self.max_file_bytes = int(os.getenv("BULK_MAX_FILE_BYTES", 1048576))
+        self.concurrency = int(os.getenv("BULK_CONCURRENCY", 8))
+        self.target_timeout = float(os.getenv("BULK_TARGET_TIMEOUT", 30))
+        self.edit_interval = float(os.getenv("BULK_EDIT_INTERVAL", 3))
+        self.kind_concurrency = {kind: int(os.getenv(env, concurrency)) for kind, (env, concurrency) in KIND_CONCURRENCY.items()}
+        self.kind_max_targets = {kind: int(os.getenv(env, limit)) for kind, (env, limit) in KIND_MAX_TARGETS.items()}
+        self.active_users = set()
+
+    async def stream_progress(self, message, label, run):
+        while True:
+            await run.updated.wait()
+            run.updated.clear()
+            try:
+                await message.edit(content=f"📦 **Bulk {label}:** {run.describe_progress()}")
+            except discord.HTTPException:
+                return
+            await asyncio.sleep(self.edit_interval)
+
+    async def run_bulk(self, interaction, kind, targets, output):
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        label, cog_name, method, normalize = BULK_KINDS[kind]
+
+        cog = self.client.get_cog(cog_name)
+        if cog is None:
+            await interaction.followup.send(f"❌ {label} is not available right now.", ephemeral=True)
+            return
+        if targets.size > self.max_file_bytes:
+            await interaction.followup.send(f"❌ The attachment is too large, the limit is {self.max_file_bytes // 1024} KB.", ephemeral=True)
+            return
+        if interaction.user.id in self.active_users:
+            await interaction.followup.send("⏳ You already have a bulk scan running, please wait for it to finish.", ephemeral=True)
+            return
+
+        # Claimed before the first await, a second invocation from the same user cannot slip past the check
+        self.active_users.add(interaction.user.id)
+        try:
+            try:
+                target_list = parse_targets(await targets.read(), self.kind_max_targets.get(kind, self.max_targets), normalize)
+            except BulkInputError as e:
+                await interaction.followup.send(f"❌ {e}", ephemeral=True)
+                return
+
+            concurrency = self.kind_concurrency.get(kind, self.concurrency)
+            run = BulkRun(target_list, getattr(cog, method), concurrency, self.target_timeout)
+            message = await interaction.followup.send(f"📦 **Bulk {label}:** {len(target_list)} targets queued", ephemeral=True, wait=True)
+
+            progress = asyncio.create_task(self.stream_progress(message, label, run))
+            try:
+                rows = await run.run()
+            finally:
+                progress.cancel()
+                await asyncio.gather(progress, return_exceptions=True)
+        finally:
+            self.active_users.discard(interaction.user.id)
+
+        output_format = output.value if output else "csv"
+        data = render_json(rows) if output_format == "json" else render_csv(rows)
+        file = discord.File(io.BytesIO(data), filename=f"bulk-{kind}.{output_format}")
+        summary = f"✅ **Bulk {label} finished:** {run.describe_progress()}"
+
+        try:
+            await message.edit(content=summary, attachments=[file])
+        except discord.HTTPException:
+            # Long runs can outlive the interaction token, deliver the results by DM instead
+            try:
+                await interaction.user.send(summary, file=discord.File(io.BytesIO(data), filename=file.filename))
+            except discord.HTTPException:
+                pass
+
+    @app_commands.command(name="bulkwebsitescan", description="Run a website scan for every domain in a text or CSV file")
+    @app_commands.describe(targets="Text or CSV file with one domain per line", output="Result file format")
+    @app_commands.choices(output=OUTPUT_FORMATS)
+    async def bulk_website_scan(self, interaction: discord.Interaction, targets: discord.Attachment, output: app_commands.Choice[str] = None):
+        await self.run_bulk(interaction, "websitescan", targets, output)
+
+    @app_commands.command(name="bulkseocheck", description="Run an SEO check for every domain in a text or CSV file")
+    @app_commands.describe(targets="Text or CSV file with one domain per line", output="Result file format")
+    @app_commands.choices(output=OUTPUT_FORMATS)
+    async def bulk_seo_check(self, interaction: discord.Interaction, targets: discord.Attachment, output: app_commands.Choice[str] = None):
+        await self.run_bulk(interaction, "seocheck", targets, output)
+
+    @app_commands.command(name="bulkdns", description="Look up DNS records for every domain in a text or CSV file")
+    @app_commands.describe(targets="Text or CSV file with one domain per line", output="Result file format")
+    @app_commands.choices(output=OUTPUT_FORMATS)
+    async def bulk_dns(self, interaction: discord.Interaction, targets: discord.Attachment, output: app_commands.Choice[str] = None):
+        await self.run_bulk(interaction, "dns", targets, output)
+
+    @app_commands.command(name="bulkcheckip", description="Check every IP address in a text or CSV file")
+    @app_commands.describe(targets="Text or CSV file with one IP address per line", output="Result file format")
+    @app_commands.choices(output=OUTPUT_FORMATS)
+    async def bulk_check_ip(self, interaction: discord.Interaction, targets: discord.Attachment, output: app_commands.Choice[str] = None):
+        await self.run_bulk(interaction, "checkip", targets, output)
+
+    @app_commands.command(name="bulkdomainscan", description="Check every domain in a text or CSV file for data breaches")
+    @app_commands.describe(targets="Text or CSV file with one domain per line", output="Result file format")
+    @app_commands.choices(output=OUTPUT_FORMATS)
+    async def bulk_domain_scan(self, interaction: discord.Interaction, targets: discord.Attachment, output: app_commands.Choice[str] = None):
+        await self.run_bulk(interaction, "domainscan", targets, output)
+
+    @app_commands.command(name="bulkcertexpiry", description="Check the TLS certificate expiry of every domain in a text or CSV file")
+    @app_commands.describe(targets="Text or CSV file with one domain per line", output="Result file format")
+    @app_commands.choices(output=OUTPUT_FORMATS)
+    async def bulk_cert_expiry(self, interaction: discord.Interaction, targets: discord.Attachment, output: app_commands.Choice[str] = None):
+        await self.run_bulk(interaction, "certexpiry", targets, output)
+
+    @app_commands.command(name="bulkbreachscan", description="Check every email address in a text or CSV file against the local breach index")
+    @app_commands.describe(targets="Text or CSV file with one email address per line", output="Result file format")
+    @app_commands.choices(output=OUTPUT_FORMATS)
+    async def bulk_breach_scan(self, interaction: discord.Interaction, targets: discord.Attachment, output: app_commands.Choice[str] = None):
+        index = self.client.breach_index
+        index.refresh()
+        if not index.loaded:
+            await interaction.response.send_message("❌ Bulk breach checks need a local breach index, none is loaded on this bot.", ephemeral=True)
+            return
+        await self.run_bulk(interaction, "breachscan", targets, output)
+
+async def setup(client):
+    await client.add_cog(BulkScan(client))
@@ -14,11 +14,12 @@ class HelpCommand(commands.Cog):
         embed.add_field(
             name="🌍 Security & Network Commands",
             value=(
-                "**`/nmap <target> <scan_type>`** - Performs an Nmap port scan\n"
-                "**`/websitescan <domain>`** - Scans for security risks (WAF, SSL, headers, etc.)\n"
-                "**`/checkip <ip>`** - Shows IP reputation and details\n"
+                "**`/nmap <target> <scan_type> [ports]`** - Scans open ports, optionally a custom list like 22,80,8000-8100\n"
+                "**`/nmapcancel <job_id>`** - Cancels a running Nmap scan you started\n"
+                "**`/websitescan <domain> [protocols]`** - Scans for security risks (WAF, SSL, headers, etc.)\n"
+                "**`/checkip <ip>`** - Shows IP location, network and hostname from local datasets or ipinfo.io\n"
                 "**`/dns <domain>`** - Retrieves DNS records (A, MX, TXT, NS, etc.)\n"
-                "**`/reverseip <ip>`** - Finds domains hosted on a given IP\n"
+                "**`/reverseip <ip> [page]`** - Finds domains seen on a given IP in the bot's DNS lookups and imported data\n"
                 "**`/webarchitecture <domain>`** - Detects technologies used by a website\n"
             ),
             inline=False
@@ -28,6 +29,31 @@ class HelpCommand(commands.Cog):
             value=(
                 "**`/seocheck <domain>`** - Performs a full SEO audit including performance analysis\n"
                 "**`/archive <domain>`** - Retrieves past versions of a website from Archive.org\n"
+                "**`/archivetimeline <domain> [granularity]`** - Shows captures per month and content changes across a website's Archive.org history\n"
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name="📦 Bulk Commands",
+            value=(
+                "Attach a text or CSV file with one target per line, results arrive as a CSV or JSON file\n"
+                "**`/bulkwebsitescan <file>`** - Website scan for every domain\n"
+                "**`/bulkseocheck <file>`** - SEO check for every domain\n"
+                "**`/bulkdns <file>`** - DNS records for every domain\n"
+                "**`/bulkcheckip <file>`** - IP details for every address\n"
+                "**`/bulkdomainscan <file>`** - Breach check for every domain\n"
+                "**`/bulkbreachscan <file>`** - Checks up to 20,000 email addresses against the local breach index\n"
+                "**`/bulkcertexpiry <file>`** - TLS certificate expiry for every domain\n"
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name="🔔 Monitoring",
+            value=(
+                "Re-checks targets in the background and posts in the channel when something changes\n"
+                "**`/watch add <kind> <target> [interval]`** - Watch certificates, DNS, breaches, IP details or availability\n"
+                "**`/watch list`** - Shows the watches on this server\n"
+                "**`/watch remove <id>`** - Stops a watch\n"
             ),
             inline=False
         )
@@ -0,0 +1,191 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+import asyncio
+import ipaddress
+import os
+from core.bulk import normalize_host
+from core.scheduler import WatchScheduler
+from core.timing import TimingProbe, median_phase
+
+EXPIRY_WARNINGS = [(0, "expired"), (1, "expires within a day"), (7, "expires within 7 days"), (14, "expires within 14 days"), (30, "expires within 30 days")]
+
+
+def certificate_state(row):
+    days_left = row["days_left"]
+    expiry = next((label for limit, label in EXPIRY_WARNINGS if days_left <= limit), "valid")
+    return {"issuer": row["issuer"], "fingerprint": row["fingerprint"][:16], "trusted": row["verified"], "expiry": expiry}
+
+
+def dns_state(row):
+    # Resolvers rotate record order, only the set of records counts as a change
+    return {record_type: " | ".join(sorted(values.split(" | "))) for record_type, values in row.items() if values}
+
+
+def breach_state(row):
+    return {"breaches": row["breaches"]}
+
+
+def ip_state(row):
+    return {key: row.get(key) for key in ("hostname", "org", "country")}
+
+
+def uptime_state(row):
+    return {"status": row["status"], "response": "slow" if row["total"] > float(os.getenv("MONITOR_SLOW_SECONDS", 3)) else "ok"}
+
+
+# Watch kind -> (label, cog, row method, state reducer, target normalizer)
+WATCH_KINDS = {
+    "cert": ("TLS Certificate", "WebsiteScan", "certificate_row", certificate_state, normalize_host),
+    "dns": ("DNS Records", "NetworkScan", "dns_row", dns_state, normalize_host),
+    "breach": ("Domain Breaches", "BreachScan", "domain_breach_row", breach_state, normalize_host),
+    "ip": ("IP Details", "NetworkScan", "ip_info_row", ip_state, None),
+    "uptime": ("Availability", "Monitor", "uptime_row", uptime_state, normalize_host),
+}
+
+WATCH_CHOICES = [app_commands.Choice(name=label, value=kind) for kind, (label, *_) in WATCH_KINDS.items()]
+
+class Monitor(commands.Cog):
+    watch = app_commands.Group(
+        name="watch",
+        description="Watch domains and IPs and get alerted in this channel when something changes",
+        guild_only=True,
+        default_permissions=discord.Permissions(manage_guild=True),
+    )
+
+    def __init__(self, client):
+        self.client = client
+        self.default_interval = int(os.getenv("MONITOR_DEFAULT_INTERVAL", 60))
+        self.min_interval = int(os.getenv("MONITOR_MIN_INTERVAL", 5))
+        self.max_watches_per_guild = int(os.getenv("MONITOR_MAX_WATCHES_PER_GUILD", 25))
+        self.scheduler = WatchScheduler(
+            client.store,
+            {kind: (self.make_check(kind), reducer) for kind, (_, _, _, reducer, _) in WATCH_KINDS.items()},
+            self.send_alert,
+            self.owns,
+        )
+        self.start_task = None
+
+    async def cog_load(self):
+        self.start_task = asyncio.create_task(self.start_scheduler())
+
+    async def cog_unload(self):
+        if self.start_task:
+            self.start_task.cancel()
+        await self.scheduler.close()
+
+    async def start_scheduler(self):
+        # Alerts need the gateway connection and the other cogs, so checks start once the bot is ready
+        await self.client.wait_until_ready()
+        await self.scheduler.start()
+
+    def owns(self, watch):
+        # With several shard processes only the one holding the guild's shard runs its watches
+        if self.client.shard_ids is None or not self.client.shard_count:
+            return True
+        return (watch["guild_id"] >> 22) % self.client.shard_count in self.client.shard_ids
+
+    def make_check(self, kind):
+        _, cog_name, method, _, _ = WATCH_KINDS[kind]
+
+        async def check(target):
+            cog = self.client.get_cog(cog_name)
+            if cog is None:
+                return {"error": f"{cog_name} is not loaded"}
+            return await getattr(cog, method)(target)
+        return check
+
+    async def uptime_row(self, domain):
+        report = await TimingProbe(self.client.http_client, self.client.resolver, samples=2).run(f"https://{domain}")
+        total = median_phase(report, "total")
+        if total is None:
+            return {"error": report["errors"][0] if report["errors"] else "No response"}
+        return {"status": report["status"], "total": total}
+
+    def describe_value(self, value):
+        return "—" if value is None else str(value)[:200]
+
+    async def send_alert(self, watch, changes, row, error):
+        channel = self.client.get_channel(watch["channel_id"])
+        if channel is None:
+            channel = await self.client.fetch_channel(watch["channel_id"])
+
+        label = WATCH_KINDS[watch["kind"]][0]
+        embed = discord.Embed(title=f"🔔 {label} changed for {watch['target']}", color=discord.Color.orange())
+        for key, (old, new) in list(changes.items())[:20]:
+            embed.add_field(name=key, value=f"{self.describe_value(old)} → **{self.describe_value(new)}**", inline=False)
+        if error:
+            embed.description = f"⚠️ Last check failed: {error[:300]}"
+        elif watch["kind"] == "uptime":
+            embed.description = f"⏳ Response time {row['total']:.2f}s"
+        embed.set_footer(text=f"Watch {watch['id']} · every {watch['interval'] // 60} min · /watch remove {watch['id']}")
+        await channel.send(embed=embed)
+
+    @watch.command(name="add", description="Start watching a domain or IP, changes are posted in this channel")
+    @app_commands.describe(kind="What to watch", target="Domain or IP address", interval="Minutes between checks")
+    @app_commands.choices(kind=WATCH_CHOICES)
+    async def watch_add(self, interaction: discord.Interaction, kind: app_commands.Choice[str], target: str, interval: int = None):
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        _, _, _, _, normalize = WATCH_KINDS[kind.value]
+        interval = interval or self.default_interval
+
+        target = normalize(target) if normalize else target.strip()
+        if kind.value == "ip":
+            try:
+                if not ipaddress.ip_address(target).is_global:
+                    raise ValueError
+            except ValueError:
+                await interaction.followup.send("❌ Please provide a public IP address.", ephemeral=True)
+                return
+        if not target:
+            await interaction.followup.send("❌ Please provide a valid domain.", ephemeral=True)
+            return
+        if interval < self.min_interval:
+            await interaction.followup.send(f"❌ The shortest interval is {self.min_interval} minutes.", ephemeral=True)
+            return
+
+        watches = self.scheduler.for_guild(interaction.guild_id)
+        if len(watches) >= self.max_watches_per_guild:
+            await interaction.followup.send(f"❌ This server already has {self.max_watches_per_guild} watches, remove one first.", ephemeral=True)
+            return
+        if any(watch["kind"] == kind.value and watch["target"] == target and watch["channel_id"] == interaction.channel_id for watch in watches):
+            await interaction.followup.send(f"⚠️ `{target}` is already watched for {kind.name} in this channel.", ephemeral=True)
+            return
+
+        watch = self.scheduler.add(kind.value, target, interval * 60, interaction.guild_id, interaction.channel_id, interaction.user.id)
+        await interaction.followup.send(
+            f"🔔 Watching **{kind.name}** for `{target}` every {interval} minutes. Changes are posted here. (ID `{watch['id']}`)",
+            ephemeral=True,
+        )
+
+    @watch.command(name="remove", description="Stop a watch")
+    @app_commands.describe(watch_id="ID shown by /watch list")
+    async def watch_remove(self, interaction: discord.Interaction, watch_id: str):
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        watch = self.scheduler.watches.get(watch_id)
+        if watch is None or watch["guild_id"] != interaction.guild_id:
+            await interaction.followup.send(f"❌ No watch `{watch_id}` was found on this server.", ephemeral=True)
+            return
+
+        await self.scheduler.remove(watch_id)
+        await interaction.followup.send(f"🛑 Stopped watching `{watch['target']}` ({WATCH_KINDS[watch['kind']][0]}).", ephemeral=True)
+
+    @watch.command(name="list", description="Show the watches on this server")
+    async def watch_list(self, interaction: discord.Interaction):
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        watches = self.scheduler.for_guild(interaction.guild_id)
+        if not watches:
+            await interaction.followup.send("📭 Nothing is watched on this server yet, add something with `/watch add`.", ephemeral=True)
+            return
+
+        embed = discord.Embed(title="🔔 Watches", color=discord.Color.orange())
+        lines = []
+        for watch in watches:
+            status = "🔴" if watch["failures"] >= self.scheduler.failure_threshold else "🟢" if watch["state"] else "⏳"
+            next_check = f"<t:{int(watch['due_at'])}:R>" if watch.get("due_at") else "soon"
+            lines.append(f"{status} `{watch['id']}` **{WATCH_KINDS[watch['kind']][0]}** · `{watch['target']}` · <#{watch['channel_id']}> · next {next_check}")
+        embed.description = "\n".join(lines)[:4000]
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+async def setup(client):
+    await client.add_cog(Monitor(client))
@@ -1,15 +1,20 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiohttp
-import nmap
-import socket
+import asyncio
 import ipaddress
+import os
+from core.dns_resolver import RECORD_TYPES
+from core.governor import CircuitOpenError
+from core.ip_intel import describe_network
+from core.port_scanner import parse_ports
+from core.probes import run_probes
+from core.scan_jobs import ScanJobLimitExceeded
 
 class NetworkScan(commands.Cog):
     def __init__(self, client):
         self.client = client
-        self.nm = nmap.PortScanner()
+        self.reverse_ip_page_size = int(os.getenv("REVERSE_IP_PAGE_SIZE", 25))
 
     def is_private_ip(self, ip):
         try:
@@ -17,84 +22,189 @@ class NetworkScan(commands.Cog):
         except ValueError:
             return False
 
-    def resolve_domain(self, target):
-        try:
-            ip_address = socket.gethostbyname(target)
-            if self.is_private_ip(ip_address):
-                return None
-            return ip_address
-        except socket.gaierror:
-            return None
-    
-    async def fetch_dns_records(self, domain, record_type):
-        url = f"https://dns.google/resolve?name={domain}&type={record_type}"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get("Answer", [])
-                return None
+    async def fetch_dns_records(self, domain, record_types):
+        return await self.client.resolver.resolve_many(domain, record_types)
 
-    def run_nmap_scan(self, target, scan_type):
-        resolved_ip = self.resolve_domain(target) or target
+    async def start_nmap_scan(self, user_id, target, scan_type, ports=None):
+        # The queue only ever sees a validated address, a hostname is never resolved a second time by the scanner
+        resolved_ip = await self.client.resolver.resolve_address(target)
+        if resolved_ip is None:
+            return target, f"❌ Could not resolve {target} to an IP address."
 
         if self.is_private_ip(resolved_ip) or resolved_ip in ["127.0.0.1", "::1", "localhost"]:
             return resolved_ip, "❌ Scanning local or private addresses is not allowed."
 
         scan_types = {
-            "Quick Scan": "-F",
-            "Full Scan": "-p-",
-            "Service Detection": "-sV"
+            "Quick Scan": ("-F", "fast"),
+            "Full Scan": ("-p-", "slow"),
+            "Service Detection": ("-sV", "slow")
         }
 
         if scan_type not in scan_types:
             return resolved_ip, "❌ Invalid scan type."
 
-        try:
-            self.nm.scan(resolved_ip, arguments=scan_types[scan_type])
-            scan_data = self.nm[resolved_ip]
+        arguments, lane = scan_types[scan_type]
+        if ports:
+            ports = "".join(ports.split())
+            try:
+                count = len(parse_ports(ports))
+            except ValueError:
+                return resolved_ip, "❌ Invalid port list, use a format like `22,80,8000-8100`."
+            # A custom port list replaces the scan type's ports, service detection keeps nmap
+            arguments = f"-sV -p {ports}" if scan_type == "Service Detection" else f"-p {ports}"
+            lane = "slow" if scan_type == "Service Detection" or count > 1000 else "fast"
 
-            results = []
-            for port in scan_data.get("tcp", {}):
-                service = scan_data["tcp"][port].get("name", "Unknown")
-                results.append(f"🟢 **Port {port}** - {service}")
+        try:
+            return resolved_ip, await self.client.scan_queue.submit(user_id, resolved_ip, arguments, lane)
+        except ScanJobLimitExceeded as e:
+            return resolved_ip, f"⏳ {e}"
 
-            if scan_type == "OS Detection":
-                os_guess = scan_data.get("osmatch", [])
-                if os_guess:
-                    results.append(f"🖥 **OS Detected:** {os_guess[0]['name']} ({os_guess[0]['accuracy']}% accuracy)")
+    def build_scan_embed(self, target, resolved_ip, scan_name, job):
+        embed = discord.Embed(title=f"🔍 Nmap Scan Results for {target} ({resolved_ip})", color=discord.Color.blue())
+        embed.add_field(name="🛠 Scan Type", value=scan_name, inline=False)
+        network = describe_network(self.local_ip_info(resolved_ip))
+        if network:
+            embed.add_field(name="🏢 Network", value=network, inline=False)
+
+        if job.status == "queued":
+            embed.description = "🕒 Waiting for a free scanner..."
+        elif job.status == "running":
+            embed.description = f"⏳ Scanning... {job.progress:.0f}% done" if job.progress is not None else "⏳ Scanning..."
+        elif job.status == "cancelled":
+            embed.description = "🛑 Scan cancelled."
+        elif job.status == "failed":
+            embed.description = f"Error running the scan: {job.error}"
+
+        results = [f"🟢 **Port {entry['port']}** - {entry['service'] or 'Unknown'}" for entry in job.open_ports()]
+        if results:
+            shown = []
+            for line in results:
+                if len("\n".join(shown + [line])) > 1000:
+                    break
+                shown.append(line)
+            if len(shown) < len(results):
+                shown.append(f"... and {len(results) - len(shown)} more")
+            embed.add_field(name="📡 Scan Results", value="\n".join(shown), inline=False)
+        elif job.status == "done":
+            embed.add_field(name="✅ No Open Ports Found", value="Target appears to be secure.", inline=False)
 
-            return resolved_ip, results if results else None
-        except Exception as e:
-            return resolved_ip, f"Error running Nmap: {str(e)}"
+        if job.active:
+            embed.set_footer(text=f"Job {job.id} · use /nmapcancel {job.id} to stop it")
+        return embed
 
     @app_commands.command(name="nmap", description="Scan open ports on a target using Nmap")
     @app_commands.describe(
         target="The domain or IP to scan",
-        scan_type="Select a scan type"
+        scan_type="Select a scan type",
+        ports="Ports to scan instead of the scan type's list, e.g. 22,80,8000-8100"
     )
     @app_commands.choices(scan_type=[
         app_commands.Choice(name="Quick Scan (Fast)", value="Quick Scan"),
         app_commands.Choice(name="Full Scan (All Ports)", value="Full Scan"),
         app_commands.Choice(name="Service Detection (Find Running Services)", value="Service Detection"),
     ])
-    async def nmap_scan(self, interaction: discord.Interaction, target: str, scan_type: app_commands.Choice[str]):
+    async def nmap_scan(self, interaction: discord.Interaction, target: str, scan_type: app_commands.Choice[str], ports: str = None):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        resolved_ip, scan_result = self.run_nmap_scan(target, scan_type.value)
+        resolved_ip, job = await self.start_nmap_scan(interaction.user.id, target, scan_type.value, ports)
+        scan_name = f"{scan_type.name} · ports {ports[:100]}" if ports else scan_type.name
 
-        embed = discord.Embed(title=f"🔍 Nmap Scan Results for {target} ({resolved_ip})", color=discord.Color.blue())
+        if isinstance(job, str):
+            embed = discord.Embed(title=f"🔍 Nmap Scan Results for {target} ({resolved_ip})", color=discord.Color.blue())
+            embed.description = job
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
 
-        if isinstance(scan_result, str):
-            embed.description = scan_result
-        elif scan_result:
-            embed.add_field(name="🛠 Scan Type", value=scan_type.name, inline=False)
-            embed.add_field(name="📡 Scan Results", value="\n".join(scan_result), inline=False)
+        message = await interaction.followup.send(embed=self.build_scan_embed(target, resolved_ip, scan_name, job), ephemeral=True, wait=True)
+
+        # Stream open ports into the message as nmap reports them, at most one edit every few seconds
+        while True:
+            try:
+                await asyncio.wait_for(job.updated.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                pass
+            job.updated.clear()
+
+            try:
+                await message.edit(embed=self.build_scan_embed(target, resolved_ip, scan_name, job))
+            except discord.HTTPException:
+                # The interaction token expired, the job keeps running and can still be cancelled
+                return
+
+            if job.done.is_set():
+                return
+            # At most one edit every few seconds, but a scan that finishes in between is shown right away
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=3)
+            except asyncio.TimeoutError:
+                pass
+
+    @app_commands.command(name="nmapcancel", description="Cancel a running Nmap scan you started")
+    async def nmap_cancel(self, interaction: discord.Interaction, job_id: str):
+        await interaction.response.defer(thinking=True, ephemeral=True)
+
+        if await self.client.scan_queue.request_cancel(job_id, interaction.user.id):
+            await interaction.followup.send(f"🛑 Scan `{job_id}` has been cancelled.", ephemeral=True)
         else:
-            embed.add_field(name="✅ No Open Ports Found", value="Target appears to be secure.", inline=False)
+            await interaction.followup.send(f"❌ No running scan `{job_id}` was found for you.", ephemeral=True)
 
-        await interaction.followup.send(embed=embed, ephemeral=True)
+    async def query_ip_info(self, ip):
+        url = f"https://ipinfo.io/{ip}/json"
+        async with self.client.http_client.get(url) as response:
+            if response.status == 200:
+                return await response.json()
+            return None
+
+    async def fetch_ip_info(self, ip):
+        return await self.client.cache.get_or_fetch("ipinfo", ip, lambda: self.query_ip_info(ip))
+
+    def local_ip_info(self, ip):
+        try:
+            return self.client.ip_intel.lookup(ip)
+        except ValueError:
+            return None
+
+    async def reverse_hostname(self, ip):
+        try:
+            answers = await self.client.resolver.resolve(ipaddress.ip_address(ip).reverse_pointer, "PTR") or []
+        except ValueError:
+            return None
+        names = [answer["data"].rstrip(".") for answer in answers if answer.get("type") == RECORD_TYPES["PTR"]]
+        return names[0] if names else None
+
+    async def local_ip_row(self, ip):
+        local = self.local_ip_info(ip)
+        if not local:
+            return None
+        # Same shape as ipinfo.io, the organisation carries the AS number in front
+        org = f"AS{local['asn']} {local.get('org', '')}".strip() if local.get("asn") else local.get("org")
+        row = {"city": local.get("city"), "region": local.get("region"), "country": local.get("country"), "org": org}
+        row["hostname"] = await self.reverse_hostname(ip)
+        row["network"] = local.get("network")
+        return row
+
+    async def ip_info_row(self, ip):
+        if self.is_private_ip(ip) or ip in ["127.0.0.1", "::1", "localhost"]:
+            return {"error": "Private or local address"}
+
+        row = await self.local_ip_row(ip)
+        if row:
+            return row
+
+        ip_data = await self.fetch_ip_info(ip)
+        if not ip_data:
+            return {"error": "Error retrieving IP information"}
+        return {key: ip_data.get(key) for key in ("city", "region", "country", "org", "hostname")}
+
+    def build_ip_embed(self, ip, ip_data, source):
+        embed = discord.Embed(title=f"🌍 IP information for {ip}", color=discord.Color.green())
+        embed.add_field(name="📍 Location", value=f"{ip_data.get('city') or 'Unknown'}, {ip_data.get('country') or 'Unknown'}", inline=False)
+        embed.add_field(name="🏢 ISP", value=ip_data.get("org") or "Unknown", inline=False)
+        embed.add_field(name="🌎 Hostname", value=ip_data.get("hostname") or "Unknown", inline=False)
+        if ip_data.get("network"):
+            embed.add_field(name="🧭 Network", value=ip_data["network"], inline=False)
+        embed.set_footer(text=f"Source: {source}")
+        return embed
 
     @app_commands.command(name="checkip", description="Check IP reputation and security info")
     async def check_ip_command(self, interaction: discord.Interaction, ip: str):
@@ -104,65 +214,105 @@ class NetworkScan(commands.Cog):
             await interaction.followup.send("❌ Checking private or local IP addresses is not allowed.", ephemeral=True)
             return
 
-        url = f"https://ipinfo.io/{ip}/json"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    ip_data = await response.json()
-                else:
-                    ip_data = None
+        local = await self.local_ip_row(ip)
+        if local:
+            message = await interaction.followup.send(embed=self.build_ip_embed(ip, local, "local IP datasets"), ephemeral=True, wait=True)
+            # ipinfo.io only fills in what the local datasets do not know, its hostname is the same PTR record
+            if local.get("city") and local.get("org"):
+                return
+
+            # A failed enrichment keeps the local answer
+            try:
+                ip_data = await self.fetch_ip_info(ip)
+            except Exception:
+                return
+            if ip_data:
+                merged = dict(local, **{key: local.get(key) or ip_data.get(key) for key in ("city", "country", "org", "hostname")})
+                if merged != local:
+                    await message.edit(embed=self.build_ip_embed(ip, merged, "local IP datasets + ipinfo.io"))
+            return
+
+        try:
+            ip_data = await self.fetch_ip_info(ip)
+        except CircuitOpenError as e:
+            await interaction.followup.send(f"⚠️ {e}", ephemeral=True)
+            return
 
         if not ip_data:
             await interaction.followup.send("⚠️ Error retrieving IP information.", ephemeral=True)
             return
 
-        embed = discord.Embed(title=f"🌍 IP information for {ip}", color=discord.Color.green())
-        embed.add_field(name="📍 Location", value=f"{ip_data.get('city', 'Unknown')}, {ip_data.get('country', 'Unknown')}", inline=False)
-        embed.add_field(name="🏢 ISP", value=ip_data.get("org", "Unknown"), inline=False)
-        embed.add_field(name="🌎 Hostname", value=ip_data.get("hostname", 'Unknown'), inline=False)
-
-        await interaction.followup.send(embed=embed, ephemeral=True)
+        await interaction.followup.send(embed=self.build_ip_embed(ip, ip_data, "ipinfo.io"), ephemeral=True)
     
+    def reverse_ip_lookup(self, ip, page=1):
+        return self.client.reverse_ip.lookup(ip, (page - 1) * self.reverse_ip_page_size, self.reverse_ip_page_size)
+
     @app_commands.command(name="reverseip", description="Find all domains hosted on a given IP address")
-    async def reverse_ip_command(self, interaction: discord.Interaction, ip: str):
+    @app_commands.describe(page="Result page, 25 domains each")
+    async def reverse_ip_command(self, interaction: discord.Interaction, ip: str, page: app_commands.Range[int, 1] = 1):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        if self.is_private_ip(ip):
+        try:
+            address = ipaddress.ip_address(ip.strip())
+        except ValueError:
+            await interaction.followup.send("❌ Please provide a valid IPv4 or IPv6 address.", ephemeral=True)
+            return
+        if not address.is_global:
             await interaction.followup.send("❌ Private or local IPs cannot be scanned.", ephemeral=True)
             return
 
-        domains = await self.reverse_ip_lookup(ip)
+        result = self.reverse_ip_lookup(address, page)
+        pages = max((result["total"] + self.reverse_ip_page_size - 1) // self.reverse_ip_page_size, 1)
 
-        embed = discord.Embed(title=f"🔍 Reverse IP Lookup for {ip}", color=discord.Color.blue())
+        embed = discord.Embed(title=f"🔍 Reverse IP Lookup for {address}", color=discord.Color.blue())
+        network = describe_network(self.local_ip_info(address))
+        if network:
+            embed.add_field(name="🏢 Network", value=network, inline=False)
 
-        if domains:
-            formatted_domains = "\n".join(domains[:10])
-            embed.add_field(name="🌐 Hosted Domains", value=formatted_domains, inline=False)
-            embed.set_footer(text="Showing first 10 results. Some results may be omitted.")
+        if result["domains"]:
+            embed.description = "\n".join(f"🌐 `{domain}` · seen <t:{last_seen}:d>" for domain, last_seen in result["domains"])
+            embed.set_footer(text=f"Page {page} of {pages} · {result['total']:,} domains seen on this IP by the bot's resolver and imported DNS data")
+        elif result["total"]:
+            embed.description = f"No domains on page {page}, there are only {pages} page(s)."
         else:
-            embed.description = "No domains found for this IP."
+            embed.description = "No domains found for this IP. Only domains the bot has resolved or imported are known."
 
         await interaction.followup.send(embed=embed, ephemeral=True)
-    
+
+    def annotate_address(self, value, networks):
+        network = describe_network(networks.get(value))
+        return f"{value} · {network}" if network else value
+
+    async def dns_row(self, domain):
+        record_types = ["A", "AAAA", "MX", "TXT", "NS", "CNAME"]
+        records = await self.fetch_dns_records(domain, record_types)
+        return {record_type: " | ".join(entry.get("data", "") for entry in records.get(record_type) or []) for record_type in record_types}
+
     @app_commands.command(name="dns", description="Retrieve DNS records for a domain")
     async def dns_lookup(self, interaction: discord.Interaction, domain: str):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        records = {}
         record_types = ["A", "MX", "TXT", "NS", "CNAME"]
-
-        for record_type in record_types:
-            records[record_type] = await self.fetch_dns_records(domain, record_type)
+        results = await run_probes({"dns": self.fetch_dns_records(domain, record_types)})
+        records = results.get("dns", {})
 
         embed = discord.Embed(title=f"📡 DNS Records for {domain}", color=discord.Color.blue())
+        # Addresses are annotated with their network in one pass over the local datasets
+        networks = self.client.ip_intel.lookup_many(entry.get("data", "") for entry in records.get("A") or [])
 
-        for record_type, values in records.items():
-            if values:
-                record_values = "\n".join([entry.get("data", "Unknown") for entry in values])
+        for record_type in record_types:
+            values = records.get(record_type)
+            if "dns" in results.timed_out:
+                embed.add_field(name=f"🔹 {record_type} Records", value="⏱ Lookup timed out.", inline=False)
+            elif values:
+                record_values = "\n".join([self.annotate_address(entry.get("data", "Unknown"), networks) for entry in values])
                 embed.add_field(name=f"🔹 {record_type} Records", value=record_values, inline=False)
             else:
                 embed.add_field(name=f"🔹 {record_type} Records", value="❌ No records found.", inline=False)
 
+        if results.partial:
+            embed.set_footer(text=results.partial_note())
+
         await interaction.followup.send(embed=embed, ephemeral=True)
 
 async def setup(client):
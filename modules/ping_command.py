@@ -12,6 +12,24 @@ class PingCommand(commands.Cog):
         embed=discord.Embed(title="🏓 Pong!", color=discord.Color.purple())
         embed.add_field(name="📡 Latency", value=f"{round(self.client.latency * 1000)}ms", inline=False)
 
+        pool = self.client.http_client.stats()
+        embed.add_field(
+            name="🔌 HTTP Pool",
+            value=f"{pool['open']} open ({pool['idle']} idle) / {pool['limit']} max, {pool['reuse_ratio']:.0%} reused",
+            inline=False
+        )
+
+        cache = self.client.cache.stats()
+        if cache["sources"]:
+            embed.add_field(
+                name="🗃 Lookup Cache",
+                value="\n".join(
+                    f"{source}: {stats['hit_ratio']:.0%} hits ({stats['hits'] + stats['stale_hits']}/{stats['misses']} hit/miss)"
+                    for source, stats in cache["sources"].items()
+                ),
+                inline=False
+            )
+
         await interaction.followup.send(embed=embed, ephemeral=True)
 
 async def setup(client):
@@ -1,67 +1,96 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiohttp
-import re
-from datetime import datetime
+import os
+from core.crawler import SiteCrawler, describe_crawl
+from core.html_head import HeadParser
+from core.page_snapshot import PageSnapshot, fetch_page_snapshot
+from core.probes import run_probes
+from core.timing import TimingProbe, describe_timing_report, median_phase
 
 class SEOCheck(commands.Cog):
     def __init__(self, client):
         self.client = client
+        self.max_bytes = int(os.getenv("SEO_MAX_BYTES", 524288))
+        self.body_budget = int(os.getenv("SEO_BODY_BUDGET", 65536))
 
-    async def fetch_website_headers(self, domain):
-        url = f"https://{domain}"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    return response.headers if response.status == 200 else None
-        except Exception:
-            return None
-
-    async def fetch_website_source(self, domain):
-        url = f"https://{domain}"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    return await response.text() if response.status == 200 else None
-        except Exception:
-            return None
-
-    async def check_robots_txt(self, domain):
-        url = f"https://{domain}/robots.txt"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    return response.status == 200
-        except Exception:
-            return False
-
-    async def check_sitemap_xml(self, domain):
-        url = f"https://{domain}/sitemap.xml"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    return url if response.status == 200 else None
-        except Exception:
-            return None
-
-    async def measure_performance(self, domain):
-        url = f"https://{domain}"
-        try:
-            async with aiohttp.ClientSession() as session:
-                start_time = datetime.utcnow()
-                async with session.get(url, timeout=5) as response:
-                    elapsed_time = (datetime.utcnow() - start_time).total_seconds()
-                    return f"⏳ **Load Time:** {elapsed_time:.2f} seconds"
-        except Exception:
+    def measure_performance(self, report):
+        load_time = median_phase(report, "total") if report else None
+        if load_time is None:
             return "⚠️ Could not measure response time"
+        return f"⏳ **Load Time:** {load_time:.2f} seconds (median of {report['samples']})\n{describe_timing_report(report)}"
+
+    def describe_head(self, head):
+        missing = "❌ Not Found"
+        description = head.meta.get("description")
+        h1 = head.headings["h1"]
+
+        results = [
+            f"📌 **Title Tag:** {head.title} ({len(head.title)} chars)" if head.title else "📌 **Title Tag:** ❌ No Title Tag Found",
+            f"📖 **Meta Description:** {description[:300]} ({len(description)} chars)" if description else "📖 **Meta Description:** ❌ No Meta Description Found",
+            f"🔑 **Meta Keywords:** {head.meta.get('keywords') or missing}",
+            f"📲 **Open Graph:** {head.meta.get('og:title') or missing}" + (" · image ✅" if head.meta.get("og:image") else ""),
+            f"🐦 **Twitter Card:** {head.meta.get('twitter:card') or missing}",
+            f"🔗 **Canonical URL:** {head.canonical or missing}",
+            f"🕷 **Robots Meta:** {head.meta.get('robots') or 'Not set (index, follow)'}",
+            f"📱 **Viewport:** {'✅ Set' if head.meta.get('viewport') else missing}",
+            f"🌍 **Language:** {head.lang or missing}" + (f" · hreflang: {', '.join(list(head.hreflang)[:8])}" if head.hreflang else ""),
+            f"🏷 **H1:** {h1[0][:100]} ({len(h1)} total)" if h1 else "🏷 **H1:** ❌ No H1 Found",
+        ]
+
+        structured = head.structured_data + [item for item in head.microdata if item not in head.structured_data]
+        results.append(f"🧩 **Structured Data:** {', '.join(structured[:8]) if structured else missing}")
+        if head.errors:
+            results.append(f"⚠️ **Structured Data Errors:** {len(head.errors)} invalid JSON-LD block(s)")
+        return results
+
+    async def collect_seo(self, domain):
+        url = f"https://{domain}"
+        head = HeadParser(self.body_budget)
+        results = await run_probes({
+            "page": fetch_page_snapshot(self.client.http_client, url, max_bytes=self.max_bytes, parser=head),
+            "crawl": SiteCrawler(self.client.http_client, self.client.resolver).run(domain),
+            "performance": TimingProbe(self.client.http_client, self.client.resolver).run(url),
+        })
+        return results.get("page") or PageSnapshot.unavailable(url), head, results
+
+    async def seo_row(self, domain):
+        snapshot, head, results = await self.collect_seo(domain)
+        if not snapshot.ok:
+            return {"error": snapshot.error or f"HTTP {snapshot.status}", "partial": results.partial_note() if results.partial else ""}
+        load_time = median_phase(results["performance"], "total") if "performance" in results else None
+        crawl = results.get("crawl")
+
+        return {
+            "status": snapshot.status,
+            "load_time": round(load_time, 3) if load_time is not None else None,
+            "compression_ratio": round(results["performance"]["compression_ratio"], 2) if results.get("performance", {}).get("compression_ratio") else None,
+            "hsts": "strict-transport-security" in snapshot.headers,
+            "title": head.title,
+            "title_length": len(head.title or ""),
+            "description": head.meta.get("description"),
+            "description_length": len(head.meta.get("description") or ""),
+            "canonical": head.canonical,
+            "robots_meta": head.meta.get("robots"),
+            "og_title": head.meta.get("og:title"),
+            "lang": head.lang,
+            "hreflang": " ".join(head.hreflang),
+            "h1": head.headings["h1"][0] if head.headings["h1"] else None,
+            "h1_count": len(head.headings["h1"]),
+            "structured_data": " ".join(head.structured_data + head.microdata),
+            "robots_txt": crawl["robots_txt"] if crawl else None,
+            "crawl_delay": crawl["crawl_delay"] if crawl else None,
+            "sitemap_urls": crawl["urls"] if crawl else None,
+            "pages_checked": len(crawl["checked"]) if crawl else None,
+            "broken_pages": " ".join(check["url"] for check in crawl["broken"]) if crawl else None,
+            "slow_pages": " ".join(check["url"] for check in crawl["slow"]) if crawl else None,
+            "partial": results.partial_note() if results.partial else "",
+        }
 
     async def analyze_seo(self, domain):
-        html = await self.fetch_website_source(domain)
-        headers = await self.fetch_website_headers(domain)
-        robots_exists = await self.check_robots_txt(domain)
-        sitemap_url = await self.check_sitemap_xml(domain)
-        load_time = await self.measure_performance(domain)
+        snapshot, head, results = await self.collect_seo(domain)
+        headers = snapshot.headers if snapshot.ok else None
+        load_time = self.measure_performance(results.get("performance"))
 
         seo_results = [load_time]
 
@@ -71,32 +100,16 @@ class SEOCheck(commands.Cog):
             else:
                 seo_results.append("⚠️ **HTTPS Security:** No HSTS detected ❌")
 
-        if html:
-            title_match = re.search(r"<title>(.*?)</title>", html, re.IGNORECASE)
-            title = title_match.group(1) if title_match else "❌ No Title Tag Found"
-            seo_results.append(f"📌 **Title Tag:** {title}")
-
-            # Meta Description
-            desc_match = re.search(r'<meta name="description" content="(.*?)"', html, re.IGNORECASE)
-            description = desc_match.group(1) if desc_match else "❌ No Meta Description Found"
-            seo_results.append(f"📖 **Meta Description:** {description}")
-
-            # Meta Keywords
-            keywords_match = re.search(r'<meta name="keywords" content="(.*?)"', html, re.IGNORECASE)
-            keywords = keywords_match.group(1) if keywords_match else "❌ No Meta Keywords Found"
-            seo_results.append(f"🔑 **Meta Keywords:** {keywords}")
-
-            # Open Graph Tags (Social Media SEO)
-            og_title_match = re.search(r'<meta property="og:title" content="(.*?)"', html, re.IGNORECASE)
-            og_title = og_title_match.group(1) if og_title_match else "❌ No Open Graph Title Found"
-            seo_results.append(f"📲 **Open Graph Title:** {og_title}")
+        if snapshot.ok:
+            seo_results.extend(self.describe_head(head))
+            if snapshot.truncated:
+                seo_results.append(f"✂️ Stopped reading after {len(snapshot.body) // 1024} KB, the rest of the page was not downloaded")
 
-            canonical_match = re.search(r'<link rel="canonical" href="(.*?)"', html, re.IGNORECASE)
-            canonical = canonical_match.group(1) if canonical_match else "❌ No Canonical URL Found"
-            seo_results.append(f"🔗 **Canonical URL:** {canonical}")
+        if "crawl" in results:
+            seo_results.extend(describe_crawl(results["crawl"]))
 
-        seo_results.append(f"🤖 **robots.txt:** {'✅ Found' if robots_exists else '❌ Not Found'}")
-        seo_results.append(f"🗺 **Sitemap.xml:** {sitemap_url if sitemap_url else '❌ Not Found'}")
+        if results.partial:
+            seo_results.append(results.partial_note())
 
         return seo_results if seo_results else ["❌ No SEO Data Available"]
 
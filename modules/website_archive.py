@@ -1,21 +1,19 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiohttp
+from core.governor import CircuitOpenError
+from core.wayback import format_timestamp, snapshot_link, sparkline
 
 class WebsiteArchiveLookup(commands.Cog):
     def __init__(self, client):
         self.client = client
 
     async def fetch_archive_snapshots(self, domain):
-        url = f"https://web.archive.org/cdx/search/cdx?url={domain}&output=json&fl=timestamp,original&filter=statuscode:200&limit=5"
+        return await self.client.cache.get_or_fetch("wayback", domain.lower(), lambda: self.query_archive_snapshots(domain))
 
+    async def query_archive_snapshots(self, domain):
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    if response.status == 200:
-                        snapshots = await response.json()
-                        return snapshots[1:] if len(snapshots) > 1 else None
+            return await self.client.wayback.snapshots(domain, limit=5)
         except Exception:
             return None
 
@@ -28,12 +26,60 @@ class WebsiteArchiveLookup(commands.Cog):
         embed = discord.Embed(title=f"📜 Archive Lookup for {domain}", color=discord.Color.gold())
 
         if snapshots:
-            archive_links = [f"[{snap[0]}](https://web.archive.org/web/{snap[0]}/{snap[1]})" for snap in snapshots]
+            archive_links = [f"[{snap[0]}]({snapshot_link(snap[0], snap[1])})" for snap in snapshots]
             embed.description = "\n".join(archive_links)
         else:
             embed.description = "❌ No archived versions found."
 
         await interaction.followup.send(embed=embed, ephemeral=True)
 
+    def build_timeline_embed(self, domain, timeline):
+        embed = discord.Embed(title=f"📜 Archive Timeline for {domain}", color=discord.Color.gold())
+
+        if not timeline.captures:
+            embed.description = "❌ No archived versions found."
+            return embed
+
+        # One line per year, the sparkline runs January to December; Discord caps descriptions, the newest years are kept
+        lines = [f"`{year} {sparkline(stats['months'])}` {stats['captures']:,} captures · {stats['changes']:,} changes" for year, stats in timeline.years().items()]
+        embed.description = "\n".join(lines[-30:])
+
+        embed.add_field(name="📅 First Capture", value=f"[{format_timestamp(timeline.first)}]({snapshot_link(timeline.first, timeline.first_original)})", inline=True)
+        embed.add_field(name="🕒 Last Capture", value=f"[{format_timestamp(timeline.last)}]({snapshot_link(timeline.last, timeline.last_original)})", inline=True)
+        embed.add_field(name="📊 Totals", value=f"{timeline.captures:,} captures · {timeline.changes:,} content changes", inline=False)
+
+        if timeline.recent:
+            changes = [f"[{format_timestamp(timestamp)}]({snapshot_link(timestamp, original)})" for timestamp, original in reversed(timeline.recent)]
+            embed.add_field(name="✏️ Recent Content Changes", value=" · ".join(changes), inline=False)
+
+        footer = f"Granularity: {timeline.mode}"
+        if not timeline.complete:
+            footer += " · history still loading, run the command again to continue"
+        if timeline.error:
+            footer += f" · last fetch failed: {timeline.error[:80]}"
+        embed.set_footer(text=footer)
+        return embed
+
+    @app_commands.command(name="archivetimeline", description="Show how often a website was archived and when its content changed")
+    @app_commands.describe(domain="The domain or URL to look up", granularity="Count one capture per day or hour, or only content changes")
+    @app_commands.choices(granularity=[
+        app_commands.Choice(name="Daily", value="day"),
+        app_commands.Choice(name="Hourly", value="hour"),
+        app_commands.Choice(name="Content changes only", value="change"),
+    ])
+    async def archive_timeline(self, interaction: discord.Interaction, domain: str, granularity: app_commands.Choice[str] = None):
+        await interaction.response.defer(thinking=True, ephemeral=True)
+
+        try:
+            timeline = await self.client.wayback.timeline(domain.strip().lower(), granularity.value if granularity else "day")
+        except CircuitOpenError as e:
+            await interaction.followup.send(f"⚠️ {e}", ephemeral=True)
+            return
+        except Exception as e:
+            await interaction.followup.send(f"⚠️ Error retrieving the archive history: {str(e) or type(e).__name__}", ephemeral=True)
+            return
+
+        await interaction.followup.send(embed=self.build_timeline_embed(domain, timeline), ephemeral=True)
+
 async def setup(client):
     await client.add_cog(WebsiteArchiveLookup(client))
@@ -1,122 +1,190 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiohttp
-import socket
+import asyncio
 import ssl
-from datetime import datetime
+from core.page_snapshot import PageSnapshot, fetch_page_snapshot
+from core.probes import run_probes
+from core.timing import TimingProbe, describe_timing_report, median_phase
 
 class WebsiteScan(commands.Cog):
     def __init__(self, client):
         self.client = client
 
-    async def check_security_headers(self, domain):
-        url = f"https://{domain}"
+    def check_security_headers(self, snapshot):
         headers_to_check = [
             "Strict-Transport-Security", "Content-Security-Policy",
             "X-Frame-Options", "X-Content-Type-Options",
             "Referrer-Policy", "Permissions-Policy", "Access-Control-Allow-Origin"
         ]
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    security_headers = {header: response.headers.get(header, "❌ Missing") for header in headers_to_check}
-                    return security_headers, response
-        except Exception:
-            return None, None
+        if snapshot.error:
+            return None
+        return {header: snapshot.headers.get(header, "❌ Missing") for header in headers_to_check}
 
     async def check_http_vs_https(self, domain):
         url = f"http://{domain}"
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, allow_redirects=False, timeout=5) as response:
-                    if response.status in [301, 302]:
-                        return f"✅ Redirects to HTTPS ({response.headers.get('Location', 'Unknown')})"
-                    return "❌ No HTTPS redirection detected"
+            async with self.client.http_client.get(url, allow_redirects=False, timeout=5) as response:
+                if response.status in [301, 302]:
+                    return f"✅ Redirects to HTTPS ({response.headers.get('Location', 'Unknown')})"
+                return "❌ No HTTPS redirection detected"
         except Exception:
             return "⚠️ Could not check HTTPS redirection"
 
-    def check_ssl_certificate(self, domain):
+    async def fetch_ssl_certificate(self, domain, protocols=True):
+        address = await self.client.resolver.resolve_address(domain)
+        if address is None:
+            return None
         try:
-            ctx = ssl.create_default_context()
-            with socket.create_connection((domain, 443), timeout=5) as sock:
-                with ctx.wrap_socket(sock, server_hostname=domain) as sslsock:
-                    cert = sslsock.getpeercert()
-                    tls_version = sslsock.version()
-
-            issuer = dict(x[0] for x in cert["issuer"])["organizationName"]
-            expiration_date = datetime.strptime(cert["notAfter"], "%b %d %H:%M:%S %Y GMT")
-
-            return {
-                "issuer": issuer,
-                "expires": expiration_date.strftime("%Y-%m-%d"),
-                "valid": expiration_date > datetime.utcnow(),
-                "tls_version": tls_version
-            }
+            return await self.client.tls_probe.probe(domain, address, protocols=protocols)
+        except (OSError, ssl.SSLError, asyncio.TimeoutError, ValueError):
+            return None
+
+    def describe_ssl_status(self, ssl_info):
+        if ssl_info["days_left"] <= 0:
+            return "❌ Expired"
+        if not ssl_info["verified"]:
+            return f"❌ Untrusted ({ssl_info['verify_error']})"
+        return f"✅ Valid ({ssl_info['days_left']:.0f} days left)"
+
+    def describe_ssl_details(self, ssl_info):
+        lines = [f"**Subject:** {ssl_info['subject']}", f"**Key:** {ssl_info['key']}"]
+        if ssl_info["alt_names"]:
+            names = ", ".join(ssl_info["alt_names"][:5])
+            more = f" (+{len(ssl_info['alt_names']) - 5} more)" if len(ssl_info["alt_names"]) > 5 else ""
+            lines.append(f"**SANs:** {names}{more}")
+        if len(ssl_info["chain"]) > 1:
+            lines.append(f"**Chain:** {' → '.join(entry['subject'] for entry in ssl_info['chain'])}")
+        if ssl_info["protocols"] is not None:
+            lines.append(f"**Protocols:** {', '.join(ssl_info['protocols']) or 'None'}")
+        # The ssl module cannot request a stapled response, so only the responder from the certificate is shown
+        lines.append(f"**OCSP:** {ssl_info['ocsp_urls'][0] if ssl_info['ocsp_urls'] else 'No responder listed'}")
+        return "\n".join(lines)[:1024]
+
+    async def certificate_row(self, domain):
+        ssl_info = await self.fetch_ssl_certificate(domain, protocols=False)
+        if ssl_info is None:
+            return {"error": "TLS handshake failed"}
+        return {
+            "subject": ssl_info["subject"],
+            "issuer": ssl_info["issuer"],
+            "expires": ssl_info["expires"],
+            "days_left": int(ssl_info["days_left"]),
+            "verified": ssl_info["verified"],
+            "verify_error": ssl_info["verify_error"] or "",
+            "key": ssl_info["key"],
+            "tls_version": ssl_info["tls_version"],
+            "alt_names": len(ssl_info["alt_names"]),
+            "fingerprint": ssl_info["fingerprint"],
+        }
+
+    async def probe_waf_block(self, domain):
+        try:
+            async with self.client.http_client.get(f"https://{domain}/?id=' OR 1=1 --", timeout=5) as response:
+                return response.status in [403, 406]
         except Exception:
             return None
 
-    async def detect_waf(self, domain):
-        url = f"https://{domain}"
+    def detect_waf(self, snapshot, blocked_injection):
         waf_headers = {
             "server": ["cloudflare", "akamai", "incapsula", "sucuri"],
             "x-powered-by": ["mod_security", "sucuri"],
             "x-cdn": ["cloudflare", "imperva", "fastly"]
         }
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    headers = {key.lower(): value.lower() for key, value in response.headers.items()}
+        if snapshot.error:
+            return "⚠️ Could not test for WAF"
 
-                    for header, waf_list in waf_headers.items():
-                        if header in headers:
-                            for waf in waf_list:
-                                if waf in headers[header]:
-                                    return f"🛡 Detected: {waf.capitalize()} WAF"
+        headers = {key.lower(): value.lower() for key, value in snapshot.headers.items()}
 
-                async with session.get(f"{url}/?id=' OR 1=1 --", timeout=5) as response:
-                    if response.status in [403, 406]:
-                        return "🚫 WAF Detected (Blocked SQL Injection)"
+        for header, waf_list in waf_headers.items():
+            if header in headers:
+                for waf in waf_list:
+                    if waf in headers[header]:
+                        return f"🛡 Detected: {waf.capitalize()} WAF"
 
-        except Exception:
+        if blocked_injection is None:
             return "⚠️ Could not test for WAF"
-
+        if blocked_injection:
+            return "🚫 WAF Detected (Blocked SQL Injection)"
         return "✅ No WAF Detected"
 
-    async def check_cdn_provider(self, domain):
-        url = f"https://{domain}"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    cdn_headers = ["server", "via", "x-cache", "cf-ray"]
-                    detected_cdn = [f"{header}: {response.headers.get(header)}" for header in cdn_headers if header in response.headers]
-                    return detected_cdn if detected_cdn else ["❌ No CDN detected"]
-        except Exception:
+    def check_cdn_provider(self, snapshot):
+        if snapshot.error:
             return ["⚠️ Could not check CDN"]
 
-    async def check_performance(self, domain):
-        url = f"https://{domain}"
-        try:
-            async with aiohttp.ClientSession() as session:
-                start_time = datetime.utcnow()
-                async with session.get(url, timeout=5) as response:
-                    elapsed_time = (datetime.utcnow() - start_time).total_seconds()
-                    return f"⏳ Response Time: {elapsed_time:.2f} seconds"
-        except Exception:
+        cdn_headers = ["server", "via", "x-cache", "cf-ray"]
+        detected_cdn = [f"{header}: {snapshot.headers.get(header)}" for header in cdn_headers if header in snapshot.headers]
+        return detected_cdn if detected_cdn else ["❌ No CDN detected"]
+
+    def check_performance(self, report):
+        if report is None:
             return "⚠️ Could not measure response time"
+        response_time = median_phase(report, "headers")
+        summary = f"⏳ Response Time: {response_time:.2f} seconds (median of {report['samples']})\n" if response_time is not None else ""
+        return (summary + describe_timing_report(report))[:1024]
+
+    async def measure_performance(self, url, page):
+        # Timing waits for the page fetch and reuses it instead of fetching the page once more
+        await asyncio.wait([page])
+        snapshot = None if page.cancelled() or page.exception() else page.result()
+        return await TimingProbe(self.client.http_client, self.client.resolver).run(url, snapshot=snapshot)
+
+    async def scan_website(self, domain, protocols=False):
+        url = f"https://{domain}"
+        page = asyncio.ensure_future(fetch_page_snapshot(self.client.http_client, url))
+        results = await run_probes({
+            "page": page,
+            # Each protocol costs a handshake of its own, so the sweep only runs on request
+            "ssl": self.fetch_ssl_certificate(domain, protocols=protocols),
+            "https redirect": self.check_http_vs_https(domain),
+            "waf": self.probe_waf_block(domain),
+            "performance": self.measure_performance(url, page),
+        })
+
+        snapshot = results.get("page") or PageSnapshot.unavailable(url)
+        return {
+            "security_headers": self.check_security_headers(snapshot),
+            "ssl": results.get("ssl"),
+            "https_redirect": results.get("https redirect", "⚠️ Could not check HTTPS redirection"),
+            "waf": self.detect_waf(snapshot, results.get("waf")),
+            "cdn": self.check_cdn_provider(snapshot),
+            "performance": self.check_performance(results.get("performance")),
+            "response_time": median_phase(results["performance"], "headers") if "performance" in results else None,
+            "results": results,
+        }
+
+    async def website_scan_row(self, domain):
+        scan = await self.scan_website(domain)
+        security_headers = scan["security_headers"] or {}
+        ssl_info = scan["ssl"] or {}
+        return {
+            "missing_headers": " ".join(key for key, value in security_headers.items() if value == "❌ Missing") if security_headers else "unreachable",
+            "https_redirect": scan["https_redirect"],
+            "ssl_valid": ssl_info.get("valid"),
+            "ssl_issuer": ssl_info.get("issuer"),
+            "ssl_expires": ssl_info.get("expires"),
+            "tls_version": ssl_info.get("tls_version"),
+            "waf": scan["waf"],
+            "cdn": " | ".join(scan["cdn"]),
+            "response_time": round(scan["response_time"], 3) if scan["response_time"] is not None else None,
+            "partial": scan["results"].partial_note() if scan["results"].partial else "",
+        }
 
     @app_commands.command(name="websitescan", description="Scan a website for security headers, SSL, WAF, and performance")
-    async def website_scan(self, interaction: discord.Interaction, domain: str):
+    @app_commands.describe(protocols="Also test which TLS versions the server accepts (one extra handshake per version)")
+    async def website_scan(self, interaction: discord.Interaction, domain: str, protocols: bool = False):
         await interaction.response.defer(thinking=True, ephemeral=True)
 
-        security_headers, response = await self.check_security_headers(domain)
-        ssl_info = self.check_ssl_certificate(domain)
-        https_check = await self.check_http_vs_https(domain)
-        waf_check = await self.detect_waf(domain)
-        cdn_info = await self.check_cdn_provider(domain)
-        performance_info = await self.check_performance(domain)
+        scan = await self.scan_website(domain, protocols=protocols)
+        results = scan["results"]
+        security_headers = scan["security_headers"]
+        ssl_info = scan["ssl"]
+        https_check = scan["https_redirect"]
+        waf_check = scan["waf"]
+        cdn_info = scan["cdn"]
+        performance_info = scan["performance"]
 
         embed = discord.Embed(title=f"🔍 Security Scan for {domain}", color=discord.Color.red())
 
@@ -128,16 +196,19 @@ class WebsiteScan(commands.Cog):
         embed.add_field(name="🔐 HTTPS Redirection", value=https_check, inline=False)
 
         if ssl_info:
-            ssl_status = "✅ Valid" if ssl_info["valid"] else "❌ Expired"
-            embed.add_field(name="🔒 SSL Status", value=ssl_status, inline=False)
+            embed.add_field(name="🔒 SSL Status", value=self.describe_ssl_status(ssl_info), inline=False)
             embed.add_field(name="🏢 Issuer", value=ssl_info["issuer"], inline=False)
             embed.add_field(name="📅 Expires", value=ssl_info["expires"], inline=False)
             embed.add_field(name="🔐 TLS Version", value=ssl_info["tls_version"], inline=False)
+            embed.add_field(name="📜 Certificate", value=self.describe_ssl_details(ssl_info), inline=False)
 
         embed.add_field(name="🛡 WAF Detection", value=waf_check, inline=False)
         embed.add_field(name="📡 CDN Provider", value="\n".join(cdn_info), inline=False)
         embed.add_field(name="⚡ Performance", value=performance_info, inline=False)
 
+        if results.partial:
+            embed.set_footer(text=results.partial_note())
+
         await interaction.followup.send(embed=embed, ephemeral=True)
 
 async def setup(client):
@@ -0,0 +1,22 @@
+import csv
+import io
+
+import pytest
+
+from core.bulk import render_csv
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("=HYPERLINK(\"http://evil\")", "'=HYPERLINK(\"http://evil\")"),
+    ("+1+1", "'+1+1"),
+    ("-2+3", "'-2+3"),
+    ("@SUM(A1)", "'@SUM(A1)"),
+    ("\t=1", "'\t=1"),
+    ("example.com", "example.com"),
+    ("a=b", "a=b"),
+    (-5, "-5"),
+    (None, ""),
+])
+def test_render_csv_escapes_formulas(value, expected):
+    rows = list(csv.DictReader(io.StringIO(render_csv([{"target": "example.com", "value": value}, None]).decode())))
+    assert rows == [{"target": "example.com", "value": expected}]
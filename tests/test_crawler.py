@@ -0,0 +1,99 @@
+import pytest
+
+from core.crawler import RobotsTxt, product_token
+
+ROBOTS = """
+# Everyone else
+User-agent: *
+Disallow: /private
+Allow: /private/public
+Disallow: /*.php$
+Disallow: /tmp*/cache
+Crawl-delay: 5
+
+User-agent: bot
+Disallow: /
+
+User-agent: MuffinBot/2.0
+User-agent: otherbot
+Disallow: /secret  # trailing comment
+Allow: /secret/open
+Allow: /same
+Disallow: /same
+Crawl-delay: 0.5
+
+User-agent:
+Disallow: /empty
+
+Sitemap: https://example.com/sitemap.xml
+"""
+
+
+@pytest.mark.parametrize("agent, path, expected", [
+    # Longest match decides, Allow wins a tie
+    ("muffinbot", "/page", True),
+    ("muffinbot", "/secret", False),
+    ("muffinbot", "/secret/page", False),
+    ("muffinbot", "/secret/open/page", True),
+    ("muffinbot", "/same", True),
+    # Only the most specific group applies, the * rules do not add up with it
+    ("muffinbot", "/private", True),
+    ("someone", "/private", False),
+    ("someone", "/private/public/x", True),
+    ("someone", "/privateer", False),
+    ("someone", "/index.php", False),
+    ("someone", "/index.php?page=1", True),
+    ("someone", "/tmp1/cache/x", False),
+    ("someone", "/tmp/other", True),
+    ("someone", "/secret", True),
+    ("otherbot", "/secret", False),
+    ("OtherBot", "/secret/open", True),
+    # "bot" is its own product token, it does not match muffinbot or otherbot by substring
+    ("bot", "/anything", False),
+    ("Bot/1.0", "/anything", False),
+    ("robot", "/anything", True),
+    # An empty User-agent line applies to nobody, an empty agent falls back to *
+    ("", "/empty", True),
+    ("", "/private", False),
+])
+def test_allowed(agent, path, expected):
+    assert RobotsTxt(ROBOTS).allowed(path, agent) is expected
+
+
+@pytest.mark.parametrize("agent, expected", [
+    ("muffinbot", 0.5),
+    ("MUFFINBOT", 0.5),
+    ("muffinbot/3.1", 0.5),
+    ("someone", 5.0),
+    ("bot", None),
+])
+def test_crawl_delay(agent, expected):
+    assert RobotsTxt(ROBOTS).crawl_delay(agent) == expected
+
+
+@pytest.mark.parametrize("text, path, expected", [
+    ("", "/", True),
+    ("User-agent: *\nDisallow:", "/", True),
+    ("User-agent: *\nDisallow: /", "/", False),
+    ("Disallow: /", "/", True),
+    ("User-agent: *\nDisallow: /$", "/", False),
+    ("User-agent: *\nDisallow: /$", "/page", True),
+    ("user-agent: *\ndisallow: /a\n\nuser-agent: *\nallow: /a/b", "/a/b", True),
+    ("User-agent: other\nDisallow: /\n\nUser-agent: muffinbot\nDisallow: /x", "/", True),
+])
+def test_allowed_edge_cases(text, path, expected):
+    assert RobotsTxt(text).allowed(path) is expected
+
+
+def test_sitemaps():
+    assert RobotsTxt(ROBOTS).sitemaps == ["https://example.com/sitemap.xml"]
+
+
+@pytest.mark.parametrize("agent, expected", [
+    ("muffinbot", "muffinbot"),
+    ("MuffinBot/2.0", "muffinbot"),
+    (" Googlebot ", "googlebot"),
+    ("", ""),
+])
+def test_product_token(agent, expected):
+    assert product_token(agent) == expected
@@ -0,0 +1,281 @@
+import asyncio
+import struct
+
+import pytest
+
+from core import dns_resolver
+from core.dns_resolver import MALFORMED_ERRORS, RECORD_NAMES, RECORD_TYPES, DnsError, DnsResolver, build_query, decode_name, parse_response
+
+QUESTION = b"\x07example\x03com\x00"
+# Offset of the question name, answers point back at it with 0xC00C
+NAME_POINTER = b"\xc0\x0c"
+
+
+def header(query_id=0x1234, flags=0x8180, questions=1, answers=1, authority=0):
+    return struct.pack("!HHHHHH", query_id, flags, questions, answers, authority, 0)
+
+
+def record(record_type, rdata, name=NAME_POINTER, ttl=300):
+    return name + struct.pack("!HHIH", RECORD_TYPES[record_type], 1, ttl, len(rdata)) + rdata
+
+
+def response(record_type, *records, **fields):
+    return header(answers=len(records), **fields) + QUESTION + struct.pack("!HH", RECORD_TYPES[record_type], 1) + b"".join(records)
+
+
+@pytest.mark.parametrize("message, offset, expected", [
+    (QUESTION, 0, ("example.com.", 13)),
+    (b"\x00", 0, (".", 1)),
+    # A pointer ends the name two bytes after it, wherever the labels it points to live
+    (QUESTION + b"\x03www\xc0\x00", 13, ("www.example.com.", 19)),
+    (QUESTION + b"\xc0\x00", 13, ("example.com.", 15)),
+    (b"\x03MiX\x00", 0, ("MiX.", 5)),
+])
+def test_decode_name(message, offset, expected):
+    assert decode_name(message, offset) == expected
+
+
+@pytest.mark.parametrize("message, error", [
+    (b"\xc0\x00", DnsError),
+    (b"\x03www\xc0\x00", DnsError),
+    (b"\x07exam", IndexError),
+    (b"\xc0", IndexError),
+])
+def test_decode_name_rejects_loops_and_truncation(message, error):
+    with pytest.raises(error):
+        decode_name(message, 0)
+
+
+@pytest.mark.parametrize("record_type, rdata, expected", [
+    ("A", bytes([93, 184, 216, 34]), "93.184.216.34"),
+    ("AAAA", bytes(15) + b"\x01", "::1"),
+    ("CNAME", b"\x03www" + NAME_POINTER, "www.example.com."),
+    ("MX", b"\x00\x0a\x04mail" + NAME_POINTER, "10 mail.example.com."),
+    ("TXT", b"\x05hello\x06 world", "hello world"),
+    ("SOA", b"\x02ns" + NAME_POINTER + b"\x04host" + NAME_POINTER + struct.pack("!IIIII", 1, 2, 3, 4, 5), "ns.example.com. host.example.com. 1 2 3 4 5"),
+])
+def test_parse_response_records(record_type, rdata, expected):
+    message = parse_response(response(record_type, record(record_type, rdata)))
+    assert message.id == 0x1234
+    assert message.question == ("example.com.", RECORD_TYPES[record_type])
+    assert [(answer["name"], answer["data"], answer["TTL"]) for answer in message.answers] == [("example.com.", expected, 300)]
+
+
+def test_parse_response_flags_and_authority():
+    soa = record("SOA", b"\x02ns" + NAME_POINTER + b"\x04host" + NAME_POINTER + struct.pack("!IIIII", 1, 2, 3, 4, 60))
+    data = header(flags=0x8383, answers=0, authority=1) + QUESTION + struct.pack("!HH", RECORD_TYPES["A"], 1) + soa
+    message = parse_response(data)
+    assert message.rcode == 3
+    assert message.truncated
+    assert message.answers == []
+    assert message.authority[0]["data"].endswith(" 60")
+
+
+TXT_ANSWER = response("TXT", record("TXT", b"\x05hello\x06 world"))
+A_ANSWER = response("A", record("A", bytes([93, 184, 216, 34])))
+
+
+@pytest.mark.parametrize("message", [
+    A_ANSWER[:6],
+    A_ANSWER[:20],
+    A_ANSWER[:len(header()) + len(QUESTION) + 2],
+    A_ANSWER[:-5],
+    A_ANSWER[:-1],
+    TXT_ANSWER[:-3],
+    TXT_ANSWER[:-12],
+])
+def test_parse_response_rejects_truncated_answers(message):
+    with pytest.raises(MALFORMED_ERRORS + (DnsError,)):
+        parse_response(message)
+
+
+def test_build_query_round_trips():
+    message = parse_response(build_query(0xBEEF, "Example.com", "MX"))
+    assert message.id == 0xBEEF
+    assert message.question == ("example.com.", RECORD_TYPES["MX"])
+    assert message.answers == []
+
+
+def serve_tcp(reply):
+    # Answers one TCP query with reply(query) and closes, loopback only
+    async def handle(reader, writer):
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+        writer.write(reply(await reader.readexactly(length)))
+        await writer.drain()
+        writer.close()
+    return asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def framed(message):
+    return struct.pack("!H", len(message)) + message
+
+
+@pytest.mark.parametrize("reply, error", [
+    (lambda query: b"\x00\x40abc", EOFError),
+    (lambda query: framed(query[:2] + b"\x81\x80\x00\x01\x00\x00\x00\x00\x00\x00\x07exam"), IndexError),
+    (lambda query: framed(response("A", record("A", bytes(4)), query_id=(int.from_bytes(query[:2], "big") + 1) % 65536)), DnsError),
+    (lambda query: framed(query[:2] + response("AAAA", record("AAAA", bytes(16)))[2:]), DnsError),
+])
+def test_query_tcp_rejects_broken_answers(reply, error):
+    async def run():
+        server = await serve_tcp(reply)
+        resolver = DnsResolver()
+        resolver.timeout = 1
+        try:
+            await resolver.query_tcp(server.sockets[0].getsockname()[:2], "example.com", "A")
+        finally:
+            server.close()
+
+    with pytest.raises(error):
+        asyncio.run(run())
+
+
+def test_query_tcp_accepts_matching_answer():
+    async def run():
+        server = await serve_tcp(lambda query: framed(query[:2] + A_ANSWER[2:]))
+        resolver = DnsResolver()
+        resolver.timeout = 1
+        try:
+            return await resolver.query_tcp(server.sockets[0].getsockname()[:2], "example.com", "A")
+        finally:
+            server.close()
+
+    assert asyncio.run(run()).answers[0]["data"] == "93.184.216.34"
+
+
+class StubDns(asyncio.DatagramProtocol):
+    # Loopback UDP nameserver, answers every query with reply(query) unless that returns None
+    def __init__(self, reply):
+        self.reply = reply
+        self.queries = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries.append((addr, RECORD_NAMES[parse_response(data).question[1]]))
+        answer = self.reply(data)
+        if answer is not None:
+            self.transport.sendto(answer, addr)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+STUB_RDATA = {"A": bytes([93, 184, 216, 34]), "TXT": b"\x05hello", "MX": b"\x00\x0a\x04mail" + NAME_POINTER}
+
+
+def stub_answer(query, ttl=300):
+    record_type = RECORD_NAMES[parse_response(query).question[1]]
+    return response(record_type, record(record_type, STUB_RDATA[record_type], ttl=ttl), query_id=int.from_bytes(query[:2], "big"))
+
+
+def stub_nxdomain(query):
+    # SOA TTL 600 with a minimum of 30, the negative answer lives for the smaller of the two
+    soa = record("SOA", b"\x02ns" + NAME_POINTER + b"\x04host" + NAME_POINTER + struct.pack("!IIIII", 1, 2, 3, 4, 30), ttl=600)
+    question = parse_response(query).question[1]
+    return header(query_id=int.from_bytes(query[:2], "big"), flags=0x8183, answers=0, authority=1) + QUESTION + struct.pack("!HH", question, 1) + soa
+
+
+def run_against_stub(reply, scenario, monkeypatch, http_client=None):
+    clock = Clock()
+    monkeypatch.setattr(dns_resolver, "time", clock)
+
+    async def run():
+        transport, stub = await asyncio.get_running_loop().create_datagram_endpoint(lambda: StubDns(reply), local_addr=("127.0.0.1", 0))
+        resolver = DnsResolver(http_client)
+        resolver.nameservers = [transport.get_extra_info("sockname")[:2]]
+        resolver.timeout = 0.2
+        resolver.attempts = 1
+        try:
+            return await scenario(resolver, stub, clock)
+        finally:
+            transport.close()
+
+    return asyncio.run(run())
+
+
+def test_resolve_many_shares_one_socket(monkeypatch):
+    async def scenario(resolver, stub, clock):
+        results = await resolver.resolve_many("Example.com.", ["A", "TXT", "MX"])
+        assert {record_type: [answer["data"] for answer in answers] for record_type, answers in results.items()} == {
+            "A": ["93.184.216.34"], "TXT": ["hello"], "MX": ["10 mail.example.com."],
+        }
+        assert sorted(record_type for _, record_type in stub.queries) == ["A", "MX", "TXT"]
+        assert len({addr for addr, _ in stub.queries}) == 1
+        assert resolver.counters["udp"] == 3
+
+    run_against_stub(stub_answer, scenario, monkeypatch)
+
+
+def test_answers_are_cached_until_the_ttl_expires(monkeypatch):
+    async def scenario(resolver, stub, clock):
+        await resolver.resolve("example.com", "A")
+        clock.now += 299
+        assert (await resolver.resolve("example.com", "A"))[0]["data"] == "93.184.216.34"
+        assert len(stub.queries) == 1
+        assert resolver.counters["cache_hits"] == 1
+        clock.now += 1
+        await resolver.resolve("example.com", "A")
+        assert len(stub.queries) == 2
+
+    run_against_stub(stub_answer, scenario, monkeypatch)
+
+
+def test_nxdomain_is_cached_for_the_soa_minimum(monkeypatch):
+    async def scenario(resolver, stub, clock):
+        assert await resolver.resolve("example.com", "A") == []
+        clock.now += 29
+        assert await resolver.resolve("example.com", "A") == []
+        assert len(stub.queries) == 1
+        assert resolver.counters["negative_hits"] == 1
+        clock.now += 1
+        await resolver.resolve("example.com", "A")
+        assert len(stub.queries) == 2
+
+    run_against_stub(stub_nxdomain, scenario, monkeypatch)
+
+
+class DohResponse:
+    status = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self, content_type=None):
+        return self.data
+
+
+class DohClient:
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return DohResponse({"Status": 0, "Answer": [{"name": "example.com.", "type": 1, "TTL": 120, "data": "93.184.216.34"}]})
+
+
+def test_silent_nameserver_falls_back_to_doh(monkeypatch):
+    doh = DohClient()
+
+    async def scenario(resolver, stub, clock):
+        assert (await resolver.resolve("example.com", "A"))[0]["data"] == "93.184.216.34"
+        assert len(stub.queries) == 1
+        assert doh.urls == ["https://dns.google/resolve?name=example.com&type=A"]
+        clock.now += 119
+        await resolver.resolve("example.com", "A")
+        assert len(doh.urls) == 1
+
+    monkeypatch.delenv("DNS_DOH_URL", raising=False)
+    run_against_stub(lambda query: None, scenario, monkeypatch, doh)
@@ -0,0 +1,213 @@
+import ipaddress
+import struct
+
+import pytest
+
+from core.ip_intel import MMDB_MARKER, IpIntel, MmdbReader, RangeTable, cidr_prefix, compile_ranges, describe_range, flatten_ranges, ip_to_int
+
+
+def v4(value):
+    return ip_to_int(value)
+
+
+@pytest.mark.parametrize("ranges, expected", [
+    ([], []),
+    ([(1, 5, "a"), (10, 12, "b")], [(1, 5, "a"), (10, 12, "b")]),
+    # Nested CIDRs, the more specific one owns its addresses
+    ([(0, 255, "/24"), (16, 31, "/28"), (20, 23, "/30")], [(0, 15, "/24"), (16, 19, "/28"), (20, 23, "/30"), (24, 31, "/28"), (32, 255, "/24")]),
+    ([(16, 31, "/28"), (0, 255, "/24")], [(0, 15, "/24"), (16, 31, "/28"), (32, 255, "/24")]),
+    ([(0, 100, "outer"), (10, 20, "a"), (50, 60, "b")], [(0, 9, "outer"), (10, 20, "a"), (21, 49, "outer"), (50, 60, "b"), (61, 100, "outer")]),
+    # Same start, the narrower range wins and the wider one keeps the rest
+    ([(10, 30, "wide"), (10, 20, "narrow")], [(10, 20, "narrow"), (21, 30, "wide")]),
+    ([(0, 15, "inner"), (0, 255, "outer")], [(0, 15, "inner"), (16, 255, "outer")]),
+    # Start/end datasets can overlap without nesting, the later start wins and the tail survives
+    ([(10, 20, "a"), (15, 30, "b")], [(10, 14, "a"), (15, 30, "b")]),
+    ([(0, 50, "a"), (10, 100, "b"), (60, 70, "c")], [(0, 9, "a"), (10, 59, "b"), (60, 70, "c"), (71, 100, "b")]),
+    ([(5, 5, "a"), (5, 5, "b")], [(5, 5, "b")]),
+])
+def test_flatten_ranges(ranges, expected):
+    assert list(flatten_ranges(ranges)) == expected
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (v4("10.0.0.0"), v4("10.255.255.255"), 104),
+    (v4("10.0.0.1"), v4("10.0.0.1"), 128),
+    (v4("10.0.0.1"), v4("10.0.0.2"), 0),
+    (v4("10.0.0.0"), v4("10.0.0.2"), 0),
+    (0, (1 << 127) - 1, 1),
+])
+def test_cidr_prefix(start, end, expected):
+    assert cidr_prefix(start, end) == expected
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (v4("8.8.8.0"), v4("8.8.8.255"), "8.8.8.0/24"),
+    (v4("1.0.0.0"), v4("1.0.0.2"), "1.0.0.0 - 1.0.0.2"),
+    (ip_to_int("2001:db8::"), ip_to_int("2001:db8::ffff"), "2001:db8::/112"),
+])
+def test_describe_range(start, end, expected):
+    assert describe_range(start, end) == expected
+
+
+CSV = """network,asn,as_name,country
+8.8.0.0/16,15169,Google LLC,US
+8.8.8.0/24,15169,Google DNS,US
+1.0.0.0/24,13335,Cloudflare,AU
+2001:db8::/32,64500,Documentation,ZZ
+"""
+RANGES_TSV = "1.0.0.0\t1.0.0.255\t13335\tAU\tCLOUDFLARENET\n1.0.4.0\t1.0.7.255\t38803\tAU\tGTELECOM\n1.0.8.0\t1.0.8.255\t0\tNone\tNot routed\n"
+
+
+@pytest.mark.parametrize("name, content, ip, expected", [
+    ("asn.csv", CSV, "8.8.8.8", ({"asn": 15169, "org": "Google DNS", "country": "US"}, "8.8.8.0/24")),
+    # Flattening splits the /16 around the /24, lookups still report the announced prefix
+    ("asn.csv", CSV, "8.8.4.4", ({"asn": 15169, "org": "Google LLC", "country": "US"}, "8.8.0.0/16")),
+    ("asn.csv", CSV, "8.8.9.1", ({"asn": 15169, "org": "Google LLC", "country": "US"}, "8.8.0.0/16")),
+    ("asn.csv", CSV, "1.0.0.1", ({"asn": 13335, "org": "Cloudflare", "country": "AU"}, "1.0.0.0/24")),
+    ("asn.csv", CSV, "2001:db8::1", ({"asn": 64500, "org": "Documentation", "country": "ZZ"}, "2001:db8::/32")),
+    ("asn.csv", CSV, "9.9.9.9", (None, None)),
+    ("ip2asn.tsv", RANGES_TSV, "1.0.5.1", ({"asn": 38803, "org": "GTELECOM", "country": "AU"}, "1.0.4.0/22")),
+    ("ip2asn.tsv", RANGES_TSV, "1.0.8.1", (None, None)),
+])
+def test_compiled_range_lookup(tmp_path, name, content, ip, expected):
+    source = tmp_path / name
+    source.write_text(content)
+    compile_ranges(str(source), str(tmp_path / "compiled.ranges"))
+    table = RangeTable(str(tmp_path / "compiled.ranges"), name)
+    try:
+        assert table.lookup(ip) == expected
+        assert table.lookup_sorted([ip_to_int(ip).to_bytes(16, "big")]) == [expected[0]]
+    finally:
+        table.close()
+
+
+def encode(value):
+    # Just enough of the MaxMind DB data format to write the fixtures below
+    def control(kind, size, payload):
+        extra = b""
+        if size >= 285:
+            size, extra = 30, (size - 285).to_bytes(2, "big")
+        elif size >= 29:
+            size, extra = 29, bytes([size - 29])
+        if kind <= 7:
+            return bytes([(kind << 5) | size]) + extra + payload
+        return bytes([size, kind - 7]) + extra + payload
+
+    if isinstance(value, Pointer):
+        return bytes([0x20 | (value.offset >> 8)]) + bytes([value.offset & 0xFF])
+    if isinstance(value, bool):
+        return control(14, int(value), b"")
+    if isinstance(value, str):
+        data = value.encode()
+        return control(2, len(data), data)
+    if isinstance(value, float):
+        return control(3, 8, struct.pack("!d", value))
+    if isinstance(value, int):
+        data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+        return control(6 if value < 1 << 32 else 9, len(data), data)
+    if isinstance(value, dict):
+        return control(7, len(value), b"".join(encode(key) + encode(item) for key, item in value.items()))
+    if isinstance(value, list):
+        return control(11, len(value), b"".join(encode(item) for item in value))
+    raise TypeError(value)
+
+
+class Pointer:
+    def __init__(self, offset):
+        self.offset = offset
+
+
+def pack_node(left, right, record_size):
+    if record_size == 24:
+        return left.to_bytes(3, "big") + right.to_bytes(3, "big")
+    if record_size == 28:
+        middle = ((left >> 24) << 4) | (right >> 24)
+        return (left & 0xFFFFFF).to_bytes(3, "big") + bytes([middle]) + (right & 0xFFFFFF).to_bytes(3, "big")
+    return left.to_bytes(4, "big") + right.to_bytes(4, "big")
+
+
+def write_mmdb(path, networks, record_size=24, ip_version=4, shared=()):
+    # networks: [(cidr, record)], shared values are written first so records can point at them
+    data = b"".join(encode(value) for value in shared)
+    tree = [[None, None]]
+    leaves = []
+    for cidr, record in networks:
+        network = ipaddress.ip_network(cidr)
+        bits, number = network.prefixlen, int(network.network_address)
+        total = network.max_prefixlen
+        if ip_version == 6 and network.version == 4:
+            bits, total = bits + 96, 128
+        node = 0
+        for depth in range(bits - 1):
+            bit = (number >> (total - 1 - depth)) & 1
+            if tree[node][bit] is None:
+                tree.append([None, None])
+                tree[node][bit] = len(tree) - 1
+            node = tree[node][bit]
+        leaves.append((node, (number >> (total - bits)) & 1, len(data)))
+        data += encode(record)
+
+    node_count = len(tree)
+    for node, bit, offset in leaves:
+        tree[node][bit] = ("data", offset)
+    nodes = b""
+    for left, right in tree:
+        records = []
+        for child in (left, right):
+            if child is None:
+                records.append(node_count)
+            elif isinstance(child, tuple):
+                records.append(node_count + 16 + child[1])
+            else:
+                records.append(child)
+        nodes += pack_node(*records, record_size)
+
+    metadata = {"node_count": node_count, "record_size": record_size, "ip_version": ip_version, "database_type": "Muffin-Test"}
+    path.write_bytes(nodes + bytes(16) + data + MMDB_MARKER + encode(metadata))
+
+
+CITY = {
+    "city": {"names": {"en": "Mountain View", "de": "Mountain View"}},
+    "country": {"iso_code": "US"},
+    "location": {"latitude": 37.386, "longitude": -122.0838},
+    "subdivisions": [{"names": {"en": "California"}}],
+    "note": "x" * 300,
+}
+
+
+@pytest.mark.parametrize("record_size", [24, 28, 32])
+@pytest.mark.parametrize("ip_version", [4, 6])
+@pytest.mark.parametrize("ip, expected", [
+    ("8.8.8.8", (CITY, "8.8.8.0/24")),
+    ("8.8.2.2", ({"autonomous_system_number": 15169, "autonomous_system_organization": "Google LLC"}, "8.8.0.0/22")),
+    ("8.8.9.9", (None, None)),
+    ("1.1.1.1", ({"flags": [True, False], "score": 0.5, "big": 1 << 40, "name": "shared"}, "1.1.1.1/32")),
+])
+def test_mmdb_lookup(tmp_path, record_size, ip_version, ip, expected):
+    path = tmp_path / "test.mmdb"
+    write_mmdb(path, [
+        ("8.8.8.0/24", CITY),
+        ("8.8.0.0/22", {"autonomous_system_number": 15169, "autonomous_system_organization": "Google LLC"}),
+        ("1.1.1.1/32", {"flags": [True, False], "score": 0.5, "big": 1 << 40, "name": Pointer(0)}),
+    ], record_size, ip_version, shared=["shared"])
+    reader = MmdbReader(str(path))
+    try:
+        assert reader.description == "Muffin-Test"
+        assert reader.lookup(ip) == expected
+    finally:
+        reader.close()
+
+
+def test_ip_intel_merges_datasets(tmp_path):
+    write_mmdb(tmp_path / "city.mmdb", [("8.8.8.0/24", CITY)])
+    (tmp_path / "asn.csv").write_text(CSV)
+    intel = IpIntel(f"{tmp_path / 'city.mmdb'},{tmp_path / 'asn.csv'}", str(tmp_path / "cache"))
+    for path in intel.paths:
+        intel.datasets[path] = intel.open_dataset(path)
+    try:
+        expected = {"country": "US", "city": "Mountain View", "region": "California", "location": "37.386,-122.0838", "network": "8.8.8.0/24", "asn": 15169, "org": "Google DNS"}
+        assert intel.lookup("8.8.8.8") == expected
+        assert intel.lookup_many(["8.8.8.8", "9.9.9.9", "8.8.8.8", "not an ip"]) == {"8.8.8.8": {key: value for key, value in expected.items() if key != "network"}, "9.9.9.9": None}
+    finally:
+        for dataset in intel.datasets.values():
+            dataset.close()
@@ -0,0 +1,56 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from core.store import ResultStore
+
+
+def test_failed_flush_keeps_rows_pending(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+
+    async def run():
+        store = ResultStore()
+        await store.start()
+        try:
+            store.put("scan", "example.com", {"open": [80]})
+            write_batch = store.write_batch
+
+            def fail(batch):
+                raise sqlite3.OperationalError("database is locked")
+
+            store.write_batch = fail
+            with pytest.raises(sqlite3.OperationalError):
+                await store.flush()
+            assert await store.get("scan", "example.com") == {"open": [80]}
+
+            store.write_batch = write_batch
+            await store.flush()
+            assert store.pending == {}
+            assert await store.get("scan", "example.com") == {"open": [80]}
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_put_during_flush_is_not_lost(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+
+    async def run():
+        store = ResultStore()
+        await store.start()
+        try:
+            store.put("scan", "example.com", 1)
+            flush = asyncio.ensure_future(store.flush())
+            await asyncio.sleep(0)
+            store.put("scan", "example.com", 2)
+            await flush
+            assert await store.get("scan", "example.com") == 2
+            await store.flush()
+            assert store.pending == {}
+            assert await store.get("scan", "example.com") == 2
+        finally:
+            await store.close()
+
+    asyncio.run(run())
@@ -0,0 +1,73 @@
+import os
+import ssl
+from datetime import datetime, timezone
+
+import pytest
+
+from core.x509 import Certificate, DerError, decode_oid, read_element
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name)) as file:
+        return ssl.PEM_cert_to_DER_cert(file.read())
+
+
+@pytest.mark.parametrize("fixture, field, expected", [
+    ("ec_p256.pem", "serial", "1234"),
+    ("ec_p256.pem", "subject", {"country": "DE", "organization": "Muffin Test", "common_name": "muffin.example"}),
+    ("ec_p256.pem", "common_name", "muffin.example"),
+    ("ec_p256.pem", "issuer_name", "Muffin Test"),
+    ("ec_p256.pem", "self_signed", True),
+    ("ec_p256.pem", "not_before", datetime(2026, 10, 18, 11, 26, 34, tzinfo=timezone.utc)),
+    ("ec_p256.pem", "not_after", datetime(2036, 10, 15, 11, 26, 34, tzinfo=timezone.utc)),
+    ("ec_p256.pem", "alt_names", ["muffin.example", "www.muffin.example", "192.0.2.1"]),
+    ("ec_p256.pem", "ocsp_urls", ["http://ocsp.muffin.example/"]),
+    ("ec_p256.pem", "ca_issuer_urls", ["http://ca.muffin.example/ca.der"]),
+    ("ec_p256.pem", "key_type", "EC P-256"),
+    ("ec_p256.pem", "key_size", 256),
+    ("rsa_2048.pem", "serial", "05"),
+    ("rsa_2048.pem", "issuer_name", "rsa.muffin.example"),
+    ("rsa_2048.pem", "alt_names", []),
+    ("rsa_2048.pem", "key_type", "RSA"),
+    ("rsa_2048.pem", "key_size", 2048),
+])
+def test_certificate_fields(fixture, field, expected):
+    assert getattr(Certificate(load(fixture)), field) == expected
+
+
+def test_describe_key():
+    assert Certificate(load("rsa_2048.pem")).describe_key() == "RSA 2048"
+
+
+@pytest.mark.parametrize("cut", [1, 4, 40, 200, -1])
+def test_truncated_certificate(cut):
+    with pytest.raises(DerError):
+        Certificate(load("ec_p256.pem")[:cut])
+
+
+@pytest.mark.parametrize("data, expected", [
+    (b"\x02\x01\x05", (0x02, b"\x05", 3)),
+    (b"\x04\x81\x03abc", (0x04, b"abc", 6)),
+    (b"\x04\x82\x00\x02hi", (0x04, b"hi", 6)),
+    (b"\x30\x00", (0x30, b"", 2)),
+])
+def test_read_element(data, expected):
+    assert read_element(data, 0) == expected
+
+
+@pytest.mark.parametrize("data", [b"\x02", b"\x02\x05\x00", b"\x04\x80", b"\x04\x85\x00\x00\x00\x00\x01", b"\x04\x81"])
+def test_read_element_rejects(data):
+    with pytest.raises(DerError):
+        read_element(data, 0)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (bytes.fromhex("550403"), "2.5.4.3"),
+    (bytes.fromhex("2a864886f70d010101"), "1.2.840.113549.1.1.1"),
+    (bytes.fromhex("2b6570"), "1.3.101.112"),
+    (bytes.fromhex("8837"), "2.999"),
+])
+def test_decode_oid(value, expected):
+    assert decode_oid(value) == expected